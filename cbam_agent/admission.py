@@ -0,0 +1,341 @@
+"""
+Admission control in front of the agent graph (POST /webhook, /webhook/stream, /webhook/batch, /jobs).
+
+    rate limits   token buckets per sessionId and per client IP: ADMISSION_SESSION_RATE /
+                  ADMISSION_SESSION_BURST and ADMISSION_IP_RATE / ADMISSION_IP_BURST (requests per
+                  second / bucket size; a rate of 0 turns that limit off). An empty bucket answers
+                  429 with Retry-After = the time to the next token. The shared "default" session
+                  and ADMISSION_EXEMPT_IPS are not limited (loopback by default, nothing when
+                  FORWARDED_ALLOW_IPS says we are behind a proxy: every caller arrives through it)
+    concurrency   at most ADMISSION_MAX_CONCURRENT graph runs per process (0 = no cap); up to
+                  ADMISSION_MAX_QUEUE more wait in FIFO order. A request is shed with 503 and
+                  Retry-After at once when the queue is full or its expected wait (queue position x
+                  average run time / slots) exceeds ADMISSION_MAX_WAIT seconds, or after waiting that
+                  long without a slot. Shedding early keeps the latency of admitted requests flat
+                  under overload instead of slowing every request down together.
+
+Background work (batch items, queued jobs) is never shed. It has its own FIFO queue, outside
+ADMISSION_MAX_QUEUE, and holds at most ADMISSION_BACKGROUND_SHARE of the slots (default 0.5, at
+least one). A freed slot goes to an interactive waiter first, so a 1000-item batch in flight does
+not get /webhook callers shed. Each graph run of a batch also takes a token from the caller's IP
+bucket, waiting for it instead of answering 429, so a batch is paced at the IP rate.
+
+The buckets are plain in-memory counters. With ADMISSION_STATE_PATH (set by serve.py) they are also
+persisted to SQLite: written behind every ADMISSION_FLUSH_INTERVAL seconds and read on a bucket's
+first use, so a drained bucket survives restarts and is (loosely) shared by serve.py workers.
+Behind a proxy, client IPs come from X-Forwarded-For only when uvicorn trusts it (FORWARDED_ALLOW_IPS:
+the proxy's addresses or CIDR, never "*"). uvicorn then takes the right-most address that is not a
+trusted proxy, so entries a client prepends itself do not change its bucket.
+"""
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from tracing import admission_events
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of running a request; the server turns it into a 429/503 with Retry-After."""
+
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(f"{reason}: retry after {retry_after:.1f}s")
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)}
+
+
+class BucketStore:
+    """SQLite copy of the token buckets, shared by every process that points at the same file."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS admission_buckets ("
+            "scope TEXT, key TEXT, tokens REAL, updated_at REAL, PRIMARY KEY (scope, key))"
+        )
+        self._lock = threading.Lock()
+
+    def load(self, scope: str, key: str) -> Optional[Tuple[float, float]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT tokens, updated_at FROM admission_buckets WHERE scope = ? AND key = ?", (scope, key)
+            ).fetchone()
+
+    def save(self, rows: Iterable[Tuple[str, str, float, float]]):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO admission_buckets VALUES (?, ?, ?, ?)", list(rows))
+
+    def prune(self, older_than: float):
+        with self._lock:
+            self._conn.execute("DELETE FROM admission_buckets WHERE updated_at < ?", (older_than,))
+
+
+class TokenBuckets:
+    """One bucket per key: `rate` tokens per second up to `burst`; LRU-bounded to `max_keys` keys."""
+
+    def __init__(self, scope: str, rate: float, burst: float, store: Optional[BucketStore] = None, max_keys: int = 100_000):
+        self.scope = scope
+        self.rate = rate
+        self.burst = burst
+        self.store = store
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._dirty: set = set()
+
+    def _current(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None and self.store is not None:
+            bucket = self.store.load(self.scope, key)
+        if bucket is None:
+            return self.burst
+        tokens, updated_at = bucket
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def _set(self, key: str, tokens: float, now: float):
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        self._dirty.add(key)
+        while len(self._buckets) > self.max_keys:
+            old, _ = self._buckets.popitem(last=False)
+            self._dirty.discard(old)
+
+    def take(self, key: str) -> float:
+        """0 when a token was taken, else the seconds until one is available."""
+        now = time.time()
+        tokens = self._current(key, now)
+        if tokens < 1:
+            self._set(key, tokens, now)
+            return (1 - tokens) / self.rate
+        self._set(key, tokens - 1, now)
+        return 0.0
+
+    def refund(self, key: str):
+        now = time.time()
+        self._set(key, min(self.burst, self._current(key, now) + 1), now)
+
+    def dirty_rows(self) -> List[Tuple[str, str, float, float]]:
+        rows = [(self.scope, key, *self._buckets[key]) for key in self._dirty if key in self._buckets]
+        self._dirty.clear()
+        return rows
+
+
+class Ticket:
+    """A graph-run slot; `release()` once the run is over (idempotent)."""
+
+    def __init__(self, controller: Optional["AdmissionController"], waited: float = 0.0, background: bool = False):
+        self.controller = controller
+        self.waited = waited
+        self.background = background
+        self.started = time.perf_counter()
+        self.released = controller is None
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(time.perf_counter() - self.started, self.background)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int = 0,
+        max_queue: int = 64,
+        max_wait: float = 10.0,
+        session_buckets: Optional[TokenBuckets] = None,
+        ip_buckets: Optional[TokenBuckets] = None,
+        exempt_ips: Iterable[str] = (),
+        store: Optional[BucketStore] = None,
+        flush_interval: float = 5.0,
+        background_share: float = 0.5,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.background_slots = max(1, int(max_concurrent * background_share))
+        self.max_wait = max_wait
+        self.session_buckets = session_buckets
+        self.ip_buckets = ip_buckets
+        self.exempt_ips = set(exempt_ips)
+        self.store = store
+        self.flush_interval = flush_interval
+        self.running = 0
+        self.background_running = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._background: Deque[asyncio.Future] = deque()
+        self._avg_run: Optional[float] = None
+        self._last_flush = time.monotonic()
+        self.counts: Dict[str, int] = {}
+        self.wait_seconds = 0.0
+
+    def _count(self, outcome: str):
+        self.counts[outcome] = self.counts.get(outcome, 0) + 1
+        admission_events.inc(outcome=outcome)
+
+    def _reject(self, status: int, reason: str, retry_after: float) -> AdmissionRejected:
+        self._count(reason)
+        return AdmissionRejected(status, reason, retry_after)
+
+    # --- Rate limits ---
+    def check_rate(self, session_id: Optional[str], ip: Optional[str]):
+        """Takes a token from the session's and the IP's bucket, or raises a 429 (taking none)."""
+        taken = []
+        for buckets, key in ((self.session_buckets, session_id if session_id != "default" else None),
+                             (self.ip_buckets, ip if ip not in self.exempt_ips else None)):
+            if buckets is None or not key:
+                continue
+            wait = buckets.take(key)
+            if wait:
+                for earlier, earlier_key in taken:
+                    earlier.refund(earlier_key)
+                self._flush()
+                raise self._reject(429, f"{buckets.scope}_rate_limited", wait)
+            taken.append((buckets, key))
+        self._flush()
+
+    async def pace(self, ip: Optional[str]):
+        """A token from the IP's bucket for one background graph run, waiting for it instead of a 429."""
+        if self.ip_buckets is None or not ip or ip in self.exempt_ips:
+            return
+        while True:
+            wait = self.ip_buckets.take(ip)
+            self._flush()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def _flush(self, force: bool = False):
+        if self.store is None or (not force and time.monotonic() - self._last_flush < self.flush_interval):
+            return
+        self._last_flush = time.monotonic()
+        rows = []
+        for buckets in (self.session_buckets, self.ip_buckets):
+            if buckets is not None:
+                rows.extend(buckets.dirty_rows())
+        if rows:
+            self.store.save(rows)
+
+    # --- Concurrency ---
+    def expected_wait(self, position: int) -> float:
+        """Seconds until the `position`-th waiter gets a slot, from the average run time."""
+        if not self._avg_run or not self.max_concurrent:
+            return 0.0
+        return position * self._avg_run / self.max_concurrent
+
+    async def acquire(self, shed: bool = True) -> Ticket:
+        """
+        A slot for one graph run; with `shed`, raises a 503 instead of queueing past the limits.
+        Without it (background work) the run waits in its own queue, within `background_slots`.
+        """
+        if not self.max_concurrent:
+            return Ticket(None)
+        background = not shed
+        if self.running < self.max_concurrent and not self._waiters and (
+                not background or (not self._background and self.background_running < self.background_slots)):
+            self.running += 1
+            if background:
+                self.background_running += 1
+            self._count("admitted")
+            return Ticket(self, background=background)
+
+        # Only interactive waiters count here: background work never takes their place in line
+        position = len(self._waiters) + 1
+        if shed:
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject(503, "queue_full", self.expected_wait(position) or 1)
+            if self.expected_wait(position) > self.max_wait:
+                raise self._reject(503, "overloaded", self.expected_wait(position))
+
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        queue = self._background if background else self._waiters
+        queue.append(future)
+        try:
+            await asyncio.wait_for(future, self.max_wait if shed else None)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self._release(None, background)
+            elif future in queue:
+                queue.remove(future)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(503, "queue_timeout", self.expected_wait(len(self._waiters) + 1) or 1)
+            raise
+        waited = time.perf_counter() - start
+        self.wait_seconds += waited
+        self._count("admitted_after_wait")
+        return Ticket(self, waited, background)
+
+    def _release(self, run_seconds: Optional[float], background: bool = False):
+        if run_seconds is not None:
+            self._avg_run = run_seconds if self._avg_run is None else 0.8 * self._avg_run + 0.2 * run_seconds
+        if background:
+            self.background_running -= 1
+        # Hand the slot straight to the next waiter (`running` stays the same): interactive first,
+        # then background work while it is within its share
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(True)
+                return
+        while self._background and self.background_running < self.background_slots:
+            future = self._background.popleft()
+            if not future.done():
+                self.background_running += 1
+                future.set_result(True)
+                return
+        self.running -= 1
+
+    def snapshot(self) -> Dict:
+        admitted = self.counts.get("admitted", 0) + self.counts.get("admitted_after_wait", 0)
+        return {
+            "running": self.running,
+            "queued": len(self._waiters),
+            "background_running": self.background_running,
+            "background_queued": len(self._background),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "avg_run_ms": round(self._avg_run * 1000, 1) if self._avg_run else None,
+            "avg_queue_wait_ms": round(self.wait_seconds / self.counts["admitted_after_wait"] * 1000, 1)
+            if self.counts.get("admitted_after_wait") else 0.0,
+            "admitted": admitted,
+            "outcomes": dict(sorted(self.counts.items())),
+        }
+
+    def close(self):
+        self._flush(force=True)
+        if self.store is not None:
+            # Buckets idle for a day are full again anyway
+            self.store.prune(time.time() - 86400)
+
+
+def admission_from_env() -> AdmissionController:
+    path = os.getenv("ADMISSION_STATE_PATH")
+    store = BucketStore(path) if path else None
+
+    def buckets(scope: str, rate: str, burst: str) -> Optional[TokenBuckets]:
+        rate = float(os.getenv(f"ADMISSION_{scope.upper()}_RATE", rate))
+        burst = float(os.getenv(f"ADMISSION_{scope.upper()}_BURST", burst))
+        return TokenBuckets(scope, rate, burst, store) if rate > 0 else None
+
+    # Behind a proxy, loopback is only ever a forged X-Forwarded-For entry
+    exempt = "" if os.getenv("FORWARDED_ALLOW_IPS") else "127.0.0.1,::1"
+    return AdmissionController(
+        max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "16")),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+        max_wait=float(os.getenv("ADMISSION_MAX_WAIT", "10")),
+        session_buckets=buckets("session", "0.5", "10"),
+        ip_buckets=buckets("ip", "2", "60"),
+        exempt_ips=[ip.strip() for ip in os.getenv("ADMISSION_EXEMPT_IPS", exempt).split(",") if ip.strip()],
+        store=store,
+        flush_interval=float(os.getenv("ADMISSION_FLUSH_INTERVAL", "5")),
+        background_share=float(os.getenv("ADMISSION_BACKGROUND_SHARE", "0.5")),
+    )
@@ -1,15 +1,26 @@
 import os
-import requests
-import json
-from typing import Annotated, TypedDict, List
+import hashlib
+import asyncio
+import threading
+import time
+from typing import Annotated, TypedDict, List, Optional
 from dotenv import load_dotenv
 
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 from langchain_core.tools import tool
-from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.checkpoint.memory import MemorySaver
+
+from cassettes import CassettePineconeClient, cassette
+from cn_codes import lookup_cn_codes
+from context_budget import ContextBudget, context_metrics, llm_summarize
+from emissions import calculate_cbam_emissions
+from local_index import LocalIndex, format_passages
+from multi_query import fuse, plan_queries
+from pinecone_client import PineconeClient
+from query_router import (CANNED, CANNED_REPLIES, DEFINITION_PROMPT, DEFINITIONAL, FULL, QUERY_ROUTING,
+                          classify_query, route_metrics)
+from retrieval_cache import cache_from_env
+from tool_output import compact_response
+from tracing import context_tokens, llm_tokens, set_attribute, span
 
 import datetime
 
@@ -20,6 +31,25 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_URL = "https://prod-1-data.ke.pinecone.io/assistant/chat/cbam"
 
+# Shared, pooled client (started/closed by the server lifespan); recorded or replayed with CASSETTE_MODE
+pinecone_client = PineconeClient(PINECONE_URL, PINECONE_API_KEY)
+if cassette is not None:
+    pinecone_client = CassettePineconeClient(cassette, None if cassette.replaying else pinecone_client)
+
+# Cache of Pinecone answers (None when RETRIEVAL_CACHE_BACKEND=off)
+retrieval_cache = cache_from_env()
+
+# "pinecone" (default) or "local" for the offline index built with ingest.py
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "pinecone").lower()
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "cbam_index")
+_local_index = None
+
+def get_local_index() -> LocalIndex:
+    global _local_index
+    if _local_index is None:
+        _local_index = LocalIndex(LOCAL_INDEX_PATH)
+    return _local_index
+
 SYSTEM_PROMPT = """# CBAM Compliance Engine (System v2.0)
 You are the world's leading expert on the EU Carbon Border Adjustment Mechanism (CBAM).
 Your goal is to provide 100% accurate, legally cited, and actionable advice. You are the "Moat" - a defensible, high-value intelligence asset.
@@ -33,7 +63,8 @@ Your goal is to provide 100% accurate, legally cited, and actionable advice. You
 - **Uncertainty**: If the answer is ambiguous in the regulations, state the ambiguity clearly. **DO NOT GUESS.**
 
 ### 2. CALCULATION SAFETY
-- When asked to calculate (e.g., emissions, penalties, price adjustments):
+- For embedded emissions, CBAM certificates and certificate costs, call 'calculate_cbam_emissions' (one call with all product lines) and cite its table instead of doing the arithmetic yourself.
+- When asked to calculate anything else (e.g., penalties, price adjustments):
   1. **State the Formula**: Explicitly write out the formula being used.
   2. **Define Variables**: Clearly list the variables and their units (e.g., "tons of CO2e", "EUR/ton").
   3. **Show Steps**: Display the step-by-step math.
@@ -74,19 +105,35 @@ These facts are CURRENT (as of December 2025) and take PRIORITY over any retriev
 
 ### 5. TOOL USAGE
 You have access to 'retrieve_cbam_info' which queries a Pinecone knowledge base.
-- Use it for: Emissions calculations, HS codes, specific regulations, compliance procedures
-- DO NOT use it for: Reporting deadlines, timelines (use Critical Facts above instead)"""
+- Use it for: Emission data, specific regulations, compliance procedures
+- DO NOT use it for: Reporting deadlines, timelines (use Critical Facts above instead)
+- For comparisons and multi-part questions, call 'retrieve_cbam_multi' once with 2-4 focused sub_queries instead of several lookups in a row.
+- When you need several independent lookups, request them all in the same turn; they run in parallel.
+For CN/HS codes (is a code covered, which category and gases), call 'lookup_cn_codes' with all codes at once; it answers instantly from Annex I. Default values come from 'retrieve_cbam_info'.
+You also have 'calculate_cbam_emissions' for SEE, certificate and cost calculations (see Calculation Safety)."""
+
+# Changes whenever the prompt text changes; part of the answer-cache key
+SYSTEM_PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode()).hexdigest()[:12]
+
+def current_date_label() -> str:
+    """The date string injected into every chatbot call (one value per day)."""
+    return datetime.datetime.now().strftime("%B %d, %Y")  # More human readable
 
 # --- Tools ---
 @tool
-def retrieve_cbam_info(query: str) -> str:
+async def retrieve_cbam_info(query: str) -> str:
     """
     Queries the Pinecone Assistant for information related to CBAM (Carbon Border Adjustment Mechanism).
     
     DO NOT USE THIS TOOL FOR: Reporting deadlines, timelines, "next deadline" questions
-    Use this tool for: Emissions calculations, HS code lookups, specific regulations, compliance procedures
+    Use this tool for: Emission data, specific regulations, compliance procedures
+    For CN/HS code scope use lookup_cn_codes instead (local, instant)
     """
     
+    with span("retrieve_cbam_info", backend=RETRIEVAL_BACKEND):
+        return await _retrieve(query)
+
+async def _retrieve(query: str) -> str:
     # Detect deadline/timeline queries and refuse them
     deadline_keywords = ['deadline', 'timeline', 'next', 'when', 'schedule', 'quarter', 'q1', 'q2', 'q3', 'q4']
     if any(keyword in query.lower() for keyword in deadline_keywords):
@@ -94,16 +141,22 @@ def retrieve_cbam_info(query: str) -> str:
         
 Use the Critical Facts (2025-2026) provided in your system prompt instead.
 Current date has been provided to you - use it to determine which deadlines have PASSED and which are UPCOMING."""
+
+    if RETRIEVAL_BACKEND == "local":
+        try:
+            passages = await asyncio.to_thread(get_local_index().search, query)
+            return format_passages(passages)
+        except Exception as e:
+            return f"Error querying local index: {str(e)}"
     
-    if not PINECONE_API_KEY:
+    if not PINECONE_API_KEY and not (cassette is not None and cassette.replaying):
         return "Error: PINECONE_API_KEY not configured."
 
-    headers = {
-        "Api-Key": PINECONE_API_KEY,
-        "X-Pinecone-API-Version": "2025-01",
-        "Content-Type": "application/json"
-    }
-    
+    if retrieval_cache is not None:
+        cached = await retrieval_cache.alookup(query)
+        if cached is not None:
+            return cached
+
     payload = {
         "messages": [
             {
@@ -117,60 +170,161 @@ Current date has been provided to you - use it to determine which deadlines have
     }
 
     try:
-        response = requests.post(PINECONE_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract the assistant's reply from the Pinecone response
-        # The structure depends on Pinecone's API, assuming standard chat completion-like or specific structure
-        # Based on n8n node, it seems to return a JSON that n8n parses. 
-        # Let's try to extract the content from the first choice/message.
-        # If the structure is unknown, we return the whole JSON text for the LLM to parse, 
-        # but ideally we extract the 'content'.
+        with span("pinecone"):
+            data = await pinecone_client.chat(payload)
         
-        # Common structure check (adjust if Pinecone Assistant differs)
-        if "choices" in data and len(data["choices"]) > 0:
-             return data["choices"][0]["message"]["content"]
-        elif "message" in data:
-            return data["message"]["content"]
-        else:
-            return json.dumps(data) # Fallback: return raw JSON
+        # Answer, citations and highlight snippets only, capped at TOOL_OUTPUT_MAX_TOKENS;
+        # the full payload stays in the side store (see tool_output.py)
+        answer = await compact_response(data)
+        set_attribute("output_chars", len(answer))
+
+        if retrieval_cache is not None:
+            await retrieval_cache.astore(query, answer)
+        return answer
 
     except Exception as e:
         return f"Error querying Pinecone: {str(e)}"
 
-from langgraph.graph.message import add_messages
-
-# --- State ---
-class AgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], add_messages]
+@tool
+async def retrieve_cbam_multi(question: str, sub_queries: Optional[List[str]] = None) -> str:
+    """
+    Looks up several aspects of a complex CBAM question at once (comparisons, multi-part questions).
+    Pass 2-4 focused `sub_queries` (e.g. one per phase or product being compared); without them the question is split automatically.
+    Returns the passages of all sub-queries, deduplicated and ranked, in one result.
+    """
+    queries = plan_queries(question, sub_queries)
+    with span("retrieve_cbam_multi", backend=RETRIEVAL_BACKEND, sub_queries=len(queries)):
+        results = await asyncio.gather(*(_retrieve(q) for q in queries))
+        return fuse(queries, results)
 
 # --- Graph Construction ---
-def create_agent_graph():
-    # Initialize Model
-    llm = ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0)
+def create_agent_graph(llm=None, tools=None, checkpointer=None, budget=None, routing=None):
+    """
+    Builds and compiles the agent graph.
+    With `routing` (default QUERY_ROUTING) each turn starts at the `route` node, which sends
+    greetings to `canned`, definitional questions to `define` and the rest to `chatbot` (see query_router.py).
+    `llm` and `tools` default to the routed Gemini models and the Pinecone (single and multi-query), calculator and CN-code tools;
+    benchmarks pass fakes instead. Tool calls of one model turn run concurrently (ToolNode gathers them).
+    `checkpointer` defaults to the backend configured by CHECKPOINT_* (see checkpointer.py).
+    `budget` defaults to the context budget configured by CONTEXT_* (see context_budget.py).
+    """
+    # LangGraph and the Gemini client are the slow imports (~2.5s); they load on first build, not at import
+    from langgraph.graph import StateGraph, END
+    from langgraph.graph.message import add_messages
+    from langgraph.prebuilt import ToolNode, tools_condition
+
+    from checkpointer import TracedCheckpointer, checkpointer_from_env
+    from prompt_cache import PromptPrefix, bind_with_prefix, strip_stored_prompt
+
+    # --- State ---
+    class AgentState(TypedDict):
+        messages: Annotated[List[BaseMessage], add_messages]
+        # Rolling summary of turns that left the context window (see context_budget.py)
+        summary: str
+        summary_upto: int
+        # Query-router path of the current turn and when the turn started (time.time())
+        route: str
+        turn_started: float
+
+    # Initialize Model: Gemini model(s) behind the hedging/fallback router (LLM_* variables, see llm_router.py)
+    if llm is None:
+        from llm_router import router_from_env
+        llm = router_from_env()
     
     # Bind tools
-    tools = [retrieve_cbam_info]
-    llm_with_tools = llm.bind_tools(tools)
+    if tools is None:
+        tools = [retrieve_cbam_info, retrieve_cbam_multi, calculate_cbam_emissions, lookup_cn_codes]
+    # Static prompt + tool schema, sent first on every call so the provider can cache it (see prompt_cache.py)
+    prefix = PromptPrefix(SYSTEM_PROMPT, tools)
+    llm_with_tools = bind_with_prefix(llm, tools, prefix)
+
+    if budget is None:
+        budget = ContextBudget.from_env()
+    if routing is None:
+        routing = QUERY_ROUTING
+
+    async def summarize(previous, turns):
+        return await llm_summarize(llm, previous, turns)
 
     # Define Nodes
-    def chatbot(state: AgentState):
+    def latest_question(state: AgentState) -> str:
+        question = next((m for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), None)
+        return str(question.content) if question is not None else ""
+
+    def finish_turn(state: AgentState, path: str):
+        if routing and state.get("turn_started"):
+            route_metrics.record(path, time.time() - state["turn_started"])
+
+    async def route(state: AgentState):
+        choice = classify_query(latest_question(state))
+        set_attribute("route", choice.path)
+        return {"route": choice.path, "turn_started": time.time()}
+
+    async def canned(state: AgentState):
+        choice = classify_query(latest_question(state))
+        finish_turn(state, choice.path)
+        return {"messages": [AIMessage(content=CANNED_REPLIES[choice.intent])]}
+
+    async def define(state: AgentState):
+        # Short prompt, no tool schema and no history: a definition does not depend on the thread
+        try:
+            with span("llm", route=DEFINITIONAL) as llm_span:
+                response = await llm.ainvoke([SystemMessage(content=DEFINITION_PROMPT), HumanMessage(content=latest_question(state))])
+                usage = getattr(response, "usage_metadata", None) or {}
+                llm_span.attributes.update(input_tokens=usage.get("input_tokens"), output_tokens=usage.get("output_tokens"))
+                llm_tokens.inc(usage.get("input_tokens", 0), direction="input")
+                llm_tokens.inc(usage.get("output_tokens", 0), direction="output")
+        except Exception as e:
+            # The full turn gets its own attempt (and raises if that fails too)
+            print(f"LLM Invocation Error (definitional, escalating): {e}")
+            set_attribute("route", "escalated")
+            return {"route": FULL}
+        finish_turn(state, DEFINITIONAL)
+        return {"messages": [response]}
+
+    async def chatbot(state: AgentState):
+        with span("chatbot", messages=len(state["messages"])):
+            return await _chatbot(state)
+
+    async def _chatbot(state: AgentState):
         print("--- Chatbot Node ---")
         print(f"Messages count: {len(state['messages'])}")
         
-        # Inject current date context
-        current_date = datetime.datetime.now().strftime("%B %d, %Y")  # More human readable
+        # Inject current date context, after the cached prefix so the prefix stays byte-identical
+        current_date = current_date_label()
         date_context = SystemMessage(content=f"""CURRENT DATE: {current_date}
 
 For any deadline or timeline question, use this date to determine which deadlines have passed and which are upcoming.""")
         
-        # Prepend to messages for this invocation only (not saving to state history to avoid duplication)
-        messages_with_context = [date_context] + state["messages"]
+        # Trim history to the context budget (window, compacted tool results, rolling summary);
+        # the prefix and date are added for this invocation only, not saved to the thread
+        messages_with_context, summary_update = await budget.apply(
+            prefix.build(date_context, strip_stored_prompt(state["messages"])),
+            state.get("summary", ""), state.get("summary_upto", 0), summarize
+        )
+        print(f"Context tokens: {context_metrics.last['tokens_before']} -> {context_metrics.last['tokens_after']}")
+        context_tokens.inc(context_metrics.last["tokens_before"], phase="before")
+        context_tokens.inc(context_metrics.last["tokens_after"], phase="after")
+        set_attribute("context_tokens", context_metrics.last["tokens_after"])
         
         try:
-            response = llm_with_tools.invoke(messages_with_context)
-            return {"messages": [response]}
+            with span("llm", prefix_version=prefix.version, prefix_tokens=prefix.tokens) as llm_span:
+                response = await llm_with_tools.ainvoke(messages_with_context)
+                usage = getattr(response, "usage_metadata", None) or {}
+                # Input tokens the provider served from its prefix cache
+                cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+                llm_span.attributes.update(
+                    input_tokens=usage.get("input_tokens"),
+                    cached_tokens=cached,
+                    output_tokens=usage.get("output_tokens"),
+                    tool_calls=len(getattr(response, "tool_calls", None) or []),
+                )
+                llm_tokens.inc(usage.get("input_tokens", 0), direction="input")
+                llm_tokens.inc(cached, direction="input_cached")
+                llm_tokens.inc(usage.get("output_tokens", 0), direction="output")
+            if not getattr(response, "tool_calls", None):
+                finish_turn(state, FULL)
+            return {"messages": [response], **(summary_update or {})}
         except Exception as e:
             print(f"LLM Invocation Error: {e}")
             raise e
@@ -181,7 +335,17 @@ For any deadline or timeline question, use this date to determine which deadline
     graph_builder.add_node("chatbot", chatbot)
     graph_builder.add_node("tools", ToolNode(tools))
     
-    graph_builder.set_entry_point("chatbot")
+    if routing:
+        graph_builder.add_node("route", route)
+        graph_builder.add_node("canned", canned)
+        graph_builder.add_node("define", define)
+        graph_builder.set_entry_point("route")
+        graph_builder.add_conditional_edges("route", lambda state: state["route"],
+                                            {CANNED: "canned", DEFINITIONAL: "define", FULL: "chatbot"})
+        graph_builder.add_edge("canned", END)
+        graph_builder.add_conditional_edges("define", lambda state: "chatbot" if state["route"] == FULL else END, ["chatbot", END])
+    else:
+        graph_builder.set_entry_point("chatbot")
     
     graph_builder.add_conditional_edges(
         "chatbot",
@@ -189,10 +353,30 @@ For any deadline or timeline question, use this date to determine which deadline
     )
     graph_builder.add_edge("tools", "chatbot")
 
-    # Add memory for persistence (optional, useful for threaded webhooks)
-    memory = MemorySaver()
+    # Add memory for persistence (bounded/SQLite backend chosen by CHECKPOINT_BACKEND)
+    if checkpointer is None:
+        checkpointer = checkpointer_from_env()
     
-    return graph_builder.compile(checkpointer=memory)
+    # Checkpoint reads/writes are timed as spans of the current request (see tracing.py)
+    return graph_builder.compile(checkpointer=TracedCheckpointer(checkpointer))
+
+# Global instance, built on first use (or by the server's background warm-up)
+_agent_app = None
+_agent_app_lock = threading.Lock()
+
+def get_agent_app():
+    global _agent_app
+    if _agent_app is None:
+        with _agent_app_lock:
+            if _agent_app is None:
+                _agent_app = create_agent_graph()
+    return _agent_app
+
+def agent_app_ready() -> bool:
+    return _agent_app is not None
 
-# Global instance
-agent_app = create_agent_graph()
+def __getattr__(name):
+    # `from agent import agent_app` keeps working; it just builds the graph at that point
+    if name == "agent_app":
+        return get_agent_app()
+    raise AttributeError(name)
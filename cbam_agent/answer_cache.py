@@ -0,0 +1,67 @@
+"""
+Whole-answer cache for first-turn (no history) /webhook questions, plus single-flight
+coalescing so concurrent identical questions share one graph run.
+
+The key covers the normalised input, the System Prompt version and the date bucket that
+`chatbot` injects, so deadline answers roll over at midnight and prompt edits invalidate everything.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from agent import SYSTEM_PROMPT_VERSION, current_date_label
+from retrieval_cache import cache_from_env, normalise_query
+
+# Same cache class as the Pinecone layer, configured with ANSWER_CACHE_* (None when off).
+# Exact keys only: keys differing just in the date label are near-duplicates, and a semantic
+# match would serve yesterday's deadline answer
+answer_cache = cache_from_env("ANSWER_CACHE", semantic=False)
+
+
+def answer_cache_key(user_input: str) -> str:
+    return f"{SYSTEM_PROMPT_VERSION}|{current_date_label()}|{normalise_query(user_input)}"
+
+
+class SingleFlight:
+    """
+    Runs at most one `fn()` per key at a time; callers arriving while it is in flight await the same result.
+    Errors propagate to every waiter. If the leader is cancelled (a superseded run, a client gone),
+    its waiters are not: the next one runs `fn()` itself and the rest wait for it.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # Only the leader was cancelled: take over
+            return await self.do(key, fn)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+
+single_flight = SingleFlight()
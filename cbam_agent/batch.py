@@ -0,0 +1,160 @@
+"""
+Bulk question runner behind POST /webhook/batch.
+
+Accepts a JSON list (or {"items": [...]}) of WebhookInput-style objects, a CSV file with an
+`input` column (optional `sessionId`, `id`), or JSONL with one object per line. Items run through
+the agent with bounded concurrency and a per-item timeout; results are yielded as they finish.
+
+Identical questions without a sessionId are answered once and the result is shared.
+Items that name a sessionId run in submission order within that session, so follow-ups see history.
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from retrieval_cache import normalise_query
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT", "120"))
+
+
+class BatchError(ValueError):
+    """The batch body could not be parsed or is too large."""
+
+
+@dataclass
+class BatchItem:
+    index: int
+    input: str
+    sessionId: Optional[str] = None
+    id: Optional[str] = None
+
+
+def _item(index: int, raw: Any) -> BatchItem:
+    if isinstance(raw, str):
+        raw = {"input": raw}
+    if not isinstance(raw, dict) or not str(raw.get("input") or "").strip():
+        raise BatchError(f"item {index}: expected an object with a non-empty 'input'")
+    session = raw.get("sessionId")
+    item_id = raw.get("id")
+    return BatchItem(index, str(raw["input"]), str(session) if session else None, str(item_id) if item_id is not None else None)
+
+
+def parse_batch(body: bytes, content_type: str = "application/json") -> List[BatchItem]:
+    """Parses a JSON, JSONL or CSV batch body into items (in submission order)."""
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise BatchError(f"batch body is not UTF-8: {e}")
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    try:
+        if content_type in ("text/csv", "application/csv"):
+            rows = list(csv.DictReader(io.StringIO(text)))
+            if rows and "input" not in rows[0]:
+                raise BatchError("CSV needs an 'input' column")
+        elif content_type in ("application/x-ndjson", "application/jsonl", "application/x-jsonlines", "application/ndjson"):
+            rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            rows = json.loads(text)
+            if isinstance(rows, dict):
+                rows = rows.get("items")
+            if not isinstance(rows, list):
+                raise BatchError("expected a JSON list of items or {\"items\": [...]}")
+    except (json.JSONDecodeError, csv.Error) as e:
+        raise BatchError(f"could not parse batch: {e}")
+
+    if not rows:
+        raise BatchError("batch is empty")
+    if len(rows) > BATCH_MAX_ITEMS:
+        raise BatchError(f"batch has {len(rows)} items; the limit is {BATCH_MAX_ITEMS}")
+    return [_item(i, row) for i, row in enumerate(rows)]
+
+
+def plan_lanes(items: List[BatchItem]) -> List[List[BatchItem]]:
+    """
+    Groups items into lanes that run concurrently with each other.
+    A session lane holds that session's items in order; a question lane holds duplicates of one question
+    (only its first item is run).
+    """
+    lanes: Dict[tuple, List[BatchItem]] = {}
+    for item in items:
+        key = ("session", item.sessionId) if item.sessionId else ("question", normalise_query(item.input))
+        lanes.setdefault(key, []).append(item)
+    return list(lanes.values())
+
+
+async def run_batch(
+    items: List[BatchItem],
+    answer: Callable[[str, str], Awaitable[str]],
+    concurrency: Optional[int] = None,
+    item_timeout: Optional[float] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs `answer(question, thread_id)` for every item and yields one result dict per item as soon as it
+    is known, followed by a summary dict ({"done": true, ...}).
+    `concurrency` and `item_timeout` default to BATCH_CONCURRENCY and BATCH_ITEM_TIMEOUT.
+    """
+    concurrency = concurrency or BATCH_CONCURRENCY
+    item_timeout = item_timeout or BATCH_ITEM_TIMEOUT
+    batch_id = f"batch-{uuid.uuid4().hex[:8]}"
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results: asyncio.Queue = asyncio.Queue()
+    start = time.perf_counter()
+
+    async def run_one(item: BatchItem, thread_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                output = await asyncio.wait_for(answer(item.input, thread_id), item_timeout)
+                status, detail = "ok", None
+            except asyncio.TimeoutError:
+                output, status, detail = None, "timeout", f"no answer within {item_timeout:g}s"
+            except Exception as e:
+                output, status, detail = None, "error", str(e)
+        result = {"status": status, "output": output, "thread_id": thread_id,
+                  "elapsed_s": round(time.perf_counter() - t0, 3)}
+        if detail:
+            result["error"] = detail
+        return result
+
+    def emit(item: BatchItem, result: Dict[str, Any], duplicate_of: Optional[int] = None):
+        line = {"index": item.index, "id": item.id, "input": item.input, **result}
+        if duplicate_of is not None:
+            line["duplicate_of"] = duplicate_of
+        results.put_nowait(line)
+
+    async def run_lane(lane: List[BatchItem]):
+        if lane[0].sessionId:
+            for item in lane:
+                emit(item, await run_one(item, item.sessionId))
+        else:
+            leader = lane[0]
+            result = await run_one(leader, f"{batch_id}-{leader.index}")
+            emit(leader, result)
+            for duplicate in lane[1:]:
+                emit(duplicate, result, duplicate_of=leader.index)
+
+    lanes = plan_lanes(items)
+    unique_runs = sum(len(lane) if lane[0].sessionId else 1 for lane in lanes)
+    tasks = [asyncio.create_task(run_lane(lane)) for lane in lanes]
+    counts = {"ok": 0, "error": 0, "timeout": 0}
+    try:
+        for _ in range(len(items)):
+            line = await results.get()
+            counts[line["status"]] += 1
+            yield line
+    finally:
+        # Client went away (or we finished): don't leave runs going in the background
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    yield {"done": True, "batch_id": batch_id, "items": len(items), "unique_runs": unique_runs, **counts,
+           "elapsed_s": round(time.perf_counter() - start, 3)}
@@ -0,0 +1,106 @@
+"""
+Overload test for admission control (admission.py): open-loop Poisson arrivals against the in-process
+app, with the provider modelled by FakeChatModel(capacity=...): --capacity LLM calls run at full
+speed and beyond that every call in flight slows down, like a saturated backend.
+
+Runs:
+    nominal   --nominal-rate req/s (below capacity), admission on
+    off       --rate req/s (overload), no concurrency cap: every request is let in
+    on        --rate req/s, at most --max-concurrent graph runs, --max-wait seconds of queueing
+
+Latency counts from the scheduled arrival. Reports, per run, answered / shed (503) / timed-out
+(--timeout) requests, p50/p99 of answered requests, p50/p99 of the rejections and goodput.
+
+Usage: python bench_admission.py [--rate 16] [--nominal-rate 4] [--duration 20] [--capacity 8]
+                                 [--llm-latency 0.5] [--max-concurrent 8] [--max-wait 2]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import statistics
+import time
+import uuid
+
+import httpx
+
+import server
+from admission import AdmissionController
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel, make_fake_retriever
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(rate, admission, args):
+    server.agent_app = create_agent_graph(llm=FakeChatModel(latency=args.llm_latency, capacity=args.capacity),
+                                          tools=[make_fake_retriever(0.1)], checkpointer=BoundedMemorySaver(), routing=False)
+    server.admission = admission
+    answered, rejected, timeouts = [], [], 0
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=args.timeout) as client:
+
+        async def one(scheduled):
+            nonlocal timeouts
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            session = uuid.uuid4().hex
+            try:
+                # A new question each time, so the shared answer cache does not absorb the load
+                response = await client.post("/webhook", json={"input": f"Which records must importer {session} keep?",
+                                                               "sessionId": session})
+            except httpx.TimeoutException:
+                timeouts += 1
+                return
+            elapsed = time.perf_counter() - scheduled
+            (answered if response.status_code == 200 else rejected).append(elapsed)
+
+        start, t, tasks = time.perf_counter(), 0.0, []
+        rng = random.Random(7)
+        while t < args.duration:
+            t += rng.expovariate(rate)
+            tasks.append(asyncio.create_task(one(start + t)))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - start
+    return {
+        "offered": len(tasks), "answered": len(answered), "shed": len(rejected), "timeouts": timeouts,
+        "p50": statistics.median(answered) if answered else float("nan"), "p99": percentile(answered, 0.99),
+        "reject_p50": percentile(rejected, 0.5), "reject_p99": percentile(rejected, 0.99), "goodput": len(answered) / wall,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=16)
+    parser.add_argument("--nominal-rate", type=float, default=4)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--capacity", type=int, default=8, help="LLM calls the fake provider serves at full speed")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--max-concurrent", type=int, default=8)
+    parser.add_argument("--max-wait", type=float, default=2)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    def controller(max_concurrent):
+        return AdmissionController(max_concurrent=max_concurrent, max_queue=64, max_wait=args.max_wait)
+
+    runs = [("nominal", args.nominal_rate, controller(args.max_concurrent)),
+            ("off", args.rate, controller(0)),
+            ("on", args.rate, controller(args.max_concurrent))]
+    print(f"{'run':>8} {'rate':>5} {'offered':>8} {'answered':>9} {'shed':>5} {'timeout':>8} "
+          f"{'p50_s':>6} {'p99_s':>6} {'shed_p50_ms':>12} {'shed_p99_ms':>12} {'goodput':>8}")
+    for name, rate, admission in runs:
+        with contextlib.redirect_stdout(io.StringIO()):
+            r = await run(rate, admission, args)
+        print(f"{name:>8} {rate:>5.0f} {r['offered']:>8} {r['answered']:>9} {r['shed']:>5} {r['timeouts']:>8} "
+              f"{r['p50']:>6.2f} {r['p99']:>6.2f} {r['reject_p50'] * 1000:>12.1f} {r['reject_p99'] * 1000:>12.1f} {r['goodput']:>8.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Throughput benchmark for /webhook/batch with a stubbed LLM and retriever.
+Compares one /webhook call per question (sequential, as clients do today) with a single batch
+request at several concurrency limits. `--duplicates` is the share of repeated questions.
+
+Usage: python bench_batch.py [--items 200] [--duplicates 0.2] [--llm-latency 0.05] [--tool-latency 0.1]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+import batch
+import server
+from agent import create_agent_graph
+from fakes import FakeChatModel, make_fake_retriever
+
+
+def make_questions(n, duplicates):
+    rng = random.Random(7)
+    unique = [f"Is CN code {7200 + i} covered by CBAM?" for i in range(max(1, int(n * (1 - duplicates))))]
+    return unique + [rng.choice(unique) for _ in range(n - len(unique))]
+
+
+async def sequential(client, questions, run):
+    start = time.perf_counter()
+    for i, question in enumerate(questions):
+        response = await client.post("/webhook", json={"input": question, "sessionId": f"seq-{run}-{i}"})
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def batched(client, questions, concurrency):
+    batch.BATCH_CONCURRENCY = concurrency
+    start = time.perf_counter()
+    body = [{"input": q} for q in questions]
+    response = await client.post("/webhook/batch", json=body)
+    response.raise_for_status()
+    summary = json.loads(response.text.splitlines()[-1])
+    assert summary["ok"] == len(questions), summary
+    return time.perf_counter() - start, summary["unique_runs"]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--duplicates", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--tool-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    questions = make_questions(args.items, args.duplicates)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{'mode':>16} {'runs':>6} {'seconds':>9} {'items/s':>9}")
+        for run, concurrency in enumerate((None, 1, 4, 16, 64)):
+            # Fresh graph and no answer cache so every mode pays for its runs
+            server.agent_app = create_agent_graph(
+                llm=FakeChatModel(latency=args.llm_latency), tools=[make_fake_retriever(args.tool_latency)])
+            server.answer_cache = None
+            if concurrency is None:
+                seconds, runs, mode = await sequential(client, questions, run), len(questions), "sequential"
+            else:
+                seconds, runs = await batched(client, questions, concurrency)
+                mode = f"batch c={concurrency}"
+            print(f"{mode:>16} {runs:>6} {seconds:>9.2f} {len(questions) / seconds:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
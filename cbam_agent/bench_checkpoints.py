@@ -0,0 +1,110 @@
+"""
+Checkpoint storage benchmark: bytes per thread and checkpoint write latency over long conversations,
+for LangGraph's plain serializer against DeltaSerializer (checkpoint_serde.py), on both savers.
+
+--threads conversations of --turns turns each run through the real graph: FakeChatModel, and the
+real retrieve_cbam_info against FakePineconeClient (compact output with citations), so every turn
+checkpoints a human message, a tool call, a tool result and an answer. With --stored-prompt each
+thread starts with its own SYSTEM_PROMPT copy, as threads created before the cached prefix did.
+
+Reports bytes per thread (memory: blobs + writes + checkpoints + content store; SQLite: file size
+after a WAL checkpoint) and the mean put/put_writes latency over the first and last 10 turns.
+
+Usage: python bench_checkpoints.py [--threads 5] [--turns 50] [--stored-prompt]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import agent
+from agent import SYSTEM_PROMPT, create_agent_graph
+from checkpoint_serde import DeltaSerializer, MemoryContentStore, SQLiteContentStore
+from checkpointer import BoundedMemorySaver, SQLiteSaver, TracedCheckpointer
+from fakes import FakeChatModel, FakePineconeClient
+
+
+class TimedCheckpointer(TracedCheckpointer):
+    """Records the duration of every checkpoint write, tagged with the current turn."""
+
+    def __init__(self, inner):
+        super().__init__(inner)
+        self.turn = 0
+        self.writes = []
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        start = time.perf_counter()
+        result = await self.inner.aput(config, checkpoint, metadata, new_versions)
+        self.writes.append((self.turn, time.perf_counter() - start))
+        return result
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        start = time.perf_counter()
+        await self.inner.aput_writes(config, writes, task_id, task_path)
+        self.writes.append((self.turn, time.perf_counter() - start))
+
+
+def memory_bytes(saver: BoundedMemorySaver) -> int:
+    total = sum(len(value) for _, value in saver.blobs.values())
+    total += sum(len(w[2][1]) for writes in saver.writes.values() for w in writes.values())
+    total += sum(len(c[1]) + len(m[1]) for ns in saver.storage.values() for checkpoints in ns.values()
+                 for c, m, _ in checkpoints.values())
+    store = getattr(saver.serde, "store", None)
+    return total + (store.size_bytes() if store is not None else 0)
+
+
+def sqlite_bytes(saver: SQLiteSaver) -> int:
+    saver.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(saver.path)
+
+
+async def run(backend, serde_name, args):
+    path = os.path.join(tempfile.mkdtemp(), "checkpoints.db")
+    if backend == "memory":
+        inner = BoundedMemorySaver(serde=DeltaSerializer(MemoryContentStore()) if serde_name == "delta" else None)
+    else:
+        inner = SQLiteSaver(path, serde=DeltaSerializer(SQLiteContentStore(path)) if serde_name == "delta" else None)
+    saver = TimedCheckpointer(inner)
+    agent.pinecone_client = FakePineconeClient(latency=0, citations=3)
+    agent.PINECONE_API_KEY = "fake"
+    agent.RETRIEVAL_BACKEND = "pinecone"
+    agent.retrieval_cache = None
+    graph = create_agent_graph(llm=FakeChatModel(latency=0), tools=[agent.retrieve_cbam_info], checkpointer=saver, routing=False)
+    for turn in range(args.turns):
+        saver.turn = turn
+        for t in range(args.threads):
+            messages = [HumanMessage(content=f"Which records must importer {t} keep for shipment {turn}?")]
+            if args.stored_prompt and turn == 0:
+                messages.insert(0, SystemMessage(content=SYSTEM_PROMPT))
+            await graph.ainvoke({"messages": messages}, {"configurable": {"thread_id": f"thread-{t}"}})
+
+    size = memory_bytes(inner) if backend == "memory" else sqlite_bytes(inner)
+    first = [d for turn, d in saver.writes if turn < 10]
+    last = [d for turn, d in saver.writes if turn >= args.turns - 10]
+    return {"kb_per_thread": size / args.threads / 1000,
+            "first_ms": statistics.mean(first) * 1000, "last_ms": statistics.mean(last) * 1000}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--stored-prompt", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'saver':>7} {'serde':>6} {'kB/thread':>10} {'write_ms first10':>17} {'write_ms last10':>16}")
+    for backend in ("memory", "sqlite"):
+        for serde_name in ("plain", "delta"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                r = await run(backend, serde_name, args)
+            print(f"{backend:>7} {serde_name:>6} {r['kb_per_thread']:>10.1f} {r['first_ms']:>17.3f} {r['last_ms']:>16.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
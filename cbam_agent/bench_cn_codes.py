@@ -0,0 +1,79 @@
+"""
+CN-code scope benchmark: the local Annex I index (cn_codes.py) against a Pinecone lookup.
+
+    index       per-lookup time of cn_index for exact codes, prefixes, ranges and a batch of --batch codes
+    turn        wall time of a "Is CN code X covered?" turn through the graph (FakeChatModel, --llm-latency):
+                  pinecone  retrieve_cbam_info against FakePineconeClient (--pinecone-latency), cache off
+                  local     lookup_cn_codes with every code of the question in one call
+
+Usage: python bench_cn_codes.py [--questions 10] [--batch 50] [--llm-latency 0.8] [--pinecone-latency 1.5]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+import uuid
+
+from langchain_core.messages import HumanMessage
+
+import agent
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from cn_codes import cn_index, lookup_cn_codes
+from fakes import FakeChatModel, FakePineconeClient
+
+QUESTION = "Are 7208 51 20, 7601 10 00 and 2523 29 00 covered by CBAM?"
+
+
+def per_call_us(fn, arg, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(arg)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+async def run_turns(mode, args):
+    agent.pinecone_client = FakePineconeClient(latency=args.pinecone_latency)
+    agent.PINECONE_API_KEY = "fake"
+    agent.RETRIEVAL_BACKEND = "pinecone"
+    agent.retrieval_cache = None
+    llm = FakeChatModel(latency=args.llm_latency, tool_mode="sequential" if mode == "pinecone" else "codes")
+    graph = create_agent_graph(llm=llm, tools=[agent.retrieve_cbam_info, lookup_cn_codes],
+                               checkpointer=BoundedMemorySaver(), routing=False)
+    times = []
+    for _ in range(args.questions):
+        start = time.perf_counter()
+        await graph.ainvoke({"messages": [HumanMessage(content=QUESTION)]}, {"configurable": {"thread_id": uuid.uuid4().hex}})
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--pinecone-latency", type=float, default=1.5)
+    args = parser.parse_args()
+
+    n = 20000
+    batch = [f"72{i % 30:02d} {i % 100:02d} 00" for i in range(args.batch)]
+    print(f"index v{cn_index.version}: {len(cn_index.entries)} Annex I entries")
+    print(f"{'lookup':>12} {'us':>9}")
+    print(f"{'exact':>12} {per_call_us(cn_index.resolve, '7208 51 20', n):>9.2f}")
+    print(f"{'prefix':>12} {per_call_us(cn_index.resolve, '72', n):>9.2f}")
+    print(f"{'range':>12} {per_call_us(cn_index.resolve, '7208-7229', n):>9.2f}")
+    print(f"{f'batch of {args.batch}':>12} {per_call_us(cn_index.resolve_many, batch, n // args.batch):>9.2f}")
+    print(f"{'tool (table)':>12} {per_call_us(lookup_cn_codes.invoke, {'codes': batch[:3]}, 2000):>9.2f}")
+
+    print(f"\n{'turn':>9} {'p50_s':>7}")
+    for mode in ("pinecone", "local"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            p50 = await run_turns(mode, args)
+        print(f"{mode:>9} {p50:>7.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
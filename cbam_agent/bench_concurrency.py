@@ -0,0 +1,54 @@
+"""
+Concurrency benchmark for /webhook with a stubbed LLM and retriever.
+Shows requests per second as the number of concurrent clients grows.
+
+Usage: python bench_concurrency.py [--requests 200] [--llm-latency 0.05] [--tool-latency 0.1]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+import server
+from agent import create_agent_graph
+from fakes import FakeChatModel, make_fake_retriever
+
+
+async def run_level(client, concurrency, total):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            payload = {"input": f"What is CBAM? ({i})", "sessionId": f"bench-{uuid.uuid4()}"}
+            response = await client.post("/webhook", json=payload)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--tool-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    server.agent_app = create_agent_graph(
+        llm=FakeChatModel(latency=args.llm_latency),
+        tools=[make_fake_retriever(args.tool_latency)],
+    )
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{'clients':>8} {'req/s':>10}")
+        for concurrency in (1, 2, 4, 8, 16, 32, 64):
+            rps = await run_level(client, concurrency, args.requests)
+            print(f"{concurrency:>8} {rps:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Local index benchmark: build time and p50/p99 query latency against corpus size.
+Uses a synthetic CBAM-flavoured corpus so it runs anywhere.
+
+Usage: python bench_index.py [--sizes 1000,10000,50000] [--queries 500]
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+from local_index import Chunk, LocalIndex, build_index
+
+VOCABULARY = (
+    "cbam declarant importer installation embedded emissions direct indirect precursor steel iron aluminium "
+    "cement clinker fertiliser ammonia nitric hydrogen electricity certificate surrender price verification "
+    "verifier report quarterly transitional definitive phase regulation implementing annex default value "
+    "carbon price paid third country cn code 7208 7601 2523 3102 2804 2716 authorisation customs penalty"
+).split()
+FILLER = "the of and to in for with on by is are be shall may under this that".split()
+QUERIES = [
+    "embedded emissions of steel", "default values for cement clinker", "CN code 7208 coverage",
+    "authorised CBAM declarant", "carbon price paid in third country", "indirect emissions electricity",
+    "verification of emissions reports", "precursor materials aluminium", "certificate surrender price",
+]
+
+
+def synthetic_corpus(n, words=180, seed=7):
+    rng = random.Random(seed)
+    return [
+        Chunk(" ".join(rng.choice(VOCABULARY) if rng.random() < 0.4 else rng.choice(FILLER) for _ in range(words)),
+              f"doc_{i // 50}.pdf", f"20{rng.randint(23, 25)}-0{rng.randint(1, 9)}-15")
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'chunks':>8} {'build_s':>8} {'p50_ms':>8} {'p99_ms':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        chunks = synthetic_corpus(size)
+        path = tempfile.mkdtemp()
+        start = time.perf_counter()
+        build_index(chunks, path)
+        build = time.perf_counter() - start
+
+        index = LocalIndex(path)
+        timings = []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            index.search(QUERIES[i % len(QUERIES)])
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        p50 = timings[len(timings) // 2] * 1000
+        p99 = timings[int(len(timings) * 0.99)] * 1000
+        print(f"{size:>8} {build:>8.2f} {p50:>8.2f} {p99:>8.2f}", flush=True)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
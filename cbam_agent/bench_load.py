@@ -0,0 +1,245 @@
+"""
+Offline load test for the FastAPI app: built in process, with Gemini replaced by FakeChatModel
+and the Pinecone endpoint by FakePineconeClient, so the real retrieve_cbam_info path
+(caches, tracing, context budget, checkpointer) runs without keys or network.
+
+Scenarios:
+    first_turn   every request is a new session with a new question
+    long_thread  requests continue sessions pre-seeded with --history turns
+    tool_heavy   the model calls retrieve_cbam_info --tool-rounds times per turn
+    mixed        new sessions with a traffic mix of greetings, definitions and tool questions;
+                 also reports the query router's share per path and latency saved (query_router.py)
+
+Load patterns:
+    closed  --users clients, each sending its next request when the previous one returns
+    open    Poisson arrivals at --rate req/s; latency counts from the scheduled start
+            (so queueing is not hidden by a slow server)
+
+Reports p50/p95/p99 latency, RPS and RSS per scenario/pattern. --json writes the results
+(with the git commit) so runs can be compared across commits with --compare.
+
+Usage:
+    python bench_load.py [--scenarios first_turn,long_thread,tool_heavy] [--patterns closed,open]
+                         [--requests 300] [--users 16] [--rate 50] [--json out.json] [--compare base.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import time
+import uuid
+
+import httpx
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent
+import server
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel, FakePineconeClient
+from query_router import route_metrics
+
+SCENARIOS = ("first_turn", "long_thread", "tool_heavy", "mixed")
+# One greeting and two definitions in every ten requests
+MIXED = ["Hello, are you online?", "What is an authorised CBAM declarant?", "What are embedded emissions?"] + [None] * 7
+PATTERNS = ("closed", "open")
+
+
+def rss_mb():
+    """Current resident set size (Linux), falling back to the peak RSS elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def question(i, scenario=None):
+    if scenario == "mixed" and MIXED[i % len(MIXED)]:
+        return MIXED[i % len(MIXED)]
+    # Avoids the deadline router and the tool's deadline-keyword refusal
+    return f"Which records must an importer keep for product line {i}?"
+
+
+async def seed_threads(graph, threads, history):
+    """Writes `history` earlier Q&A turns into each thread without running the model."""
+    for thread_id in threads:
+        messages = []
+        for t in range(history):
+            messages += [HumanMessage(content=question(f"{thread_id}-{t}")),
+                         AIMessage(content=FakeChatModel().answer + " " + "Detail. " * 60)]
+        await graph.aupdate_state({"configurable": {"thread_id": thread_id}}, {"messages": messages}, as_node="chatbot")
+
+
+def setup_app(scenario, args):
+    """Fresh graph, fakes and (optionally) caches for one run, wired in the way the server uses them."""
+    fake_pinecone = FakePineconeClient(latency=args.pinecone_latency)
+    agent.pinecone_client = fake_pinecone
+    agent.PINECONE_API_KEY = "fake"
+    agent.RETRIEVAL_BACKEND = "pinecone"
+    if not args.cache:
+        agent.retrieval_cache = None
+        server.answer_cache = None
+    llm = FakeChatModel(latency=args.llm_latency, token_latency=args.token_latency,
+                        tool_rounds=args.tool_rounds if scenario == "tool_heavy" else 1)
+    server.agent_app = create_agent_graph(llm=llm, tools=[agent.retrieve_cbam_info], checkpointer=BoundedMemorySaver())
+    return fake_pinecone
+
+
+async def run_scenario(client, scenario, pattern, args):
+    fake_pinecone = setup_app(scenario, args)
+    threads = [f"load-{uuid.uuid4().hex[:8]}" for _ in range(args.users)]
+    if scenario == "long_thread":
+        await seed_threads(server.agent_app, threads, args.history)
+
+    route_metrics.turns.clear()
+    route_metrics.seconds.clear()
+    counter = iter(range(args.requests))
+    latencies, errors = [], 0
+    rss_start = rss_peak = rss_mb()
+
+    async def send(i):
+        nonlocal errors
+        session = threads[i % len(threads)] if scenario == "long_thread" else f"load-{uuid.uuid4().hex}"
+        response = await client.post("/webhook", json={"input": question(i, scenario), "sessionId": session})
+        if response.status_code != 200:
+            errors += 1
+
+    async def closed_user():
+        for i in counter:
+            start = time.perf_counter()
+            await send(i)
+            latencies.append(time.perf_counter() - start)
+
+    async def open_arrival(i, scheduled):
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        await send(i)
+        latencies.append(time.perf_counter() - scheduled)
+
+    async def sample_memory():
+        nonlocal rss_peak
+        while True:
+            rss_peak = max(rss_peak, rss_mb())
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_memory())
+    start = time.perf_counter()
+    if pattern == "closed":
+        await asyncio.gather(*(closed_user() for _ in range(args.users)))
+    else:
+        rng = random.Random(42)
+        at, arrivals = start, []
+        for i in range(args.requests):
+            at += rng.expovariate(args.rate)
+            arrivals.append(open_arrival(i, at))
+        await asyncio.gather(*arrivals)
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "pattern": pattern,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        "rss_start_mb": round(rss_start, 1),
+        "rss_peak_mb": round(max(rss_peak, rss_mb()), 1),
+        "pinecone_calls": fake_pinecone.calls,
+        "routes": route_metrics.snapshot(),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["pattern"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'scenario':>12} {'pattern':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9}")
+    for r in results:
+        base = baseline.get((r["scenario"], r["pattern"]))
+        if base is None:
+            continue
+        deltas = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            deltas.append(f"{(r[key] - base[key]) / base[key] * 100:+8.1f}%" if base[key] else f"{'n/a':>9}")
+        print(f"{r['scenario']:>12} {r['pattern']:>7} " + " ".join(deltas))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--patterns", default=",".join(PATTERNS))
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--users", type=int, default=16, help="closed-loop clients / long_thread sessions")
+    parser.add_argument("--rate", type=float, default=50, help="open-loop arrival rate (req/s)")
+    parser.add_argument("--history", type=int, default=20, help="long_thread: turns already in each session")
+    parser.add_argument("--tool-rounds", type=int, default=3, help="tool_heavy: tool calls per turn")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--pinecone-latency", type=float, default=0.1)
+    parser.add_argument("--cache", action="store_true", help="keep the retrieval/answer caches on")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    args = parser.parse_args()
+
+    results = []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{'scenario':>12} {'pattern':>7} {'req':>5} {'err':>4} {'rps':>8} {'p50_ms':>8} {'p95_ms':>8} "
+              f"{'p99_ms':>8} {'rss_mb':>8}")
+        for scenario in args.scenarios.split(","):
+            for pattern in args.patterns.split(","):
+                # The agent prints per node and per request; keep the report readable
+                with contextlib.redirect_stdout(io.StringIO()):
+                    r = await run_scenario(client, scenario, pattern, args)
+                results.append(r)
+                print(f"{r['scenario']:>12} {r['pattern']:>7} {r['requests']:>5} {r['errors']:>4} {r['rps']:>8.1f} "
+                      f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['rss_peak_mb']:>8.1f}", flush=True)
+                if scenario == "mixed":
+                    paths = ", ".join(f"{path} {p['share']:.0%} ({p['avg_ms']:.0f}ms)" for path, p in r["routes"]["paths"].items())
+                    print(f"{'':>20} routes: {paths}; saved {r['routes']['latency_saved_ms']:.0f}ms in total")
+
+    if args.json:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "args": vars(args),
+            },
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
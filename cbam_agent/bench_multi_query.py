@@ -0,0 +1,78 @@
+"""
+Multi-query retrieval benchmark: graph iterations and wall time per answer for a comparison question
+that needs --lookups retrievals, by how the model asks for them:
+
+    sequential  one retrieve_cbam_info call per model turn (the behaviour before this change)
+    parallel    all retrieve_cbam_info calls in one turn; ToolNode runs them concurrently
+    multi       one retrieve_cbam_multi call with --lookups sub-queries (fetched concurrently, fused)
+
+The real tools run against FakePineconeClient (--pinecone-latency) with the retrieval cache off;
+the model is FakeChatModel (--llm-latency per call). Iterations are chatbot-node runs per answer.
+
+Usage: python bench_multi_query.py [--questions 20] [--lookups 3] [--llm-latency 0.8] [--pinecone-latency 1.5]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+import uuid
+
+from langchain_core.messages import HumanMessage
+
+import agent
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel, FakePineconeClient
+from tracing import trace_request
+
+MODES = ("sequential", "parallel", "multi")
+
+
+async def run_mode(mode, args):
+    pinecone = FakePineconeClient(latency=args.pinecone_latency)
+    agent.pinecone_client = pinecone
+    agent.PINECONE_API_KEY = "fake"
+    agent.RETRIEVAL_BACKEND = "pinecone"
+    agent.retrieval_cache = None
+    llm = FakeChatModel(latency=args.llm_latency, tool_rounds=args.lookups, tool_mode=mode)
+    graph = create_agent_graph(llm=llm, tools=[agent.retrieve_cbam_info, agent.retrieve_cbam_multi],
+                               checkpointer=BoundedMemorySaver(), routing=False)
+
+    async def answer(i):
+        question = f"Compare the reporting requirements for importer {i} in the transitional phase vs the definitive phase"
+        with trace_request("bench") as trace:
+            start = time.perf_counter()
+            state = await graph.ainvoke({"messages": [HumanMessage(content=question)]},
+                                        {"configurable": {"thread_id": f"multi-{uuid.uuid4().hex}"}})
+            elapsed = time.perf_counter() - start
+        tool_chars = sum(len(str(m.content)) for m in state["messages"] if m.type == "tool")
+        return elapsed, trace.breakdown()["chatbot"]["count"], tool_chars
+
+    results = await asyncio.gather(*(answer(i) for i in range(args.questions)))
+    return {
+        "wall_ms": statistics.mean(r[0] for r in results) * 1000,
+        "iterations": statistics.mean(r[1] for r in results),
+        "pinecone_calls": pinecone.calls / args.questions,
+        "tool_chars": statistics.mean(r[2] for r in results),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--pinecone-latency", type=float, default=1.5)
+    args = parser.parse_args()
+
+    print(f"{'mode':>10} {'iterations':>10} {'wall_ms':>9} {'pinecone':>9} {'tool_chars':>10}")
+    for mode in MODES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            r = await run_mode(mode, args)
+        print(f"{mode:>10} {r['iterations']:>10.1f} {r['wall_ms']:>9.0f} {r['pinecone_calls']:>9.1f} {r['tool_chars']:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""
+Prompt-prefix benchmark: input tokens, provider-cached tokens and latency per turn, and thread
+size, for the old call layout against the cached-prefix layout (prompt_cache.py).
+
+    before  the thread stores its own SYSTEM_PROMPT copy and each call is [date, prompt, history]
+    after   the thread stores no prompt and each call is [prompt + tool schema, date, history]
+
+The provider is FakeChatModel with `prefix_caching` (implicit prefix caching on 512-character
+blocks) and --prefill-ms per uncached input token. --threads sessions each run --turns turns,
+interleaved; the date changes halfway through, as it would at midnight.
+
+Usage: python bench_prefix.py [--threads 20] [--turns 6] [--prefill-ms 0.1]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+import agent
+import fakes
+from agent import SYSTEM_PROMPT, create_agent_graph
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel, make_fake_retriever
+
+
+class LegacyLayoutModel(FakeChatModel):
+    """Sees each call in the old order: the date message ahead of the prompt."""
+
+    def _respond(self, messages):
+        if len(messages) > 1 and messages[0].content == SYSTEM_PROMPT:
+            messages = [messages[1], messages[0]] + messages[2:]
+        return super()._respond(messages)
+
+
+class Recorder(FakeChatModel):
+    calls: list = []
+
+    def _respond(self, messages):
+        reply, first_token = super()._respond(messages)
+        self.calls.append((reply.usage_metadata["input_tokens"], reply.usage_metadata["input_token_details"]["cache_read"]))
+        return reply, first_token
+
+
+class LegacyRecorder(Recorder, LegacyLayoutModel):
+    pass
+
+
+async def run_layout(layout, args):
+    fakes._cached_prefix_blocks.clear()
+    model_class = LegacyRecorder if layout == "before" else Recorder
+    llm = model_class(latency=args.llm_latency, prefix_caching=True, prefill_latency=args.prefill_ms / 1000, calls=[])
+    graph = create_agent_graph(llm=llm, tools=[make_fake_retriever(0)], checkpointer=BoundedMemorySaver(), routing=False)
+    turn_latencies = []
+    dates = ["January 15, 2026", "January 16, 2026"]
+    for turn in range(args.turns):
+        day = dates[turn * 2 // args.turns]
+        agent.current_date_label = lambda: day
+        for t in range(args.threads):
+            config = {"configurable": {"thread_id": f"{layout}-{t}"}}
+            messages = [HumanMessage(content=f"Which records must importer {t} keep for shipment {turn}?")]
+            if layout == "before" and turn == 0:
+                messages.insert(0, SystemMessage(content=SYSTEM_PROMPT))
+            start = time.perf_counter()
+            await graph.ainvoke({"messages": messages}, config)
+            turn_latencies.append(time.perf_counter() - start)
+
+    serde = JsonPlusSerializer()
+    sizes = []
+    for t in range(args.threads):
+        state = await graph.aget_state({"configurable": {"thread_id": f"{layout}-{t}"}})
+        sizes.append(len(serde.dumps_typed(state.values["messages"])[1]))
+    inputs = [i for i, _ in llm.calls]
+    cached = [c for _, c in llm.calls]
+    return {
+        "input_tokens": statistics.mean(inputs),
+        "cached_tokens": statistics.mean(cached),
+        "cached_share": sum(cached) / sum(inputs),
+        "turn_ms": statistics.mean(turn_latencies) * 1000,
+        "thread_kb": statistics.mean(sizes) / 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--prefill-ms", type=float, default=0.1, help="per uncached input token")
+    parser.add_argument("--llm-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    print(f"{'layout':>7} {'input_tok/call':>15} {'cached_tok/call':>16} {'cached':>7} {'turn_ms':>8} {'thread_kb':>10}")
+    for layout in ("before", "after"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            r = await run_layout(layout, args)
+        print(f"{layout:>7} {r['input_tokens']:>15.0f} {r['cached_tokens']:>16.0f} {r['cached_share']:>7.0%} "
+              f"{r['turn_ms']:>8.1f} {r['thread_kb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
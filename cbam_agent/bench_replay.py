@@ -0,0 +1,139 @@
+"""
+End-to-end webhook benchmark from a cassette (see cassettes.py): the full app (router, caches off,
+default tools and graph) in process, with Gemini and Pinecone served from recorded calls.
+
+    python bench_replay.py --record                 record the questions against the live APIs (needs keys)
+    python bench_replay.py --record --fakes         record against FakeChatModel/FakePineconeClient instead,
+                                                    to try the pipeline without keys
+    python bench_replay.py                          replay at the recorded latencies
+    python bench_replay.py --timing zero --profile  replay with no waiting, under cProfile: what is left is
+                                                    the app's own CPU time
+
+Each question gets a new session, so every repeat replays the recorded first turn. Reports p50/p99
+latency, the per-stage breakdown from the request traces and, with --profile, the top functions.
+
+Usage: python bench_replay.py [--cassette cassettes/bench.jsonl] [--questions FILE] [--repeat 5]
+                              [--concurrency 1] [--timing recorded|zero] [--profile]
+"""
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import statistics
+import time
+import uuid
+
+QUESTIONS = [
+    "What is the purpose of CBAM?",
+    "Which goods are covered by CBAM and which greenhouse gases apply to them?",
+    "Is CN code 7208 51 20 covered by CBAM, and what about 7601 10 00?",
+    "Calculate the specific embedded emissions for 500 tons of steel with 1200 tons of CO2e total emissions.",
+    "What must an importer include in the quarterly CBAM report?",
+    "Compare the obligations of importers in the transitional phase vs the definitive phase.",
+]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(questions, args, profiler=None):
+    import httpx
+
+    import server
+    from agent import create_agent_graph
+    from checkpointer import BoundedMemorySaver
+    from tracing import get_trace
+
+    llm = None
+    if args.fakes:
+        import agent
+        from cassettes import CassetteChatModel, CassettePineconeClient, cassette
+        from fakes import FakeChatModel, FakePineconeClient
+        from llm_router import router_from_env
+        name = os.getenv("LLM_MODELS", "gemini-flash-latest").split(",")[0].strip()
+        llm = router_from_env(backends=[CassetteChatModel(cassette=cassette, name=name, model=FakeChatModel(latency=0.8))], names=[name])
+        agent.pinecone_client = CassettePineconeClient(cassette, FakePineconeClient(latency=1.5, citations=3))
+        agent.PINECONE_API_KEY = agent.PINECONE_API_KEY or "fake"
+    server.agent_app = create_agent_graph(llm=llm, checkpointer=BoundedMemorySaver())
+
+    latencies, stages, errors = [], {}, []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=300) as client:
+
+        async def one(question):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/webhook", json={"input": question, "sessionId": uuid.uuid4().hex})
+                latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(f"{response.status_code}: {response.text[:200]}")
+                return
+            trace = get_trace(response.json()["request_id"])
+            for name, stage in (trace["breakdown"] if trace else {}).items():
+                entry = stages.setdefault(name, [0, 0.0])
+                entry[0] += stage["count"]
+                entry[1] += stage["total_ms"]
+
+        # Only the requests are profiled, not the imports and the graph build
+        if profiler:
+            profiler.enable()
+        start = time.perf_counter()
+        await asyncio.gather(*(one(q) for _ in range(args.repeat) for q in questions))
+        wall = time.perf_counter() - start
+        if profiler:
+            profiler.disable()
+    return latencies, stages, errors, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cassette", default=os.path.join("cassettes", "bench.jsonl"))
+    parser.add_argument("--questions", help="file with one question per line (default: built-in set)")
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--fakes", action="store_true", help="with --record: fake model and Pinecone as the 'live' side")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--timing", choices=("recorded", "zero"), default="recorded")
+    parser.add_argument("--profile", action="store_true")
+    args = parser.parse_args()
+
+    questions = QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+    if args.record:
+        # One recording per question
+        args.repeat = 1
+        if os.path.exists(args.cassette):
+            os.remove(args.cassette)
+    # Read at import by cassettes.py and the caches: set before the app is imported
+    os.environ.update(CASSETTE_MODE="record" if args.record else "replay", CASSETTE_PATH=args.cassette,
+                      CASSETTE_TIMING=args.timing, ANSWER_CACHE_BACKEND="off", RETRIEVAL_CACHE_BACKEND="off")
+    os.environ.setdefault("TRACE_LOG", "off")
+
+    profiler = cProfile.Profile() if args.profile else None
+    with contextlib.redirect_stdout(io.StringIO()):
+        latencies, stages, errors, wall = asyncio.run(run(questions, args, profiler))
+
+    from cassettes import cassette
+    for error in errors[:5]:
+        print(f"error {error}")
+    print(f"{'recorded' if args.record else 'replayed'} {len(latencies)} requests ({len(errors)} errors) in {wall:.2f}s, "
+          f"timing={args.timing}, cassette {cassette.snapshot()}")
+    print(f"latency p50 {statistics.median(latencies) * 1000:.1f}ms  p99 {percentile(latencies, 0.99) * 1000:.1f}ms")
+    print(f"\n{'stage':>24} {'calls':>6} {'total_ms':>10} {'ms/request':>11}")
+    for name, (count, total) in sorted(stages.items(), key=lambda kv: -kv[1][1]):
+        print(f"{name:>24} {count:>6} {total:>10.1f} {total / len(latencies):>11.2f}")
+    if profiler:
+        print()
+        pstats.Stats(profiler).sort_stats("tottime").print_stats(25)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Multi-worker scaling benchmark for serve.py with a stubbed LLM and retriever.
+
+For each worker count a real `serve.py --workers N` process tree is started on a fresh state
+directory (shared SQLite checkpointer), loaded by --loaders client processes in closed loop,
+then stopped with SIGTERM (drain time is reported). Every client alternates between a first
+turn and a follow-up on the same session, so follow-ups usually land on a different worker.
+
+The stub burns --cpu-ms of CPU per tool call, so throughput is bounded by cores rather than
+by sleeping; expect near-linear scaling up to the number of physical cores.
+
+Usage: python bench_scaling.py [--workers 1,2,4] [--duration 10] [--loaders 2] [--clients 32]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# --- Stubbed app, imported by each uvicorn worker as bench_scaling:app ---
+if os.getenv("BENCH_SCALING_APP") == "1":
+    from langchain_core.tools import tool
+
+    import agent
+    import server
+    from agent import create_agent_graph
+    from checkpointer import checkpointer_from_env
+    from fakes import FakeChatModel
+
+    CPU_SECONDS = float(os.getenv("BENCH_CPU_MS", "5")) / 1000
+
+    @tool
+    async def retrieve_cbam_info(query: str) -> str:
+        """Fake retriever that costs a fixed amount of CPU, like parsing a real Pinecone response."""
+        deadline = time.process_time() + CPU_SECONDS
+        while time.process_time() < deadline:
+            pass
+        return f"Stub passage for: {query}"
+
+    agent.retrieval_cache = None
+    server.answer_cache = None
+    server.agent_app = create_agent_graph(
+        llm=FakeChatModel(latency=float(os.getenv("BENCH_LLM_LATENCY", "0.02"))),
+        tools=[retrieve_cbam_info],
+        checkpointer=checkpointer_from_env(),
+    )
+    app = server.app
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def load_worker(args):
+    """One load-generator process: `clients` closed-loop clients for `duration` seconds."""
+    port, clients, duration = args
+
+    async def run():
+        latencies, errors = [], 0
+        deadline = time.perf_counter() + duration
+        limits = httpx.Limits(max_connections=clients)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            async def one_client():
+                nonlocal errors
+                while time.perf_counter() < deadline:
+                    session = f"scale-{uuid.uuid4().hex}"
+                    for text in ("Which records must an importer keep?", "And for how long?"):
+                        start = time.perf_counter()
+                        response = await client.post("/webhook", json={"input": text, "sessionId": session})
+                        if response.status_code == 200:
+                            latencies.append(time.perf_counter() - start)
+                        else:
+                            errors += 1
+
+            await asyncio.gather(*(one_client() for _ in range(clients)))
+        return latencies, errors
+
+    return asyncio.run(run())
+
+
+def wait_live(port, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health/live", timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError("server did not come up")
+
+
+def run_level(workers, args):
+    port = free_port()
+    # sqlite also for 1 worker, so every level pays the same storage cost
+    env = dict(os.environ, BENCH_SCALING_APP="1", BENCH_CPU_MS=str(args.cpu_ms), BENCH_LLM_LATENCY=str(args.llm_latency),
+               TRACE_LOG="off", JOBS_WORKERS="0", STARTUP_WARMUP="0", CHECKPOINT_BACKEND="sqlite")
+    env.setdefault("GOOGLE_API_KEY", "bench-placeholder")
+    state_dir = tempfile.mkdtemp()
+    cmd = [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port), "--state-dir", state_dir,
+           "--app", "bench_scaling:app", "--log-level", "warning", "--drain-timeout", "10"]
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_live(port)
+        time.sleep(1)  # let every worker finish importing
+        with multiprocessing.Pool(args.loaders) as pool:
+            results = pool.map(load_worker, [(port, args.clients // args.loaders, args.duration)] * args.loaders)
+    finally:
+        stop = time.perf_counter()
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+        drain = time.perf_counter() - stop
+
+    latencies = sorted(l for lat, _ in results for l in lat)
+    errors = sum(e for _, e in results)
+    return {
+        "rps": len(latencies) / args.duration,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+        "errors": errors,
+        "drain_s": drain,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--loaders", type=int, default=2, help="load-generator processes")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients in total")
+    parser.add_argument("--cpu-ms", type=float, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    print(f"cores={os.cpu_count()} clients={args.clients} cpu_ms={args.cpu_ms} llm_latency={args.llm_latency}s")
+    print(f"{'workers':>8} {'req/s':>8} {'speedup':>8} {'p50_ms':>8} {'p99_ms':>8} {'errors':>7} {'drain_s':>8}")
+    base = None
+    for workers in (int(n) for n in args.workers.split(",")):
+        r = run_level(workers, args)
+        base = base or r["rps"]
+        print(f"{workers:>8} {r['rps']:>8.1f} {r['rps'] / base:>7.2f}x {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+              f"{r['errors']:>7} {r['drain_s']:>8.2f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Memory-growth benchmark: simulates many anonymous `prospect-<timestamp>` sessions
+(one first-turn question each, with the full System Prompt) against each checkpointer backend.
+
+Usage: python bench_sessions.py [--sessions 100000] [--max-threads 10000] [--backends memory,bounded,sqlite]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import resource
+import tempfile
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agent import SYSTEM_PROMPT, create_agent_graph
+from checkpointer import BoundedMemorySaver, SQLiteSaver
+from fakes import FakeChatModel
+from langgraph.checkpoint.memory import MemorySaver
+
+
+def rss_mb():
+    """Current resident set size (Linux), falling back to the peak RSS elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def make_checkpointer(kind, max_threads):
+    if kind == "memory":
+        return MemorySaver()
+    if kind == "bounded":
+        return BoundedMemorySaver(max_threads=max_threads)
+    path = os.path.join(tempfile.mkdtemp(), "checkpoints.db")
+    return SQLiteSaver(path, max_threads=max_threads, sweep_interval=1.0)
+
+
+async def simulate(kind, sessions, max_threads, report_every):
+    checkpointer = make_checkpointer(kind, max_threads)
+    graph = create_agent_graph(llm=FakeChatModel(latency=0, use_tools=False), tools=[], checkpointer=checkpointer)
+    base = int(time.time() * 1000)
+    start = time.perf_counter()
+    gc.collect()
+    baseline = rss_mb()
+    for i in range(1, sessions + 1):
+        config = {"configurable": {"thread_id": f"prospect-{base + i}"}}
+        await graph.ainvoke({"messages": [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=f"Question {i}")]}, config=config)
+        if i % report_every == 0 or i == sessions:
+            threads = checkpointer.thread_count() if hasattr(checkpointer, "thread_count") else len(checkpointer.storage)
+            extra = f" db={os.path.getsize(checkpointer.path) / 1e6:.1f}MB" if kind == "sqlite" else ""
+            print(f"{kind:>8} sessions={i:>7} threads={threads:>7} rss_growth={rss_mb() - baseline:8.1f}MB "
+                  f"elapsed={time.perf_counter() - start:6.1f}s{extra}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--max-threads", type=int, default=10000)
+    parser.add_argument("--backends", default="memory,bounded,sqlite")
+    args = parser.parse_args()
+
+    for kind in args.backends.split(","):
+        asyncio.run(simulate(kind, args.sessions, args.max_threads, max(args.sessions // 10, 1)))
+
+
+if __name__ == "__main__":
+    main()
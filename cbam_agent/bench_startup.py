@@ -0,0 +1,111 @@
+"""
+Startup benchmark: how long a cold process takes before it can serve traffic.
+
+- import: time to `import server` in a fresh interpreter (median of --runs)
+- graph build: time for the deferred LangGraph/Gemini imports and graph compilation
+- live / ready: a real uvicorn process is started and polled; `live` is the first 200 from
+  /health/live (port open, time to first request), `ready` the first 200 from /health/ready
+  (graph built by the background warm-up)
+
+No network or API key is needed: Gemini is only constructed, never called.
+
+Usage: python bench_startup.py [--runs 5] [--port 8765]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SNIPPET = """
+import time
+t = time.perf_counter()
+import server
+imported = time.perf_counter() - t
+t = time.perf_counter()
+import agent
+agent.get_agent_app()
+print(imported, time.perf_counter() - t)
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "bench-placeholder")
+    env["JOBS_PATH"] = os.path.join(tempfile.mkdtemp(), "jobs.db")
+    env["TRACE_LOG"] = "off"
+    return env
+
+
+def free_port(preferred):
+    with socket.socket() as s:
+        try:
+            s.bind(("127.0.0.1", preferred))
+            return preferred
+        except OSError:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+
+def measure_import():
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=HERE, env=child_env(),
+                         capture_output=True, text=True, check=True).stdout.split()
+    return float(out[-2]), float(out[-1])
+
+
+def measure_serve(port, timeout=120):
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=HERE, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    live = ready = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while ready is None and time.perf_counter() - start < timeout:
+                try:
+                    if live is None and client.get("/health/live").status_code == 200:
+                        live = time.perf_counter() - start
+                    if live is not None and client.get("/health/ready").status_code == 200:
+                        ready = time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return live, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    imports, builds, lives, readies = [], [], [], []
+    for _ in range(args.runs):
+        imported, built = measure_import()
+        imports.append(imported)
+        builds.append(built)
+        live, ready = measure_serve(free_port(args.port))
+        lives.append(live)
+        readies.append(ready)
+
+    def median(values):
+        values = [v for v in values if v is not None]
+        return f"{statistics.median(values):.2f}s" if values else "timeout"
+
+    print(f"import server:         {median(imports)}")
+    print(f"graph build (deferred): {median(builds)}")
+    print(f"process -> live:        {median(lives)}")
+    print(f"process -> ready:       {median(readies)}")
+
+
+if __name__ == "__main__":
+    main()
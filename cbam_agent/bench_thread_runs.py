@@ -0,0 +1,91 @@
+"""
+Per-thread coordination under impatient users (see thread_runs.py), on FakeChatModel/FakePineconeClient.
+
+Each session sends a question, double-submits it (a retried request, a double click) after --gap
+seconds, then sends a follow-up that changes the question after another --gap. Reported per mode:
+status codes, graph runs (Pinecone calls), p50/p99 latency of the answers that count (the
+follow-ups) and the /stats/threads outcomes.
+
+    wait    THREAD_SUPERSEDE=wait: the double-submit is coalesced, the follow-up waits its turn
+    cancel  THREAD_SUPERSEDE=cancel: the follow-up also cancels the run it makes obsolete
+
+Usage: python bench_thread_runs.py [--sessions 20] [--gap 0.3] [--llm-latency 0.8] [--pinecone-latency 1.5]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import time
+from collections import Counter
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(mode, args):
+    import httpx
+
+    import agent
+    import server
+    from agent import create_agent_graph
+    from checkpointer import BoundedMemorySaver
+    from fakes import FakeChatModel, FakePineconeClient
+    from thread_runs import ThreadRuns
+
+    pinecone = FakePineconeClient(latency=args.pinecone_latency, citations=3)
+    agent.pinecone_client, agent.PINECONE_API_KEY, agent.retrieval_cache = pinecone, "fake", None
+    server.answer_cache = None
+    server.thread_runs = ThreadRuns(supersede=mode == "cancel")
+    server.agent_app = create_agent_graph(llm=FakeChatModel(latency=args.llm_latency), tools=[agent.retrieve_cbam_info],
+                                          checkpointer=BoundedMemorySaver(), routing=False)
+
+    statuses, latencies = Counter(), []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=300) as client:
+
+        async def post(session, text, final=False):
+            start = time.perf_counter()
+            response = await client.post("/webhook", json={"input": text, "sessionId": session})
+            statuses[response.status_code] += 1
+            if final and response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+
+        async def user(i):
+            session = f"s{i}"
+            first = asyncio.create_task(post(session, "Which goods are covered by CBAM?"))
+            await asyncio.sleep(args.gap)
+            again = asyncio.create_task(post(session, "Which goods are covered by CBAM?"))
+            await asyncio.sleep(args.gap)
+            await asyncio.gather(first, again, post(session, "Only for iron and steel, please.", final=True))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(args.sessions)))
+        wall = time.perf_counter() - start
+        stats = (await client.get("/stats/threads")).json()
+    return statuses, latencies, pinecone.calls, wall, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--gap", type=float, default=0.3)
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--pinecone-latency", type=float, default=1.5)
+    args = parser.parse_args()
+    os.environ.setdefault("TRACE_LOG", "off")
+
+    print(f"{'mode':>7} {'statuses':>22} {'runs':>5} {'p50_ms':>8} {'p99_ms':>8} {'wall_s':>7}  outcomes")
+    for mode in ("wait", "cancel"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            statuses, latencies, runs, wall, stats = asyncio.run(run(mode, args))
+        codes = " ".join(f"{code}x{n}" for code, n in sorted(statuses.items()))
+        print(f"{mode:>7} {codes:>22} {runs:>5} {statistics.median(latencies) * 1000:>8.0f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.0f} {wall:>7.2f}  {stats['outcomes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Tool-output benchmark: thread state size and prompt tokens per turn, for the old handling of
+Pinecone responses against the compact form (tool_output.py).
+
+    before  the answer text for known shapes, `json.dumps(data)` for anything else
+    after   answer + citations/highlight snippets, capped at TOOL_OUTPUT_MAX_TOKENS, payload by ref
+
+Two response shapes from FakePineconeClient, each with --citations highlighted references:
+    message     the documented shape (the old code kept the answer and dropped the citations)
+    unexpected  the answer nested elsewhere (the old code stored the whole JSON)
+--threads sessions each run --turns tool-using turns; the model is FakeChatModel, whose input
+token count is the request's characters / 4. The context budget applies as configured.
+
+Usage: python bench_tool_output.py [--threads 10] [--turns 6] [--citations 8]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+import agent
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel, FakePineconeClient
+from tool_output import compact_response
+
+
+async def legacy_response(data):
+    """retrieve_cbam_info's extraction before tool_output.py."""
+    if "choices" in data and len(data["choices"]) > 0:
+        return data["choices"][0]["message"]["content"]
+    if "message" in data:
+        return data["message"]["content"]
+    return json.dumps(data)
+
+
+class Recorder(FakeChatModel):
+    calls: list = []
+
+    def _respond(self, messages):
+        reply, first_token = super()._respond(messages)
+        self.calls.append(reply.usage_metadata["input_tokens"])
+        return reply, first_token
+
+
+async def run(layout, shape, args):
+    agent.compact_response = legacy_response if layout == "before" else compact_response
+    agent.pinecone_client = FakePineconeClient(latency=0, citations=args.citations, shape=shape)
+    agent.PINECONE_API_KEY = "fake"
+    agent.RETRIEVAL_BACKEND = "pinecone"
+    agent.retrieval_cache = None
+    llm = Recorder(latency=0, calls=[])
+    graph = create_agent_graph(llm=llm, tools=[agent.retrieve_cbam_info], checkpointer=BoundedMemorySaver(), routing=False)
+    for turn in range(args.turns):
+        for t in range(args.threads):
+            question = f"Which default values apply to steel product {t}, shipment {turn}?"
+            await graph.ainvoke({"messages": [HumanMessage(content=question)]},
+                                {"configurable": {"thread_id": f"{layout}-{shape}-{t}"}})
+
+    serde = JsonPlusSerializer()
+    sizes = []
+    for t in range(args.threads):
+        state = await graph.aget_state({"configurable": {"thread_id": f"{layout}-{shape}-{t}"}})
+        sizes.append(len(serde.dumps_typed(state.values["messages"])[1]))
+    return {"thread_kb": statistics.mean(sizes) / 1000, "input_tokens": statistics.mean(llm.calls)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--citations", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'shape':>10} {'layout':>7} {'thread_kb':>10} {'input_tok/call':>15}")
+    for shape in ("message", "unexpected"):
+        for layout in ("before", "after"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                r = await run(layout, shape, args)
+            print(f"{shape:>10} {layout:>7} {r['thread_kb']:>10.1f} {r['input_tokens']:>15.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
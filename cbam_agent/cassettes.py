@@ -0,0 +1,245 @@
+"""
+Record/replay of the two external calls, for deterministic offline benchmarks and regression runs.
+
+    CASSETTE_MODE=record   calls go to Gemini and Pinecone as usual; every request/response pair is
+                           appended to the cassette with its latencies (time to first chunk and total)
+    CASSETTE_MODE=replay   nothing leaves the process: responses come from the cassette, no API keys needed
+    CASSETTE_PATH          JSONL file, one recorded call per line (default cassettes/cbam.jsonl)
+    CASSETTE_TIMING        recorded (default): replay at the recorded latencies | zero: answer at once
+
+Requests are matched by a hash of what determines the answer:
+    llm       backend name, tool schema, and every message's type, content and tool calls; dates such as
+              the CURRENT DATE line are masked, so a cassette keeps replaying on later days
+    pinecone  the request payload
+A request recorded more than once replays its responses in recorded order, then starts over. A request
+the cassette does not hold raises CassetteMiss: re-record after changing the prompt, tools or questions.
+Record into a fresh file; appending a second session to an old cassette mixes their responses.
+
+The Gemini clients built by router_from_env (llm_router.py) and agent.pinecone_client are wrapped
+when CASSETTE_MODE is set; the router's hedging and fallback run on top as usual.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.messages.utils import message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+OFF, RECORD, REPLAY = "off", "record", "replay"
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", OFF).lower()
+
+DATE_RE = re.compile(r"\b(January|February|March|April|May|June|July|August|September|October|November|December) \d{1,2}, \d{4}\b")
+NO_CALLBACKS = {"callbacks": []}
+
+
+class CassetteMiss(RuntimeError):
+    """Replay mode got a request the cassette has no recording for."""
+
+
+class Cassette:
+    """A JSONL file of recorded calls; appended to in record mode, read once in replay mode."""
+
+    def __init__(self, path: str, mode: str = REPLAY, timing: str = "recorded"):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.speed = 0.0 if timing == "zero" else 1.0
+        self._entries: Dict[str, List[Dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.recorded = 0
+        if mode == REPLAY:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def record(self, kind: str, key: str, request: Any, response: Any, timing: Dict[str, Any]):
+        entry = {"kind": kind, "key": key, "request": request, "response": response, "timing": timing}
+        line = json.dumps(entry, ensure_ascii=False, sort_keys=True)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self._entries.setdefault(key, []).append(entry)
+            self.recorded += 1
+
+    def play(self, kind: str, key: str) -> Dict:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded {kind} call {key} in {self.path}; re-record with CASSETTE_MODE=record")
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+            self.hits += 1
+            return entries[i % len(entries)]
+
+    async def sleep(self, seconds: float):
+        if self.speed and seconds > 0:
+            await asyncio.sleep(seconds * self.speed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "path": self.path, "calls": sum(len(v) for v in self._entries.values()),
+                "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+
+def request_key(kind: str, request: Any) -> str:
+    return hashlib.sha256(json.dumps([kind, request], sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:24]
+
+
+def _message_key(m: BaseMessage) -> Dict[str, Any]:
+    content = m.content if isinstance(m.content, str) else json.dumps(m.content, sort_keys=True)
+    key = {"type": m.type, "content": DATE_RE.sub("<date>", content)}
+    if getattr(m, "tool_calls", None):
+        # Without ids: providers generate them per call
+        key["tool_calls"] = [{"name": c["name"], "args": c["args"]} for c in m.tool_calls]
+    return key
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    Records the calls of `model` (record mode) or answers them from the cassette (replay mode,
+    where `model` is None). `name` keeps recordings of different backends apart.
+    """
+    cassette: Any
+    name: str
+    model: Any = None
+    tool_schema: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def bind_tools(self, tools, **kwargs):
+        schema = json.dumps([convert_to_openai_tool(t) for t in tools], sort_keys=True) if tools else ""
+        bound = self.model.bind_tools(tools, **kwargs) if self.model is not None else None
+        return self.model_copy(update={"model": bound, "tool_schema": schema})
+
+    def _key(self, messages: List[BaseMessage]) -> str:
+        return request_key("llm", {"backend": self.name, "tools": hashlib.sha256(self.tool_schema.encode()).hexdigest()[:16],
+                                   "messages": [_message_key(m) for m in messages]})
+
+    def _record(self, key: str, messages: List[BaseMessage], message: BaseMessage, first: float, total: float, parts=None):
+        request = {"backend": self.name, "last": _message_key(messages[-1]) if messages else None, "messages": len(messages)}
+        self.cassette.record("llm", key, request, message_to_dict(message),
+                             {"first": round(first, 4), "total": round(total, 4), "parts": parts or [[round(total, 4), str(message.content)]]})
+
+    def _replayed(self, key: str):
+        entry = self.cassette.play("llm", key)
+        return messages_from_dict([entry["response"]])[0], entry["timing"]
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages)
+        if self.cassette.replaying:
+            message, timing = self._replayed(key)
+            await self.cassette.sleep(timing["total"])
+        else:
+            start = time.perf_counter()
+            message = await self.model.ainvoke(messages, config=NO_CALLBACKS, stop=stop, **kwargs)
+            elapsed = time.perf_counter() - start
+            self._record(key, messages, message, elapsed, elapsed)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._key(messages)
+        if self.cassette.replaying:
+            stream = self._replay_stream(key)
+        else:
+            stream = self._record_stream(key, messages, stop, **kwargs)
+        async for chunk in stream:
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(generation.text, chunk=generation)
+            yield generation
+
+    async def _record_stream(self, key: str, messages: List[BaseMessage], stop, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        start = time.perf_counter()
+        parts, merged = [], None
+        async for chunk in self.model.astream(messages, config=NO_CALLBACKS, stop=stop, **kwargs):
+            parts.append([round(time.perf_counter() - start, 4), str(chunk.content)])
+            merged = chunk if merged is None else merged + chunk
+            yield chunk
+        message = message_chunk_to_message(merged) if merged is not None else AIMessage(content="")
+        total = time.perf_counter() - start
+        self._record(key, messages, message, parts[0][0] if parts else total, total, parts)
+
+    async def _replay_stream(self, key: str) -> AsyncIterator[AIMessageChunk]:
+        message, timing = self._replayed(key)
+        usage = getattr(message, "usage_metadata", None)
+        if message.tool_calls:
+            await self.cassette.sleep(timing["total"])
+            yield AIMessageChunk(content=str(message.content), usage_metadata=usage, tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i} for i, c in enumerate(message.tool_calls)])
+            return
+        elapsed = 0.0
+        for i, (offset, text) in enumerate(timing["parts"]):
+            await self.cassette.sleep(offset - elapsed)
+            elapsed = offset
+            yield AIMessageChunk(content=text, usage_metadata=usage if i == 0 else None)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages)
+        if self.cassette.replaying:
+            message, timing = self._replayed(key)
+            time.sleep(timing["total"] * self.cassette.speed)
+        else:
+            start = time.perf_counter()
+            message = self.model.invoke(messages, config=NO_CALLBACKS, stop=stop, **kwargs)
+            elapsed = time.perf_counter() - start
+            self._record(key, messages, message, elapsed, elapsed)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class CassettePineconeClient:
+    """Same contract as PineconeClient (start/close/chat); records or replays `chat()`."""
+
+    def __init__(self, cassette: Cassette, client: Any = None):
+        self.cassette = cassette
+        self.client = client
+
+    async def start(self):
+        if self.client is not None:
+            await self.client.start()
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+
+    async def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        key = request_key("pinecone", payload)
+        if self.cassette.replaying:
+            entry = self.cassette.play("pinecone", key)
+            await self.cassette.sleep(entry["timing"]["total"])
+            return json.loads(json.dumps(entry["response"]))
+        start = time.perf_counter()
+        data = await self.client.chat(payload)
+        elapsed = round(time.perf_counter() - start, 4)
+        self.cassette.record("pinecone", key, payload, data, {"first": elapsed, "total": elapsed})
+        return data
+
+
+def cassette_from_env() -> Optional[Cassette]:
+    if CASSETTE_MODE == OFF:
+        return None
+    return Cassette(os.getenv("CASSETTE_PATH", os.path.join("cassettes", "cbam.jsonl")), CASSETTE_MODE,
+                    os.getenv("CASSETTE_TIMING", "recorded").lower())
+
+
+# Shared by the LLM backends and the Pinecone client of this process (None when CASSETTE_MODE=off)
+cassette = cassette_from_env()
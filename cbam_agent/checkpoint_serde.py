@@ -0,0 +1,330 @@
+"""
+Compact checkpoint serialization (CHECKPOINT_SERDE=delta, the default; `plain` is LangGraph's own).
+
+LangGraph writes the whole `messages` channel at every graph step, so a thread's checkpoints grow
+quadratically over a conversation. DeltaSerializer stores message lists by reference instead:
+
+    messages  each message is stored once, keyed by the hash of its serialized form. Content of
+              INTERN_MIN_CHARS or more is stored separately, keyed by the hash of the text, so a
+              repeated system prompt or tool output is kept once for all threads
+    lists     a list is a node holding its parent (the longest prefix already stored) and the
+              refs appended since, so a step writes only its new messages and a small node;
+              after MAX_DEPTH nodes a full node bounds the chain a read has to walk
+    other     channel values, checkpoints and metadata are serialized as before, then compressed
+
+Compression uses zstandard when it is installed, else zlib (CHECKPOINT_CODEC=zstd | zlib | none).
+Blobs written by the plain serializer still load.
+
+The content lives in a ContentStore (in memory next to BoundedMemorySaver, a table in the same
+file for SQLiteSaver). `sweep` deletes what no stored checkpoint references any more; the savers
+run it with their own eviction. Entries younger than `grace` seconds are always kept, since a
+writer in another process may have stored content whose checkpoint is not committed yet.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is used instead
+    zstandard = None
+
+INTERN_MIN_CHARS = 512
+MAX_DEPTH = 32
+COMPRESS_MIN_BYTES = 256
+DIGEST_BYTES = 16
+# Stands in for interned content inside a stored message
+CONTENT_MARKER = "\x00cbam-content:"
+DELTA_TYPE = "delta"
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()[:DIGEST_BYTES]
+
+
+def default_codec() -> str:
+    return os.getenv("CHECKPOINT_CODEC", "zstd" if zstandard is not None else "zlib").lower()
+
+
+def compress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.compress(data, 3)
+    return zlib.compress(data, 1)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("checkpoint blob is zstd-compressed; pip install zstandard")
+        return zstandard.decompress(data)
+    return zlib.decompress(data)
+
+
+# --- Content stores: key -> (value, keys it references, stored_at) ---
+class MemoryContentStore:
+    def __init__(self):
+        self._entries: Dict[str, Tuple[bytes, Tuple[str, ...], float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def put_many(self, items: Dict[str, Tuple[bytes, Tuple[str, ...]]]):
+        now = time.time()
+        with self._lock:
+            for key, (value, deps) in items.items():
+                # Re-storing refreshes the timestamp, which protects the entry from a concurrent sweep
+                entry = self._entries.get(key)
+                self._entries[key] = (entry[0] if entry else value, deps, now)
+
+    def graph(self) -> Iterable[Tuple[str, Tuple[str, ...], float]]:
+        with self._lock:
+            return [(key, deps, stored_at) for key, (_, deps, stored_at) in self._entries.items()]
+
+    def delete(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def size_bytes(self) -> int:
+        return sum(len(key) + len(value) for key, (value, _, _) in self._entries.items())
+
+
+class SQLiteContentStore:
+    """The `checkpoint_content` table; shared by every process that uses the same file."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint_content (key TEXT PRIMARY KEY, value BLOB, deps TEXT, stored_at REAL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM checkpoint_content WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def put_many(self, items: Dict[str, Tuple[bytes, Tuple[str, ...]]]):
+        now = time.time()
+        rows = [(key, value, " ".join(deps), now) for key, (value, deps) in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO checkpoint_content VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET stored_at = excluded.stored_at",
+                rows,
+            )
+
+    def graph(self) -> Iterable[Tuple[str, Tuple[str, ...], float]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, deps, stored_at FROM checkpoint_content").fetchall()
+        return [(key, tuple(deps.split()) if deps else (), stored_at) for key, deps, stored_at in rows]
+
+    def delete(self, keys: Iterable[str]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM checkpoint_content WHERE key = ?", [(k,) for k in keys])
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(LENGTH(key) + LENGTH(value)), 0) FROM checkpoint_content").fetchone()[0]
+
+
+class _LRU(OrderedDict):
+    def __init__(self, size: int):
+        super().__init__()
+        self.size = size
+
+    def get(self, key, default=None):
+        if key in self:
+            self.move_to_end(key)
+            return self[key]
+        return default
+
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        if len(self) > self.size:
+            self.popitem(last=False)
+
+
+class DeltaSerializer:
+    """SerializerProtocol implementation; see the module docstring."""
+
+    def __init__(self, store=None, codec: Optional[str] = None, grace: float = 3600.0, base=None):
+        self.store = store if store is not None else MemoryContentStore()
+        self.codec = (codec or default_codec()).lower()
+        self.grace = grace
+        self.base = base or JsonPlusSerializer()
+        self._lock = threading.RLock()
+        # Message identity -> (ref, when it was last stored), so unchanged history is not re-serialized
+        self._refs = _LRU(200_000)
+        self._nodes = _LRU(20_000)
+        self._messages = _LRU(20_000)
+
+    # --- Plain values ---
+    def _pack(self, type_: str, data: bytes) -> Tuple[str, bytes]:
+        if self.codec != "none" and len(data) >= COMPRESS_MIN_BYTES:
+            packed = compress(self.codec, data)
+            if len(packed) < len(data):
+                return f"{self.codec}+{type_}", packed
+        return type_, data
+
+    def _unpack(self, type_: str, data: bytes) -> Tuple[str, bytes]:
+        if "+" in type_:
+            codec, type_ = type_.split("+", 1)
+            data = decompress(codec, data)
+        return type_, data
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        if isinstance(obj, list) and obj and all(isinstance(m, BaseMessage) for m in obj):
+            return DELTA_TYPE, self._put_list(obj)
+        return self._pack(*self.base.dumps_typed(obj))
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_ == DELTA_TYPE:
+            return self._get_list(payload)
+        return self.base.loads_typed(self._unpack(type_, payload))
+
+    # --- Messages ---
+    def _entry(self, type_: str, data: bytes) -> bytes:
+        type_, data = self._pack(type_, data)
+        return type_.encode() + b"\n" + data
+
+    def _read(self, key: str) -> Tuple[str, bytes]:
+        value = self.store.get(key)
+        if value is None:
+            raise KeyError(f"checkpoint content {key} is missing")
+        type_, data = value.split(b"\n", 1)
+        return self._unpack(type_.decode(), data)
+
+    def _message_ref(self, message: BaseMessage, new: Dict[str, Tuple[bytes, Tuple[str, ...]]], now: float) -> bytes:
+        content = message.content
+        identity = (message.id, message.type, hash(content), len(content)) if message.id and isinstance(content, str) else None
+        known = self._refs.get(identity) if identity else None
+        if known is not None and now - known[1] < self.grace / 2:
+            return known[0]
+
+        deps: Tuple[str, ...] = ()
+        if isinstance(content, str) and len(content) >= INTERN_MIN_CHARS:
+            text = content.encode()
+            content_key = "c:" + _digest(text).hex()
+            new[content_key] = (self._entry("text", text), ())
+            message = message.model_copy(update={"content": CONTENT_MARKER + content_key})
+            deps = (content_key,)
+        type_, data = self.base.dumps_typed(message)
+        ref = _digest(type_.encode() + b"\0" + data)
+        new["m:" + ref.hex()] = (self._entry(type_, data), deps)
+        if identity:
+            self._refs.put(identity, (ref, now))
+        return ref
+
+    def _message(self, ref: bytes) -> BaseMessage:
+        message = self._messages.get(ref)
+        if message is None:
+            message = self.base.loads_typed(self._read("m:" + ref.hex()))
+            if isinstance(message.content, str) and message.content.startswith(CONTENT_MARKER):
+                _, text = self._read(message.content[len(CONTENT_MARKER):])
+                message = message.model_copy(update={"content": text.decode()})
+            self._messages.put(ref, message)
+        return message.model_copy()
+
+    # --- Lists ---
+    def _node(self, digest: bytes) -> Optional[Tuple[int, bytes, List[bytes]]]:
+        """(depth, parent digest or b"", refs) of a stored list node."""
+        node = self._nodes.get(digest)
+        if node is None:
+            value = self.store.get("n:" + digest.hex())
+            if value is None:
+                return None
+            depth, parent = int.from_bytes(value[:2], "big"), value[2:2 + DIGEST_BYTES]
+            body = value[2 + DIGEST_BYTES:]
+            refs = [body[i:i + DIGEST_BYTES] for i in range(0, len(body), DIGEST_BYTES)]
+            node = (depth, parent if parent != bytes(DIGEST_BYTES) else b"", refs)
+            self._nodes.put(digest, node)
+        return node
+
+    def _put_list(self, messages: List[BaseMessage]) -> bytes:
+        now = time.time()
+        new: Dict[str, Tuple[bytes, Tuple[str, ...]]] = {}
+        with self._lock:
+            refs = [self._message_ref(m, new, now) for m in messages]
+            chain, digest = [], b""
+            for ref in refs:
+                digest = _digest(digest + ref)
+                chain.append(digest)
+            head = chain[-1]
+            if not new and self._node(head) is not None:
+                return head
+
+            # The longest prefix stored already is this list's parent (usually the previous step's list)
+            start, parent, depth = 0, b"", 0
+            for i in range(len(chain) - 2, -1, -1):
+                node = self._node(chain[i])
+                if node is not None:
+                    if node[0] + 1 <= MAX_DEPTH:
+                        start, parent, depth = i + 1, chain[i], node[0] + 1
+                    break
+            added = refs[start:]
+            value = depth.to_bytes(2, "big") + (parent or bytes(DIGEST_BYTES)) + b"".join(added)
+            deps = tuple("m:" + r.hex() for r in added) + (("n:" + parent.hex(),) if parent else ())
+            new["n:" + head.hex()] = (value, deps)
+            self.store.put_many(new)
+            self._nodes.put(head, (depth, parent, added))
+        return head
+
+    def _get_list(self, head: bytes) -> List[BaseMessage]:
+        with self._lock:
+            parts, digest = [], head
+            while digest:
+                node = self._node(digest)
+                if node is None:
+                    raise KeyError(f"checkpoint list node {digest.hex()} is missing")
+                parts.append(node[2])
+                digest = node[1]
+            return [self._message(ref) for part in reversed(parts) for ref in part]
+
+    # --- Garbage collection ---
+    def sweep(self, heads: Iterable[bytes]) -> int:
+        """Deletes content unreachable from `heads` (the delta blobs still stored) and older than `grace`."""
+        with self._lock:
+            graph = {key: (deps, stored_at) for key, deps, stored_at in self.store.graph()}
+            reachable = set()
+            stack = ["n:" + head.hex() for head in heads]
+            while stack:
+                key = stack.pop()
+                if key in reachable or key not in graph:
+                    continue
+                reachable.add(key)
+                stack.extend(graph[key][0])
+            cutoff = time.time() - self.grace
+            dead = [key for key, (_, stored_at) in graph.items() if key not in reachable and stored_at < cutoff]
+            if dead:
+                self.store.delete(dead)
+                self._refs.clear()
+                self._nodes.clear()
+                self._messages.clear()
+            return len(dead)
+
+
+def serde_from_env(sqlite_path: Optional[str] = None):
+    """
+    CHECKPOINT_SERDE: delta (default) | plain
+    CHECKPOINT_CODEC: zstd (default when zstandard is installed) | zlib | none
+    CHECKPOINT_CONTENT_GRACE: seconds unreferenced content is kept before a sweep may delete it (default 3600)
+    """
+    if os.getenv("CHECKPOINT_SERDE", "delta").lower() != "delta":
+        return None
+    store = SQLiteContentStore(sqlite_path) if sqlite_path else MemoryContentStore()
+    return DeltaSerializer(store, grace=float(os.getenv("CHECKPOINT_CONTENT_GRACE", "3600")))
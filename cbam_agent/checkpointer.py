@@ -0,0 +1,437 @@
+"""
+Conversation checkpointers with bounded growth.
+
+- BoundedMemorySaver: MemorySaver with a per-thread TTL and an LRU cap on the number of threads
+- SQLiteSaver: the same policy on a SQLite file, so state survives restarts and is shared by workers
+- TracedCheckpointer: wraps either one with checkpoint_read / checkpoint_write spans (see tracing.py)
+
+Both store message history as deltas with interned, compressed content by default
+(DeltaSerializer, see checkpoint_serde.py); their eviction also sweeps content no checkpoint uses.
+Selected with CHECKPOINT_* environment variables (see `checkpointer_from_env`).
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from checkpoint_serde import DELTA_TYPE, serde_from_env
+from tracing import span
+
+# Seconds between sweeps of unreferenced checkpoint content (DeltaSerializer only)
+CONTENT_SWEEP_INTERVAL = 600.0
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    In-process saver that forgets threads idle for longer than `ttl` seconds
+    and keeps at most `max_threads` threads (least recently used are dropped first).
+    """
+
+    def __init__(self, ttl: float = 7 * 86400, max_threads: int = 10000, **kwargs):
+        super().__init__(**kwargs)
+        self.ttl = ttl
+        self.max_threads = max_threads
+        self.evictions = 0
+        self._access: "OrderedDict[str, float]" = OrderedDict()
+        # Per-thread key indexes so eviction does not scan every write/blob
+        self._write_keys: Dict[str, Set[Tuple]] = defaultdict(set)
+        self._blob_keys: Dict[str, Set[Tuple]] = defaultdict(set)
+        self._lock = threading.RLock()
+        self._last_content_sweep = time.monotonic()
+
+    def _touch(self, thread_id: str):
+        with self._lock:
+            self._access[thread_id] = time.monotonic()
+            self._access.move_to_end(thread_id)
+            self._evict()
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._access:
+            thread_id, accessed_at = next(iter(self._access.items()))
+            if accessed_at >= cutoff and len(self._access) <= self.max_threads:
+                break
+            self.delete_thread(thread_id)
+            self.evictions += 1
+        if hasattr(self.serde, "sweep") and time.monotonic() - self._last_content_sweep >= CONTENT_SWEEP_INTERVAL:
+            self.sweep_content()
+
+    def sweep_content(self) -> int:
+        """Drops interned content that no stored checkpoint or pending write refers to any more."""
+        with self._lock:
+            self._last_content_sweep = time.monotonic()
+            heads = [value for type_, value in self.blobs.values() if type_ == DELTA_TYPE]
+            heads += [w[2][1] for writes in self.writes.values() for w in writes.values() if w[2][0] == DELTA_TYPE]
+            return self.serde.sweep(heads)
+
+    def thread_count(self) -> int:
+        return len(self._access)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            # Checked first so a lookup of an unknown thread does not create an empty entry
+            if thread_id not in self.storage:
+                return None
+            if time.monotonic() - self._access.get(thread_id, 0) > self.ttl:
+                self.delete_thread(thread_id)
+                self.evictions += 1
+                return None
+            self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            self._blob_keys[thread_id].update((thread_id, checkpoint_ns, k, v) for k, v in new_versions.items())
+            self._touch(thread_id)
+            return result
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+            self._write_keys[thread_id].add((thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"]))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self.storage.pop(thread_id, None)
+            for key in self._write_keys.pop(thread_id, ()):
+                self.writes.pop(key, None)
+            for key in self._blob_keys.pop(thread_id, ()):
+                self.blobs.pop(key, None)
+            self._access.pop(thread_id, None)
+
+
+class SQLiteSaver(BaseCheckpointSaver):
+    """
+    Checkpointer on a SQLite file (WAL mode), safe to share between uvicorn worker processes.
+    Same TTL/LRU policy as BoundedMemorySaver, tracked in a `threads` table.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 86400, max_threads: int = 10000, sweep_interval: float = 60.0, **kwargs):
+        # The file outlives the process: whoever opens it must read the content table it was written with
+        kwargs.setdefault("serde", serde_from_env(path))
+        super().__init__(**kwargs)
+        self.path = path
+        self.ttl = ttl
+        self.max_threads = max_threads
+        self.sweep_interval = sweep_interval
+        self.evictions = 0
+        self._last_sweep = 0.0
+        self._last_content_sweep = time.monotonic()
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, parent_id TEXT,
+                type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id));
+            CREATE TABLE IF NOT EXISTS blobs (
+                thread_id TEXT, checkpoint_ns TEXT, channel TEXT, version TEXT, type TEXT, value BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, channel, version));
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER,
+                channel TEXT, type TEXT, value BLOB, task_path TEXT,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx));
+            CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, accessed_at REAL);
+            CREATE INDEX IF NOT EXISTS threads_accessed ON threads (accessed_at);
+            """
+        )
+
+    # --- Eviction ---
+    def _touch(self, thread_id: str):
+        self.conn.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time()))
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Deletes expired threads and the least recently used ones above `max_threads`."""
+        with self._lock:
+            expired = [r[0] for r in self.conn.execute("SELECT thread_id FROM threads WHERE accessed_at < ?", (time.time() - self.ttl,))]
+            excess = self.conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0] - len(expired) - self.max_threads
+            if excess > 0:
+                expired += [r[0] for r in self.conn.execute(
+                    "SELECT thread_id FROM threads WHERE accessed_at >= ? ORDER BY accessed_at LIMIT ?",
+                    (time.time() - self.ttl, excess),
+                )]
+            self.conn.execute("BEGIN")
+            for thread_id in expired:
+                self.delete_thread(thread_id)
+            self.conn.execute("COMMIT")
+            self.evictions += len(expired)
+            if hasattr(self.serde, "sweep") and time.monotonic() - self._last_content_sweep >= CONTENT_SWEEP_INTERVAL:
+                self.sweep_content()
+            return len(expired)
+
+    def sweep_content(self) -> int:
+        """Drops interned content that no stored checkpoint or pending write refers to any more."""
+        with self._lock:
+            self._last_content_sweep = time.monotonic()
+            heads = [r[0] for r in self.conn.execute(
+                "SELECT value FROM blobs WHERE type = ? UNION SELECT value FROM writes WHERE type = ?", (DELTA_TYPE, DELTA_TYPE))]
+            return self.serde.sweep(heads)
+
+    def thread_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+
+    def _expired(self, thread_id: str) -> bool:
+        row = self.conn.execute("SELECT accessed_at FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+        if row is not None and time.time() - row[0] > self.ttl:
+            self.delete_thread(thread_id)
+            self.evictions += 1
+            return True
+        return False
+
+    # --- Reads ---
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, checkpoint_b, metadata_type, metadata_b = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint_b))
+        channel_values = {}
+        for channel, version in checkpoint["channel_versions"].items():
+            blob = self.conn.execute(
+                "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if blob is not None and blob[0] != "empty":
+                channel_values[channel] = self.serde.loads_typed(blob)
+        writes = sorted(
+            self.conn.execute(
+                "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchall(),
+            key=lambda w: writes_sort_key(w[5], w[0], w[1]),
+        )
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=self.serde.loads_typed((metadata_type, metadata_b)),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, _, channel, t, v, _ in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            if self._expired(thread_id):
+                return None
+            query = "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(query + " AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                row = self.conn.execute(query + " ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)).fetchone()
+            if row is None:
+                return None
+            self._touch(thread_id)
+            return self._tuple(thread_id, checkpoint_ns, row)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints WHERE 1 = 1"
+        params = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+            for thread_id, checkpoint_ns, *row in rows:
+                item = self._tuple(thread_id, checkpoint_ns, row)
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                if limit is not None:
+                    if limit <= 0:
+                        break
+                    limit -= 1
+                yield item
+
+    # --- Writes ---
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+        blobs = [
+            (thread_id, checkpoint_ns, k, str(v), *(self.serde.dumps_typed(values[k]) if k in values else ("empty", b"")))
+            for k, v in new_versions.items()
+        ]
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                        *self.serde.dumps_typed(c),
+                        *self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+                    ),
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._touch(thread_id)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        special, regular = [], []
+        for idx, (channel, value) in enumerate(writes):
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, *self.serde.dumps_typed(value), task_path)
+            (special if channel in WRITES_IDX_MAP else regular).append(row)
+        # Special writes (errors, interrupts) overwrite; regular ones are written once, as in MemorySaver
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", special)
+            self.conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", regular)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for table in ("checkpoints", "blobs", "writes", "threads"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    # --- Async (off the event loop: a write can wait up to 30 s on another worker's lock, and
+    # writes may run the TTL/LRU sweep) ---
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # Same scheme as MemorySaver: zero-padded counter + random suffix, sortable as text
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+
+def checkpointer_from_env():
+    """
+    CHECKPOINT_BACKEND: bounded (default) | sqlite | memory (unbounded MemorySaver)
+    CHECKPOINT_PATH: SQLite file (default checkpoints.db)
+    CHECKPOINT_TTL: seconds a thread may stay idle (default 7 days)
+    CHECKPOINT_MAX_THREADS: LRU cap on stored threads (default 10000)
+    CHECKPOINT_SERDE / CHECKPOINT_CODEC: delta serialization and compression (see checkpoint_serde.py)
+    """
+    kind = os.getenv("CHECKPOINT_BACKEND", "bounded").lower()
+    ttl = float(os.getenv("CHECKPOINT_TTL", str(7 * 86400)))
+    max_threads = int(os.getenv("CHECKPOINT_MAX_THREADS", "10000"))
+    if kind == "memory":
+        return MemorySaver()
+    if kind == "sqlite":
+        path = os.getenv("CHECKPOINT_PATH", "checkpoints.db")
+        return SQLiteSaver(path, ttl=ttl, max_threads=max_threads)
+    return BoundedMemorySaver(ttl=ttl, max_threads=max_threads, serde=serde_from_env())
+
+
+class TracedCheckpointer(BaseCheckpointSaver):
+    """Wraps any checkpointer so reads and writes show up as checkpoint_read / checkpoint_write spans."""
+
+    def __init__(self, inner: BaseCheckpointSaver):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+
+    def __getattr__(self, name):
+        # Backend extras (stats, thread_count, ...) pass straight through
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    @property
+    def config_specs(self):
+        return self.inner.config_specs
+
+    def get_tuple(self, config: RunnableConfig):
+        with span("checkpoint_read"):
+            return self.inner.get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        return self.inner.list(config, filter=filter, before=before, limit=limit)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with span("checkpoint_write"):
+            return self.inner.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with span("checkpoint_write", kind="writes"):
+            return self.inner.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str):
+        return self.inner.delete_thread(thread_id)
+
+    async def aget_tuple(self, config: RunnableConfig):
+        with span("checkpoint_read"):
+            return await self.inner.aget_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        async for item in self.inner.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with span("checkpoint_write"):
+            return await self.inner.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        with span("checkpoint_write", kind="writes"):
+            return await self.inner.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str):
+        return await self.inner.adelete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.inner.get_next_version(current, channel)
@@ -0,0 +1,214 @@
+"""
+CN-code scope index for `lookup_cn_codes`: is a product covered by CBAM, under which Annex I entry,
+category and greenhouse gases. Answered in-process (microseconds) instead of by a Pinecone call.
+Default values are not part of it: they come from the Commission's implementing acts, through the
+knowledge base.
+
+The index is loaded at import from a versioned JSON file (CN_INDEX_PATH, default cbam_annex_i.json
+next to this module): `format`, `version`, `source` and `goods`, one Annex I entry per row:
+    cn           CN code or prefix as printed in the Annex ("2523 10 00", "7208", "7202 1")
+    description, category, gases
+    excluded     true for a carve-out inside a covered heading (3105 60 00 under 3105)
+    note         optional remark shown with the entry
+Bump `version` whenever the data changes; it is printed with every answer.
+
+The entries are a sorted array of digit strings plus a dict from code to entry:
+    code     "7208 51 20": the longest entry that is a prefix of it, one dict probe per entry length
+    prefix   "7202": covered by a shorter entry, else by the entries beneath it, as a range
+    range    "7208-7212": the entries between the bounds (bisect); covered if they leave no gap in it
+Trailing "00" pairs of an entry mean "not subdivided" and are dropped, so 2716 00 00 covers heading 2716.
+"""
+import json
+import os
+import re
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from langchain_core.tools import tool
+
+FORMAT_VERSION = 1
+CN_INDEX_PATH = os.getenv("CN_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cbam_annex_i.json"))
+
+COVERED, PARTLY, EXCLUDED, NOT_COVERED, INVALID = "yes", "partly", "excluded", "no", "invalid"
+# Entries listed per answer row before "… and N more"
+MAX_LISTED = 8
+
+CODE_RE = re.compile(r"^\d{2,10}$")
+RANGE_RE = re.compile(r"^(.+?)\s*(?:-|–|\.\.|\bto\b)\s*(.+)$")
+
+
+def entry_key(code: str) -> str:
+    """Index key of an Annex I code: digits without trailing '00' pairs ('2716 00 00' -> '2716')."""
+    digits = normalise(code)
+    while len(digits) > 4 and digits.endswith("00"):
+        digits = digits[:-2]
+    return digits
+
+
+def normalise(code: str) -> str:
+    """'7208 51 20' / '7208.51.20' -> '72085120'. Raises ValueError for anything but 2-10 digits."""
+    digits = re.sub(r"[\s.]", "", str(code))
+    if not CODE_RE.match(digits):
+        raise ValueError(f"'{code}' is not a CN code (2 to 10 digits)")
+    return digits
+
+
+@dataclass(frozen=True)
+class Entry:
+    cn: str  # index key, see entry_key()
+    label: str  # as printed in Annex I
+    description: str
+    category: str
+    gases: Tuple[str, ...] = ()
+    excluded: bool = False
+    note: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Match:
+    query: str
+    status: str
+    # The Annex I entry covering (or excluding) the query; None for a range spanning several entries
+    entry: Optional[Entry] = None
+    # Entries beneath a partly covered prefix or inside a range; carve-outs under a covered heading
+    # (the entries making up a covered range when `entry` is None)
+    entries: Tuple[Entry, ...] = ()
+    error: Optional[str] = None
+
+
+class CNIndex:
+    def __init__(self, entries: List[Entry], version: str, source: str = ""):
+        self.entries = sorted(entries, key=lambda e: e.cn)
+        self.codes = [e.cn for e in self.entries]
+        self.by_code = {e.cn: e for e in self.entries}
+        if len(self.by_code) != len(self.entries):
+            raise ValueError("duplicate CN codes in the index")
+        self.lengths = sorted({len(c) for c in self.codes}, reverse=True)
+        self.version = version
+        self.source = source
+
+    @classmethod
+    def load(cls, path: str) -> "CNIndex":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported CN index format {data.get('format')} in {path}")
+        entries = []
+        for row in data["goods"]:
+            entries.append(Entry(
+                cn=entry_key(row["cn"]), label=row["cn"], description=row["description"], category=row["category"],
+                gases=tuple(row.get("gases", ())), excluded=bool(row.get("excluded")), note=row.get("note"),
+            ))
+        return cls(entries, str(data["version"]), data.get("source", ""))
+
+    def _beneath(self, prefix: str) -> List[Entry]:
+        # "~" sorts after every digit, so this is the slice of codes starting with `prefix`
+        return self.entries[bisect_left(self.codes, prefix):bisect_left(self.codes, prefix + "~")]
+
+    def _covering(self, digits: str) -> Optional[Entry]:
+        for n in self.lengths:
+            if n <= len(digits):
+                entry = self.by_code.get(digits[:n])
+                if entry is not None:
+                    return entry
+        return None
+
+    def lookup(self, code: str) -> Match:
+        """Scope of one code or prefix. Raises ValueError for malformed codes."""
+        digits = normalise(code)
+        entry = self._covering(digits)
+        if entry is not None and entry.excluded:
+            return Match(code, EXCLUDED, entry)
+        below = [e for e in self._beneath(digits) if len(e.cn) > len(digits)]
+        if entry is not None:
+            return Match(code, COVERED, entry, tuple(e for e in below if e.excluded))
+        # A prefix over several entries ("721" = 7210-7219) is a range of its own
+        return self.lookup_range(code, code, code)
+
+    def lookup_range(self, start: str, end: str, query: Optional[str] = None) -> Match:
+        """The Annex I entries between two codes (inclusive, by prefix: '7208-7212' includes 7212 90)."""
+        lo, hi = normalise(start), normalise(end)
+        if lo > hi:
+            raise ValueError(f"empty range {start}-{end}")
+        query = query or f"{start}-{end}"
+        entry = self._covering(lo)
+        if entry is not None and not entry.excluded and hi.startswith(entry.cn):
+            # Both ends under one covered heading
+            return Match(query, COVERED, entry, tuple(e for e in self._beneath(entry.cn) if e.excluded))
+        inside = self.entries[bisect_left(self.codes, lo):bisect_left(self.codes, hi + "~")]
+        covered = tuple(e for e in inside if not e.excluded)
+        if entry is not None and not entry.excluded and entry not in covered:
+            covered = (entry,) + covered
+        # Covered when the entries leave no gap from the first code of `lo` to the last of `hi`,
+        # and no carve-out falls inside
+        cursor, last = _span(lo)[0], _span(hi)[1]
+        for first, end in sorted(_span(e.cn) for e in covered):
+            if first > cursor:
+                break
+            cursor = max(cursor, end + 1)
+        if covered and cursor > last and not any(e.excluded for e in inside):
+            return Match(query, COVERED, None, covered)
+        return Match(query, PARTLY if covered else NOT_COVERED, None, covered)
+
+    def resolve(self, query: str) -> Match:
+        """A code, prefix or range ('7208-7212', '7208..7212', '7208 to 7212'); malformed queries become INVALID."""
+        try:
+            parts = RANGE_RE.match(query.strip())
+            if parts:
+                return self.lookup_range(parts.group(1), parts.group(2), query)
+            return self.lookup(query)
+        except ValueError as e:
+            return Match(query, INVALID, error=str(e))
+
+    def resolve_many(self, queries: List[str]) -> List[Match]:
+        return [self.resolve(q) for q in queries]
+
+
+def _span(code: str) -> Tuple[int, int]:
+    """First and last 10-digit code beginning with `code`."""
+    return int(code.ljust(10, "0")), int(code.ljust(10, "9"))
+
+
+def _listed(entries: Tuple[Entry, ...], with_description: bool = True) -> str:
+    shown = [f"{e.label} {e.description}" if with_description else e.label for e in entries[:MAX_LISTED]]
+    if len(entries) > MAX_LISTED:
+        shown.append(f"… and {len(entries) - MAX_LISTED} more")
+    return "; ".join(shown)
+
+
+def format_matches(index: CNIndex, matches: List[Match]) -> str:
+    rows = ["| Query | CBAM | Annex I entry | Category (gases) |", "|---|---|---|---|"]
+    for m in matches:
+        e = m.entry
+        if m.status == INVALID:
+            rows.append(f"| {m.query} | invalid: {m.error} | | |")
+        elif m.status == NOT_COVERED:
+            rows.append(f"| {m.query} | no | — | |")
+        elif m.status == PARTLY or e is None:
+            categories = sorted({x.category for x in m.entries})
+            rows.append(f"| {m.query} | {m.status} | {_listed(m.entries)} | {', '.join(categories)} |")
+        else:
+            status = "no (excluded)" if m.status == EXCLUDED else "yes"
+            if m.entries:
+                status += f", except {_listed(m.entries, False)}"
+            described = f"{e.label} {e.description}" + (f" ({e.note})" if e.note else "")
+            category = f"{e.category} ({', '.join(e.gases)})" if e.gases else e.category
+            rows.append(f"| {m.query} | {status} | {described} | {category} |")
+    return "\n".join(rows) + f"\n\n**Source: CBAM Annex I (Regulation (EU) 2023/956), CN index v{index.version}**"
+
+
+# Loaded once at startup (the server imports this module through agent.py)
+cn_index = CNIndex.load(CN_INDEX_PATH)
+
+
+@tool
+def lookup_cn_codes(codes: List[str]) -> str:
+    """
+    Checks whether CN/HS codes are covered by CBAM (Annex I) and returns the Annex I entry, goods category
+    and greenhouse gases. Answers instantly from a local table. It has no default values: use retrieve_cbam_info.
+
+    Use this tool for ANY CN/HS code scope or "is code X covered?" question instead of retrieve_cbam_info.
+    Pass all codes in one call: full codes ("7208 51 20"), headings or prefixes ("7202", "76") or ranges ("7208-7212").
+    """
+    return format_matches(cn_index, cn_index.resolve_many(codes))
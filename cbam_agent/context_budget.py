@@ -0,0 +1,195 @@
+"""
+Context-budget stage run by `chatbot` before every LLM call.
+
+Long-lived threads (logged-in `client-<email>` sessions) would otherwise resend their whole
+history, raw Pinecone dumps included, on every turn. This stage:
+- counts tokens (local estimate, no API call)
+- keeps a sliding window of the most recent turns
+- compacts tool results outside the current turn
+- folds turns that leave the window into a rolling summary kept in the graph state
+
+Configured with CONTEXT_* environment variables (see `ContextBudget.from_env`).
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_PREFIX = "SUMMARY OF EARLIER CONVERSATION (older turns, condensed):\n"
+
+
+def message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    text = str(content)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        text += "".join(f"{call['name']}({call['args']})" for call in message.tool_calls)
+    return text
+
+
+# Token counts of long-lived messages (the prompt prefix, see prompt_cache.py), counted once
+_static_tokens: Dict[int, Tuple[BaseMessage, int]] = {}
+
+
+def register_static_message(message: BaseMessage):
+    _static_tokens[id(message)] = (message, len(message_text(message)) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS)
+
+
+def message_tokens(message: BaseMessage) -> int:
+    static = _static_tokens.get(id(message))
+    if static is not None and static[0] is message:
+        return static[1]
+    return len(message_text(message)) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    """~4 characters per token plus a small per-message overhead; close enough for budgeting."""
+    return sum(message_tokens(m) for m in messages)
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Groups messages into turns, each starting at a HumanMessage (tool calls stay with their results)."""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def compact_tool_result(message: BaseMessage, max_chars: int) -> BaseMessage:
+    if not isinstance(message, ToolMessage) or len(message_text(message)) <= max_chars:
+        return message
+    text = message_text(message)
+    return message.model_copy(update={"content": text[:max_chars] + f" [...compacted, {len(text) - max_chars} chars omitted]"})
+
+
+def extractive_summary(previous: str, turns: List[List[BaseMessage]], max_chars: int = 2000) -> str:
+    """Local summary: one line per dropped turn (question + start of the answer). Keeps the most recent lines."""
+    lines = previous.splitlines() if previous else []
+    for turn in turns:
+        question = next((message_text(m) for m in turn if isinstance(m, HumanMessage)), "")
+        answer = next((message_text(m) for m in reversed(turn) if isinstance(m, AIMessage) and not m.tool_calls), "")
+        lines.append(f"- User: {question[:200]} | Assistant: {answer[:300]}".replace("\n", " "))
+    while lines and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+@dataclass
+class ContextMetrics:
+    """Tokens sent per LLM call, before and after the budget stage."""
+    calls: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+    summaries: int = 0
+    last: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, before: int, after: int):
+        self.calls += 1
+        self.tokens_before += before
+        self.tokens_after += after
+        self.last = {"tokens_before": before, "tokens_after": after}
+
+    def snapshot(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "avg_tokens_before": round(self.tokens_before / self.calls, 1) if self.calls else 0,
+            "avg_tokens_after": round(self.tokens_after / self.calls, 1) if self.calls else 0,
+            "tokens_saved": self.tokens_before - self.tokens_after,
+            "summaries": self.summaries,
+            "last": self.last,
+        }
+
+
+context_metrics = ContextMetrics()
+
+
+@dataclass
+class ContextBudget:
+    max_tokens: int = 8000
+    window_turns: int = 6
+    tool_result_chars: int = 1500
+    summary_mode: str = "extractive"  # extractive | llm | off
+
+    @classmethod
+    def from_env(cls) -> "ContextBudget":
+        """
+        CONTEXT_MAX_TOKENS: token budget for the history sent to the LLM (default 8000)
+        CONTEXT_WINDOW_TURNS: most recent user turns kept verbatim (default 6)
+        CONTEXT_TOOL_RESULT_CHARS: cap for tool results outside the current turn (default 1500)
+        CONTEXT_SUMMARY: extractive (default) | llm | off
+        """
+        return cls(
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "8000")),
+            window_turns=int(os.getenv("CONTEXT_WINDOW_TURNS", "6")),
+            tool_result_chars=int(os.getenv("CONTEXT_TOOL_RESULT_CHARS", "1500")),
+            summary_mode=os.getenv("CONTEXT_SUMMARY", "extractive").lower(),
+        )
+
+    async def apply(
+        self,
+        messages: List[BaseMessage],
+        summary: str = "",
+        summary_upto: int = 0,
+        summarize: Optional[Callable[[str, List[List[BaseMessage]]], Awaitable[str]]] = None,
+    ) -> Tuple[List[BaseMessage], Optional[Dict]]:
+        """
+        Returns (messages to send, state update or None).
+        `summary_upto` counts the non-system messages already folded into `summary`.
+        `summarize` is used when summary_mode is "llm".
+        """
+        system = []
+        for message in messages:
+            if not isinstance(message, SystemMessage):
+                break
+            system.append(message)
+        history = messages[len(system):]
+        turns = split_turns(history)
+
+        # Sliding window, then drop more of the oldest turns while over budget (never the current one)
+        keep = min(len(turns), self.window_turns)
+        while True:
+            kept = turns[len(turns) - keep:]
+            compacted = [[compact_tool_result(m, self.tool_result_chars) for m in t] for t in kept[:-1]] + kept[-1:]
+            trimmed = [m for t in compacted for m in t]
+            if keep <= 1 or estimate_tokens(system + trimmed) + len(summary) // CHARS_PER_TOKEN <= self.max_tokens:
+                break
+            keep -= 1
+
+        # Fold newly dropped turns into the rolling summary
+        dropped_count = sum(len(t) for t in turns[:len(turns) - keep])
+        update = None
+        if self.summary_mode != "off" and dropped_count > summary_upto:
+            new_turns = split_turns(history[summary_upto:dropped_count])
+            if self.summary_mode == "llm" and summarize is not None:
+                summary = await summarize(summary, new_turns)
+            else:
+                summary = extractive_summary(summary, new_turns)
+            update = {"summary": summary, "summary_upto": dropped_count}
+            context_metrics.summaries += 1
+
+        # Still too big with a single turn: squeeze its tool results into what is left
+        if keep == 1 and estimate_tokens(system + trimmed) > self.max_tokens:
+            spare_chars = max(self.max_tokens - estimate_tokens(system), 0) * CHARS_PER_TOKEN
+            trimmed = [compact_tool_result(m, max(spare_chars // 2, 200)) for m in trimmed]
+
+        summary_messages = [SystemMessage(content=SUMMARY_PREFIX + summary)] if summary and self.summary_mode != "off" and dropped_count else []
+        result = system + summary_messages + trimmed
+        context_metrics.record(estimate_tokens(messages), estimate_tokens(result))
+        return result, update
+
+
+async def llm_summarize(llm, previous: str, turns: List[List[BaseMessage]]) -> str:
+    """Rolling summary written by the (tool-less) model; used when CONTEXT_SUMMARY=llm."""
+    transcript = "\n".join(f"{m.type}: {message_text(m)[:1500]}" for t in turns for m in t)
+    response = await llm.ainvoke([
+        SystemMessage(content="Update the running summary of a CBAM compliance conversation. "
+                              "Keep facts, figures, CN codes, dates and the user's goals. At most 200 words."),
+        HumanMessage(content=f"Current summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}"),
+    ])
+    return message_text(response)
@@ -0,0 +1,137 @@
+"""
+Deterministic fast path for CBAM deadline/timeline questions.
+
+`route_timeline_question()` classifies the input with a few patterns and, when confident,
+answers straight from the deadline table below evaluated against today's date (no LLM call).
+Anything it is not sure about returns None and goes through the full graph.
+
+The table mirrors "CRITICAL FACTS (2025-2026)" in SYSTEM_PROMPT; keep the two in sync.
+"""
+import datetime
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+SOURCE_LINE = "**Source: Critical Facts (System Prompt - December 2025)**"
+
+
+@dataclass(frozen=True)
+class Deadline:
+    label: str
+    date: datetime.date
+    kind: str  # "report" | "phase"
+    quarter: Optional[str] = None  # e.g. "Q1 2025"
+
+
+DEADLINES: List[Deadline] = [
+    Deadline("Q4 2024 Report Deadline", datetime.date(2025, 1, 31), "report", "Q4 2024"),
+    Deadline("Q1 2025 Report Deadline", datetime.date(2025, 4, 30), "report", "Q1 2025"),
+    Deadline("Q2 2025 Report Deadline", datetime.date(2025, 7, 31), "report", "Q2 2025"),
+    Deadline("Q3 2025 Report Deadline", datetime.date(2025, 10, 31), "report", "Q3 2025"),
+    Deadline("Q4 2025 Report Deadline", datetime.date(2026, 1, 31), "report", "Q4 2025"),
+    Deadline("Definitive Phase begins (importers must purchase CBAM certificates)", datetime.date(2026, 1, 1), "phase"),
+]
+
+DEFINITIVE_PHASE_START = next(d.date for d in DEADLINES if d.kind == "phase")
+
+# --- Classification ---
+DEADLINE_WORDS = r"(deadline|due|submit|submission|report(ing)?|file|filing)"
+# Only questions that explicitly ask when a report is due: "report" alone is also a verb ("when will the
+# Commission report...") and "due"/"submit" also apply to declarant applications
+NEXT_DEADLINE = re.compile(
+    r"\b(next|upcoming|coming|nearest|when)\b.*\breport(s|ing)?\b.*\b(deadline|due)\b"
+    r"|\b(next|upcoming|coming|nearest|when)\b.*\b(deadline|due)\b.*\b(for|of) (the |my |our )?(next |quarterly |cbam )*report(s|ing)?\b"
+    r"|\bwhen\b.*\b(submit|file)\b.*\b(next |quarterly |cbam )*report\b"
+    r"|^(what is |what's |when is )?(the |my )?(next|upcoming) (cbam )?deadline\W*$"
+)
+# Two questions in one ("...due and what must it include?"): the graph answers both
+COMPOUND = re.compile(r"\b(and|also|plus)\s+(what|which|how|who|why|where|is|are|do|does|must|should|can)\b|\?\s*\w")
+QUARTER = re.compile(r"\b(q([1-4])|(first|second|third|fourth) quarter)\b\s*(of\s*)?(20\d\d)?")
+DEFINITIVE_START = re.compile(r"\b(definitive (phase|period)|buy(ing)? (cbam )?certificates|purchas\w* (cbam )?certificates)\b.*\b(start|begin|commence|when|date)\w*|\b(when|date)\b.*\b(definitive (phase|period))|\bwhen\b.*\b(start|begin)\w* (buying|purchas\w*) (cbam )?certificates")
+TRANSITIONAL_END = re.compile(r"\btransitional (phase|period)\b.*\b(end|finish|over|until|last)\w*|\b(when|date)\b.*\btransitional (phase|period)\b.*\b(end|finish|over)\w*")
+# Questions that merely mention a deadline but need reasoning or retrieval
+DISQUALIFIERS = re.compile(
+    r"\b(calculat\w*|emission\w*|penalt\w*|fine[sd]?|miss(ed)?|late|extension|exempt\w*|threshold|hs|cn|code|"
+    r"compare|comparison|differen\w*|why|how (do|to|should|can)|what happens|if i|consequence\w*|verify|verification|"
+    r"installation|default value\w*|surrender\w*|steel|aluminium|aluminum|cement|fertili[sz]er\w*|hydrogen|electricity)\b"
+)
+
+QUARTER_WORDS = {"first": "1", "second": "2", "third": "3", "fourth": "4"}
+
+
+@dataclass
+class RoutedAnswer:
+    intent: str
+    answer: str
+
+
+def _fmt(date: datetime.date) -> str:
+    return date.strftime("%B %d, %Y").replace(" 0", " ")
+
+
+def _answer_next_deadline(today: datetime.date) -> Optional[str]:
+    reports = [d for d in DEADLINES if d.kind == "report"]
+    upcoming = [d for d in reports if d.date >= today]
+    if not upcoming:
+        # Past the end of the known schedule: let the model (and the knowledge base) handle it
+        return None
+    nxt = upcoming[0]
+    passed = [d for d in reports if d.date < today]
+    lines = [f"**Next deadline: {nxt.label} — {_fmt(nxt.date)}** ({(nxt.date - today).days} days from today, {_fmt(today)})."]
+    if passed:
+        lines.append("")
+        lines.append("Already passed: " + ", ".join(f"{d.quarter} ({_fmt(d.date)})" for d in passed) + ".")
+    lines.append("")
+    lines.append("Reporting is quarterly during the transitional phase (through 2025); the definitive phase begins January 1, 2026.")
+    return "\n".join(lines)
+
+
+def _answer_quarter(quarter: str, today: datetime.date) -> Optional[str]:
+    deadline = next((d for d in DEADLINES if d.quarter == quarter), None)
+    if deadline is None:
+        return None
+    status = "PASSED" if deadline.date < today else "UPCOMING"
+    return f"**{deadline.label}: {_fmt(deadline.date)}** — {status} as of {_fmt(today)}."
+
+
+def _answer_definitive(today: datetime.date) -> str:
+    tense = "began" if today >= DEFINITIVE_PHASE_START else "begins"
+    return (f"**The CBAM definitive phase {tense} on {_fmt(DEFINITIVE_PHASE_START)}.** "
+            "From then on, importers must purchase CBAM certificates.")
+
+
+def _answer_transitional_end(today: datetime.date) -> str:
+    tense = "ended" if today >= DEFINITIVE_PHASE_START else "ends"
+    return (f"**The transitional phase continues throughout 2025 and {tense} on December 31, 2025**; "
+            f"the definitive phase begins {_fmt(DEFINITIVE_PHASE_START)}. "
+            "The last quarterly report (Q4 2025) is due January 31, 2026.")
+
+
+def route_timeline_question(text: str, today: Optional[datetime.date] = None) -> Optional[RoutedAnswer]:
+    """Returns a RoutedAnswer for confidently-classified timeline questions, else None."""
+    today = today or datetime.date.today()
+    q = " ".join(text.lower().split())
+    if len(q) > 200 or DISQUALIFIERS.search(q) or COMPOUND.search(q):
+        return None
+
+    quarter_match = QUARTER.search(q)
+    if quarter_match and re.search(rf"\b{DEADLINE_WORDS}\b|\bwhen\b", q):
+        number = quarter_match.group(2) or QUARTER_WORDS.get(quarter_match.group(3) or "")
+        year = quarter_match.group(5)
+        if number and year:
+            answer = _answer_quarter(f"Q{number} {year}", today)
+            if answer:
+                return RoutedAnswer("quarter_deadline", f"{answer}\n\n{SOURCE_LINE}")
+        return None
+
+    for intent, pattern, build in (
+        ("definitive_phase_start", DEFINITIVE_START, _answer_definitive),
+        ("transitional_phase_end", TRANSITIONAL_END, _answer_transitional_end),
+        ("next_deadline", NEXT_DEADLINE, _answer_next_deadline),
+    ):
+        if pattern.search(q):
+            answer = build(today)
+            if answer is None:
+                return None
+            return RoutedAnswer(intent, f"{answer}\n\n{SOURCE_LINE}")
+    return None
@@ -0,0 +1,111 @@
+"""
+Embedded-emissions calculator for `calculate_cbam_emissions`.
+
+The model passes structured product lines instead of doing the arithmetic in free text;
+all lines are computed at once with NumPy and returned as a compact Markdown table to cite.
+
+Per line (quantities in tonnes of goods, emissions in tCO2e):
+    embedded          = total emissions, or quantity x specific embedded emissions (SEE)
+    SEE               = embedded / quantity
+    chargeable        = max(embedded - quantity x free allocation per tonne, 0)
+    certificates      = chargeable x (1 - min(carbon price paid at origin, certificate price) / certificate price)
+    cost (EUR)        = certificates x certificate price
+One CBAM certificate covers one tCO2e; the total to surrender is rounded up to a whole certificate.
+"""
+import math
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.tools import tool
+from pydantic import BaseModel, Field
+
+SOURCE_LINE = "**Source: CBAM calculator (Regulation (EU) 2023/956, Art. 21-22 and Annex IV)**"
+
+
+class ProductLine(BaseModel):
+    product: str = Field(description="Product or CN code, e.g. 'steel' or '7208'")
+    quantity_tonnes: float = Field(description="Imported quantity in tonnes")
+    total_emissions_tco2e: Optional[float] = Field(None, description="Total embedded emissions of the line in tCO2e")
+    specific_emissions: Optional[float] = Field(None, description="Specific embedded emissions in tCO2e per tonne (used if total is not given)")
+    free_allocation_per_tonne: float = Field(0.0, ge=0, description="EU ETS free allocation still deductible, tCO2e per tonne")
+    carbon_price_paid_eur: float = Field(0.0, ge=0, description="Effective carbon price already paid in the country of origin, EUR per tCO2e")
+
+
+def calculate(lines: List[ProductLine], certificate_price_eur: Optional[float] = None) -> dict:
+    """Vectorised computation over all lines. Raises ValueError on inconsistent input."""
+    if not lines:
+        raise ValueError("no product lines given")
+    for line in lines:
+        if line.total_emissions_tco2e is None and line.specific_emissions is None:
+            raise ValueError(f"'{line.product}': give total_emissions_tco2e or specific_emissions")
+    if certificate_price_eur is not None and certificate_price_eur <= 0:
+        raise ValueError("certificate_price_eur must be positive")
+
+    quantity = np.array([l.quantity_tonnes for l in lines], dtype=np.float64)
+    if (quantity <= 0).any():
+        raise ValueError("quantity_tonnes must be positive")
+    total = np.array([np.nan if l.total_emissions_tco2e is None else l.total_emissions_tco2e for l in lines])
+    see = np.array([np.nan if l.specific_emissions is None else l.specific_emissions for l in lines])
+    free_allocation = np.array([l.free_allocation_per_tonne for l in lines])
+    paid = np.array([l.carbon_price_paid_eur for l in lines])
+    if (np.nan_to_num(total) < 0).any() or (np.nan_to_num(see) < 0).any():
+        raise ValueError("emissions must not be negative")
+
+    embedded = np.where(np.isnan(total), quantity * see, total)
+    see = embedded / quantity
+    chargeable = np.maximum(embedded - quantity * free_allocation, 0.0)
+
+    result = {
+        "product": [l.product for l in lines],
+        "quantity": quantity,
+        "see": see,
+        "embedded": embedded,
+        "chargeable": chargeable,
+        "certificates": chargeable,
+        "cost": None,
+        "price": certificate_price_eur,
+    }
+    if certificate_price_eur is not None:
+        deduction = np.minimum(paid, certificate_price_eur) / certificate_price_eur
+        result["certificates"] = chargeable * (1.0 - deduction)
+        result["cost"] = result["certificates"] * certificate_price_eur
+    elif paid.any():
+        raise ValueError("certificate_price_eur is needed to deduct a carbon price paid at origin")
+    return result
+
+
+def format_table(result: dict) -> str:
+    with_cost = result["cost"] is not None
+    header = "| Product | Quantity (t) | SEE (tCO2e/t) | Embedded (tCO2e) | Certificates |" + (" Cost (EUR) |" if with_cost else "")
+    rule = "|---|---:|---:|---:|---:|" + ("---:|" if with_cost else "")
+    rows = [header, rule]
+    for i, product in enumerate(result["product"]):
+        row = (f"| {product} | {result['quantity'][i]:,.2f} | {result['see'][i]:,.4f} | "
+               f"{result['embedded'][i]:,.2f} | {result['certificates'][i]:,.2f} |")
+        rows.append(row + (f" {result['cost'][i]:,.2f} |" if with_cost else ""))
+    certificates = float(result["certificates"].sum())
+    total = (f"| **Total** | {result['quantity'].sum():,.2f} | | {result['embedded'].sum():,.2f} | "
+             f"{certificates:,.2f} |")
+    rows.append(total + (f" {result['cost'].sum():,.2f} |" if with_cost else ""))
+
+    notes = [f"Certificates to surrender (rounded up): {math.ceil(round(certificates, 6)):,}"]
+    if with_cost:
+        notes.append(f"Certificate price used: EUR {result['price']:,.2f}/tCO2e")
+    else:
+        notes.append("No certificate price given: cost not computed")
+    return "\n".join(rows) + "\n\n" + "\n".join(notes) + f"\n\n{SOURCE_LINE}"
+
+
+@tool
+def calculate_cbam_emissions(lines: List[ProductLine], certificate_price_eur: Optional[float] = None) -> str:
+    """
+    Calculates specific embedded emissions (SEE), CBAM certificates and cost for one or more product lines.
+
+    Use this tool for ANY emissions, certificate or cost arithmetic instead of calculating yourself,
+    then cite the returned table. Each line needs quantity_tonnes plus total_emissions_tco2e or specific_emissions.
+    Pass certificate_price_eur (EUR per tCO2e) to get costs and deduct carbon prices paid at origin.
+    """
+    try:
+        return format_table(calculate(lines, certificate_price_eur))
+    except ValueError as e:
+        return f"Error: {e}"
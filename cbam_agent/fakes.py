@@ -0,0 +1,228 @@
+"""
+Offline stand-ins for Gemini and the Pinecone tool.
+Used by the benchmark and test scripts so they run without API keys or network.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import tool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Provider-side prefix cache shared by all FakeChatModels with `prefix_caching` (block hash chains)
+PREFIX_BLOCK_CHARS = 512
+_cached_prefix_blocks = set()
+# Calls in flight at the shared fake provider (see FakeChatModel.capacity)
+_provider_inflight = 0
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model with a configurable latency.
+    On a fresh user turn it asks for `retrieve_cbam_info` (if `use_tools` and tools were bound), `tool_rounds` times in a row,
+    and answers once the last tool result is in. `tool_mode` "parallel" asks for all `tool_rounds` lookups in one turn,
+    "multi" for one `retrieve_cbam_multi` call with `tool_rounds` sub-queries, "codes" for one `lookup_cn_codes` call
+    with the CN codes found in the question.
+    `latency` is the time to the first token; `token_latency` is added per further token of the answer.
+    With `error` set, every call fails with that message after `latency` (a provider outage or 429).
+    Replies carry usage_metadata (~4 characters per token, tool schema included). With `prefix_caching`
+    the fake behaves like implicit provider caching: leading 512-character blocks already seen in an
+    earlier request count as cache_read, and `prefill_latency` is paid per uncached input token.
+    With `capacity`, the provider serves that many calls at full speed; beyond it, all calls in flight
+    share it and every one of them slows down (an overloaded backend, as seen by load tests).
+    """
+    latency: float = 0.05
+    token_latency: float = 0.0
+    use_tools: bool = True
+    tool_rounds: int = 1
+    tool_mode: str = "sequential"  # sequential | parallel | multi | codes
+    error: Optional[str] = None
+    tools_bound: bool = False
+    tool_schema: str = ""
+    prefix_caching: bool = False
+    prefill_latency: float = 0.0
+    capacity: int = 0
+    answer: str = "CBAM is the EU Carbon Border Adjustment Mechanism. **Source: Pinecone Knowledge Base**"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        schema = json.dumps([convert_to_openai_tool(t) for t in tools], sort_keys=True) if tools else ""
+        return self.model_copy(update={"tools_bound": bool(tools), "tool_schema": schema})
+
+    def _usage(self, messages: List[BaseMessage], reply: AIMessage) -> dict:
+        request = self.tool_schema + "".join(f"{m.type}: {m.content}\n" for m in messages)
+        cached_chars = 0
+        if self.prefix_caching:
+            digest, chain = b"", []
+            for end in range(PREFIX_BLOCK_CHARS, len(request) + 1, PREFIX_BLOCK_CHARS):
+                digest = hashlib.sha1(digest + request[end - PREFIX_BLOCK_CHARS:end].encode()).digest()
+                chain.append(digest)
+            for digest in chain:
+                if digest not in _cached_prefix_blocks:
+                    break
+                cached_chars += PREFIX_BLOCK_CHARS
+            _cached_prefix_blocks.update(chain)
+        input_tokens, output_tokens = len(request) // 4, len(str(reply.content)) // 4
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens,
+                "input_token_details": {"cache_read": cached_chars // 4}}
+
+    def _respond(self, messages: List[BaseMessage]):
+        """The reply (with usage) and the time to its first token."""
+        reply = self._reply(messages)
+        reply.usage_metadata = self._usage(messages, reply)
+        uncached = reply.usage_metadata["input_tokens"] - reply.usage_metadata["input_token_details"]["cache_read"]
+        return reply, self.latency + self.prefill_latency * uncached
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        turn = next((i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], HumanMessage)), None)
+        if self.use_tools and self.tools_bound and turn is not None:
+            rounds = sum(isinstance(m, ToolMessage) for m in messages[turn + 1:])
+            question = str(messages[turn].content)
+            if self.tool_mode != "sequential":
+                if rounds:
+                    return AIMessage(content=self.answer)
+                parts = [f"{question} (part {i + 1})" for i in range(self.tool_rounds)]
+                if self.tool_mode == "multi":
+                    calls = [("retrieve_cbam_multi", {"question": question, "sub_queries": parts})]
+                elif self.tool_mode == "codes":
+                    calls = [("lookup_cn_codes", {"codes": re.findall(r"\d{4}(?:[ .]?\d{2}){0,3}", question)})]
+                else:
+                    calls = [("retrieve_cbam_info", {"query": part}) for part in parts]
+                return AIMessage(content="", tool_calls=[
+                    {"name": name, "args": args, "id": f"call_{len(messages)}_{i}"} for i, (name, args) in enumerate(calls)
+                ])
+            if rounds < self.tool_rounds and isinstance(messages[-1], (HumanMessage, ToolMessage)):
+                query = question + (f" (part {rounds + 1})" if rounds else "")
+                return AIMessage(
+                    content="",
+                    tool_calls=[{
+                        "name": "retrieve_cbam_info",
+                        "args": {"query": query},
+                        "id": f"call_{len(messages)}",
+                    }],
+                )
+        return AIMessage(content=self.answer)
+
+    def _raise(self):
+        if self.error:
+            raise RuntimeError(self.error)
+
+    def _total_latency(self, reply: AIMessage, first_token: float) -> float:
+        tokens = len(str(reply.content).split())
+        return first_token + self.token_latency * max(tokens - 1, 0)
+
+    async def _wait(self, seconds: float):
+        """Sleeps for `seconds` of provider time, stretched while more than `capacity` calls are in flight."""
+        if not self.capacity:
+            await asyncio.sleep(seconds)
+            return
+        global _provider_inflight
+        _provider_inflight += 1
+        try:
+            while seconds > 0:
+                share = min(1.0, self.capacity / _provider_inflight)
+                step = min(seconds / share, 0.05)
+                await asyncio.sleep(step)
+                seconds -= step * share
+        finally:
+            _provider_inflight -= 1
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        reply, first_token = self._respond(messages)
+        time.sleep(self._total_latency(reply, first_token))
+        self._raise()
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        reply, first_token = self._respond(messages)
+        await self._wait(self._total_latency(reply, first_token))
+        self._raise()
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        reply, first_token = self._respond(messages)
+        await self._wait(first_token)
+        self._raise()
+        if reply.tool_calls:
+            tool_call_chunks = [{"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i} for i, c in enumerate(reply.tool_calls)]
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=tool_call_chunks,
+                                                             usage_metadata=reply.usage_metadata))
+            return
+        for i, word in enumerate(str(reply.content).split(" ")):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word,
+                                                               usage_metadata=reply.usage_metadata if i == 0 else None))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def make_fake_retriever(latency: float = 0.1):
+    """Returns a `retrieve_cbam_info` tool that sleeps for `latency` seconds instead of calling Pinecone."""
+
+    @tool
+    async def retrieve_cbam_info(query: str) -> str:
+        """Queries the (fake) Pinecone Assistant for CBAM information."""
+        await asyncio.sleep(latency)
+        return f"Stub passage for: {query}"
+
+    return retrieve_cbam_info
+
+
+class FakePineconeClient:
+    """
+    Stands in for `agent.pinecone_client`: same `chat(payload)` contract, fixed latency, no network.
+    With `citations`, responses carry that many Assistant-style citations (file metadata, signed URL,
+    page list, highlight), as with include_highlights. `shape="unexpected"` nests the answer in a
+    structure `retrieve_cbam_info` does not know (formerly sent on as a JSON dump).
+    """
+
+    def __init__(self, latency: float = 0.1, answer_chars: int = 1200, citations: int = 0,
+                 highlight_chars: int = 600, shape: str = "message"):
+        self.latency = latency
+        self.answer_chars = answer_chars
+        self.citations = citations
+        self.highlight_chars = highlight_chars
+        self.shape = shape
+        self.calls = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def _citation(self, query: str, i: int) -> dict:
+        name = f"cbam_source_{i % 3}.pdf"
+        highlight = (f"Highlighted regulation text {i} on {query}. " * (self.highlight_chars // 40 + 1))[:self.highlight_chars]
+        return {"position": 100 * i, "references": [{
+            "file": {"status": "Available", "id": f"file-{i % 3:04d}-" + "0" * 28, "name": name, "size": 1843921,
+                     "metadata": {"source": "EUR-Lex", "language": "en"}, "percent_done": 1.0, "error_message": None,
+                     "created_on": "2025-01-10T09:12:44.000Z", "updated_on": "2025-06-02T14:03:11.000Z",
+                     "signed_url": f"https://storage.example.com/{name}?X-Goog-Signature=" + "ab12" * 64},
+            "pages": [i + 1, i + 2],
+            "highlight": {"type": "text", "content": highlight},
+        }]}
+
+    async def chat(self, payload: dict) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        query = payload["messages"][-1]["content"]
+        passage = (f"Stub Pinecone passage for: {query}. " * (self.answer_chars // 40 + 1))[:self.answer_chars]
+        data = {"id": "0000000000000000" + str(self.calls), "model": "gpt-4o", "finish_reason": "stop",
+                "message": {"role": "assistant", "content": passage},
+                "citations": [self._citation(query, i) for i in range(self.citations)],
+                "usage": {"prompt_tokens": 9000, "completion_tokens": self.answer_chars // 4, "total_tokens": 9300}}
+        if self.shape == "unexpected":
+            data["result"] = {"output": [{"type": "answer", "text": data.pop("message")["content"]}]}
+        return data
@@ -0,0 +1,98 @@
+"""
+Builds the local CBAM knowledge index from regulation PDFs and text files.
+
+Usage:
+    python ingest.py docs/*.pdf docs/*.txt --out cbam_index
+    python ingest.py guidance.md --date 2025-02-26 --out cbam_index
+
+The document date is taken from --date, else from an ISO date or "of 17 May 2023"-style
+date in the file name or first page, so the Date Hierarchy rule can rank newer documents.
+PDF support needs `pypdf` (pip install pypdf).
+"""
+import argparse
+import datetime
+import os
+import re
+import time
+from typing import List, Optional
+
+from local_index import Chunk, build_index
+
+MONTHS = {m: i for i, m in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december"], 1)}
+ISO_DATE = re.compile(r"(20\d\d)[-_.](\d\d)[-_.](\d\d)")
+LEGAL_DATE = re.compile(r"\b(\d{1,2}) (" + "|".join(MONTHS) + r") (20\d\d)\b", re.IGNORECASE)
+
+
+def read_document(path: str) -> str:
+    if path.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise SystemExit("PDF ingestion needs pypdf: pip install pypdf")
+        return "\n\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def detect_date(path: str, text: str) -> Optional[str]:
+    for candidate in (os.path.basename(path), text[:3000]):
+        m = ISO_DATE.search(candidate)
+        if m:
+            try:
+                return datetime.date(int(m.group(1)), int(m.group(2)), int(m.group(3))).isoformat()
+            except ValueError:
+                pass
+        m = LEGAL_DATE.search(candidate)
+        if m:
+            return datetime.date(int(m.group(3)), MONTHS[m.group(2).lower()], int(m.group(1))).isoformat()
+    return None
+
+
+def chunk_text(text: str, chunk_words: int = 200, overlap_words: int = 40) -> List[str]:
+    """Paragraph-aware word windows: paragraphs are packed up to `chunk_words`, with `overlap_words` carried over."""
+    if chunk_words <= 0 or not 0 <= overlap_words < chunk_words:
+        raise ValueError(f"need 0 <= overlap_words < chunk_words, got {overlap_words} and {chunk_words}")
+    paragraphs = [" ".join(p.split()) for p in re.split(r"\n\s*\n", text) if p.strip()]
+    chunks: List[str] = []
+    current: List[str] = []
+    for paragraph in paragraphs:
+        words = paragraph.split()
+        while words:
+            room = chunk_words - len(current)
+            current.extend(words[:room])
+            words = words[room:]
+            if len(current) >= chunk_words:
+                chunks.append(" ".join(current))
+                current = current[-overlap_words:] if overlap_words else []
+    if current and (not chunks or len(current) > overlap_words):
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="PDF, .txt or .md files")
+    parser.add_argument("--out", default=os.getenv("LOCAL_INDEX_PATH", "cbam_index"))
+    parser.add_argument("--date", help="document date (YYYY-MM-DD) applied to all inputs")
+    parser.add_argument("--chunk-words", type=int, default=200)
+    parser.add_argument("--overlap-words", type=int, default=40)
+    args = parser.parse_args()
+    if args.chunk_words <= 0 or not 0 <= args.overlap_words < args.chunk_words:
+        parser.error("need 0 <= --overlap-words < --chunk-words")
+
+    start = time.perf_counter()
+    chunks: List[Chunk] = []
+    for path in args.paths:
+        text = read_document(path)
+        date = args.date or detect_date(path, text)
+        pieces = chunk_text(text, args.chunk_words, args.overlap_words)
+        chunks.extend(Chunk(piece, os.path.basename(path), date) for piece in pieces)
+        print(f"{path}: {len(pieces)} chunks (date: {date or 'unknown'})")
+
+    build_index(chunks, args.out)
+    print(f"Indexed {len(chunks)} chunks into {args.out} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
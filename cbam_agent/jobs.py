@@ -0,0 +1,259 @@
+"""
+Asynchronous job queue for long agent runs (POST /jobs, GET /jobs/{id}, DELETE /jobs/{id}).
+
+Jobs live in a SQLite table that doubles as the queue: the HTTP tier only inserts rows, and
+workers (in the server process, or separate `python jobs.py worker` processes pointed at the
+same JOBS_PATH) claim them atomically, run the agent and write the result back.
+A claimed job holds a lease that its worker renews; if a worker dies the lease runs out and
+the job is queued again. Separate worker processes need CHECKPOINT_BACKEND=sqlite on a shared
+CHECKPOINT_PATH so sessions see the same history. On shutdown a pool drains: it stops claiming,
+lets running jobs finish for a grace period and hands any still running back to the queue.
+
+Job status: queued -> running -> done | failed | cancelled
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+JOB_COLUMNS = ("id", "status", "input", "session_id", "output", "error", "created_at", "started_at",
+               "finished_at", "worker", "attempts", "cancel_requested", "lease_until")
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobStore:
+    """SQLite-backed job table and queue. Safe to share across threads and processes."""
+
+    def __init__(self, path: str, lease: float = 60.0, ttl: float = 86400.0, max_attempts: int = 3):
+        self.lease = lease
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT, input TEXT, session_id TEXT, output TEXT, error TEXT, "
+            "created_at REAL, started_at REAL, finished_at REAL, worker TEXT, attempts INTEGER DEFAULT 0, "
+            "cancel_requested INTEGER DEFAULT 0, lease_until REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at)")
+        self._lock = threading.Lock()
+
+    def submit(self, user_input: str, session_id: str) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, input, session_id, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, user_input, session_id, time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Takes the oldest queued job (or one whose worker's lease ran out) and marks it running."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'worker lost too many times', finished_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND cancel_requested = 1",
+                (now, now),
+            )
+            row = self._conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE id = (SELECT id FROM jobs WHERE cancel_requested = 0 AND "
+                "(status = 'queued' OR (status = 'running' AND lease_until < ?)) ORDER BY created_at LIMIT 1) "
+                f"RETURNING {', '.join(JOB_COLUMNS)}",
+                (worker, now, now + self.lease, now),
+            ).fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        """Extends the lease; returns False once cancellation was requested (or the job was taken over)."""
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running' "
+                "RETURNING cancel_requested",
+                (time.time() + self.lease, job_id, worker),
+            ).fetchone()
+        return bool(row) and not row[0]
+
+    def finish(self, job_id: str, worker: str, status: str, output: Optional[str] = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, output = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, output, error, time.time(), job_id, worker),
+            )
+
+    def release(self, job_id: str, worker: str):
+        """Hands a running job back to the queue (worker shutting down), without waiting for the lease."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (job_id, worker),
+            )
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancels a queued job at once; a running one is flagged and stopped by its worker. Returns the new status."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? WHERE id = ? AND status = 'queued'",
+                (now, job_id),
+            )
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def sweep(self) -> int:
+        """Deletes finished jobs older than the TTL."""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) AND finished_at < ?",
+                (*FINISHED, time.time() - self.ttl),
+            )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class JobWorkerPool:
+    """
+    `concurrency` asyncio workers that claim jobs from `store` and run `answer(input, session_id)`.
+    Each running job renews its lease every `poll_interval` seconds and is cancelled when asked to.
+    """
+
+    def __init__(self, store: JobStore, answer: Callable[[str, str], Awaitable[str]], concurrency: int = 2,
+                 poll_interval: float = 0.5, job_timeout: float = 600.0):
+        self.store = store
+        self.answer = answer
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.name = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._workers: List[asyncio.Task] = []
+        self._draining = False
+
+    def start(self):
+        self._draining = False
+        self._workers = [asyncio.create_task(self._loop(f"{self.name}/{i}")) for i in range(self.concurrency)]
+        self._tasks = self._workers + [asyncio.create_task(self._sweep_loop())]
+
+    async def _sweep_loop(self, interval: float = 300.0):
+        while True:
+            await asyncio.to_thread(self.store.sweep)
+            await asyncio.sleep(interval)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._workers = []
+
+    async def drain(self, timeout: float):
+        """Graceful shutdown: claim nothing new, give running jobs `timeout` seconds, then requeue the rest."""
+        self._draining = True
+        busy = [task for task in self._workers if not task.done()]
+        if busy:
+            await asyncio.wait(busy, timeout=timeout)
+        await self.stop()
+
+    async def _loop(self, worker: str):
+        while not self._draining:
+            try:
+                job = await asyncio.to_thread(self.store.claim, worker)
+                if job is None:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                await self.run_job(job, worker)
+            except Exception as e:
+                # A store error must not end the worker; the job's lease runs out and it is retried
+                print(f"Job worker {worker}: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def run_job(self, job: Dict[str, Any], worker: str):
+        from server import content_text
+
+        run = asyncio.create_task(asyncio.wait_for(self.answer(job["input"], job["session_id"]), self.job_timeout))
+        try:
+            while True:
+                done, _ = await asyncio.wait({run}, timeout=self.poll_interval)
+                if done:
+                    break
+                if not await asyncio.to_thread(self.store.renew, job["id"], worker):
+                    run.cancel()
+                    await asyncio.gather(run, return_exceptions=True)
+                    self.store.finish(job["id"], worker, "cancelled")
+                    return
+            # Gemini may answer in content parts; the output column holds text
+            output = content_text(run.result())
+            self.store.finish(job["id"], worker, "done", output=output)
+        except asyncio.CancelledError:
+            # Pool shutdown: hand the job back so another worker (or process) picks it up straight away
+            run.cancel()
+            self.store.release(job["id"], worker)
+            raise
+        except asyncio.TimeoutError:
+            self.store.finish(job["id"], worker, "failed", error=f"no answer within {self.job_timeout:g}s")
+        except Exception as e:
+            self.store.finish(job["id"], worker, "failed", error=str(e))
+
+
+def job_store_from_env() -> JobStore:
+    """
+    JOBS_PATH: SQLite file shared by the HTTP tier and workers (default jobs.db)
+    JOBS_LEASE: seconds a worker may go without renewing a running job (default 60)
+    JOBS_TTL: seconds finished jobs are kept for polling (default 1 day)
+    """
+    return JobStore(
+        os.getenv("JOBS_PATH", "jobs.db"),
+        lease=float(os.getenv("JOBS_LEASE", "60")),
+        ttl=float(os.getenv("JOBS_TTL", "86400")),
+    )
+
+
+async def run_workers(concurrency: int):
+    from server import answer_question, pinecone_client
+
+    store = job_store_from_env()
+    pool = JobWorkerPool(store, answer_question, concurrency=concurrency,
+                         job_timeout=float(os.getenv("JOBS_TIMEOUT", "600")))
+    await pinecone_client.start()
+    pool.start()
+    print(f"Job worker {pool.name}: {concurrency} workers on {os.getenv('JOBS_PATH', 'jobs.db')}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await pool.drain(float(os.getenv("JOBS_DRAIN_TIMEOUT", "30")))
+        await pinecone_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Standalone job worker: python jobs.py worker [--concurrency 4]")
+    parser.add_argument("command", choices=["worker"])
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("JOBS_WORKERS", "2")))
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_workers(args.concurrency))
+    except KeyboardInterrupt:
+        pass
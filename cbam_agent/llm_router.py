@@ -0,0 +1,314 @@
+"""
+Model routing layer used by `create_agent_graph` in place of a single Gemini client.
+
+`RoutedChatModel` is a chat model over an ordered list of backends:
+- per-call deadline (LLM_DEADLINE) covering every attempt, hedges and fallbacks included
+- hedged requests: if the attempt in flight has not answered by its backend's p95
+  (LLM_HEDGE_QUANTILE, LLM_HEDGE_DELAY until LLM_HEDGE_MIN_SAMPLES calls were seen),
+  the next backend is started as well (the same one again if there is only one) and the
+  first answer wins; the loser is cancelled
+- fallback: an error starts the next backend at once; the failing backend cools down
+  (LLM_COOLDOWN, LLM_RATE_LIMIT_COOLDOWN for 429 / quota errors) and is tried last meanwhile
+- per-backend latency stats (GET /stats/llm) set the hedge delays and, with LLM_ROUTING=latency,
+  the order (fastest p50 first; unmeasured backends are tried first to get measured)
+
+When streaming, an attempt counts as answered at its first chunk; later chunks come from the
+winner only, and an error after the first chunk is raised since tokens were already sent.
+Backends are LangChain chat models, so tests and benchmarks route over FakeChatModels.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from cassettes import CassetteChatModel, cassette
+from tracing import llm_attempts, set_attribute, span
+
+# Inner calls run without the caller's callbacks: otherwise streamed tokens of every attempt
+# (hedge losers included) would show up in astream_events next to the router's own
+NO_CALLBACKS = {"callbacks": []}
+
+
+class LLMUnavailable(RuntimeError):
+    """Every backend failed (or the deadline passed) for one call."""
+
+
+def is_rate_limit(error: BaseException) -> bool:
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    text = f"{type(error).__name__} {error}"
+    return any(marker in text for marker in ("429", "RateLimit", "ResourceExhausted", "RESOURCE_EXHAUSTED", "quota"))
+
+
+class BackendStats:
+    """Latency window and outcome counters for one backend, shared by every router using that name."""
+
+    def __init__(self, name: str, window: int = 200):
+        self.name = name
+        self.latencies: deque = deque(maxlen=window)
+        self.calls = self.errors = self.rate_limited = self.timeouts = 0
+        self.hedges = self.hedge_wins = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self.latencies)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def record(self, outcome: str, latency: Optional[float] = None, cooldown: float = 0.0):
+        """outcome: ok | error | rate_limited | timeout | cancelled (a hedge loser)."""
+        with self._lock:
+            self.calls += outcome != "cancelled"
+            if latency is not None:
+                # Losers and timeouts took at least this long; leaving them out would pull the p95 down
+                self.latencies.append(latency)
+            if outcome in ("error", "rate_limited"):
+                self.errors += 1
+                self.rate_limited += outcome == "rate_limited"
+                self.cooldown_until = time.monotonic() + cooldown
+            elif outcome == "timeout":
+                self.timeouts += 1
+            elif outcome == "ok":
+                self.cooldown_until = 0.0
+        llm_attempts.inc(backend=self.name, outcome=outcome)
+
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "samples": len(self.latencies),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "cooldown_s": round(max(0.0, self.cooldown_until - time.monotonic()), 1),
+        }
+
+
+backend_stats: Dict[str, BackendStats] = {}
+_stats_lock = threading.Lock()
+
+
+def stats_for(name: str) -> BackendStats:
+    with _stats_lock:
+        if name not in backend_stats:
+            backend_stats[name] = BackendStats(name)
+        return backend_stats[name]
+
+
+def stats_snapshot() -> Dict[str, Dict[str, Any]]:
+    with _stats_lock:
+        stats = list(backend_stats.values())
+    return {s.name: s.snapshot() for s in stats}
+
+
+class RoutedChatModel(BaseChatModel):
+    """Chat model that routes each call over `backends` (see the module docstring)."""
+    backends: List[Any]
+    names: List[str]
+    deadline: float = 60.0
+    hedge: bool = True
+    hedge_quantile: float = 0.95
+    hedge_delay: float = 10.0
+    hedge_min_samples: int = 20
+    cooldown: float = 30.0
+    rate_limit_cooldown: float = 60.0
+    routing: str = "priority"
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    @property
+    def stats(self) -> List[BackendStats]:
+        return [stats_for(name) for name in self.names]
+
+    def bind_tools(self, tools, **kwargs):
+        # Same names, so the bound copy shares the latency stats of the plain one
+        return self.model_copy(update={"backends": [b.bind_tools(tools, **kwargs) for b in self.backends]})
+
+    def order(self) -> List[int]:
+        """Backend indexes in the order they will be tried for the next call."""
+        stats = self.stats
+        indexes = list(range(len(self.backends)))
+        if self.routing == "latency":
+            def p50(i):
+                value = stats[i].quantile(0.5) if len(stats[i].latencies) >= self.hedge_min_samples else None
+                return (value is not None, value or 0.0, i)
+            indexes.sort(key=p50)
+        # Backends that just failed are kept as a last resort
+        return [i for i in indexes if not stats[i].cooling_down()] + [i for i in indexes if stats[i].cooling_down()]
+
+    def hedge_after(self, i: int) -> float:
+        stats = self.stats[i]
+        if len(stats.latencies) < self.hedge_min_samples:
+            return self.hedge_delay
+        return stats.quantile(self.hedge_quantile)
+
+    async def _route(self, attempt) -> Tuple[int, Any]:
+        """Races `attempt(i)` coroutines per the routing rules; returns (winning backend, result)."""
+        loop = asyncio.get_running_loop()
+        stats = self.stats
+        remaining = self.order()
+        deadline = loop.time() + self.deadline
+        running: Dict[asyncio.Task, Tuple[int, float, bool]] = {}
+        errors: List[str] = []
+        hedged = False
+
+        def launch(i: int, is_hedge: bool):
+            running[asyncio.create_task(attempt(i))] = (i, loop.time(), is_hedge)
+
+        first = remaining.pop(0)
+        launch(first, False)
+        try:
+            while running:
+                wait = deadline - loop.time()
+                hedge_at = None
+                if self.hedge and not hedged and len(running) == 1:
+                    i, started, _ = next(iter(running.values()))
+                    hedge_at = started + self.hedge_after(i)
+                    wait = min(wait, hedge_at - loop.time())
+                done, _ = await asyncio.wait(running, timeout=max(wait, 0.0), return_when=asyncio.FIRST_COMPLETED)
+                now = loop.time()
+                for task in done:
+                    i, started, is_hedge = running.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        stats[i].record("ok", now - started)
+                        stats[i].hedge_wins += is_hedge
+                        set_attribute("backend", self.names[i])
+                        set_attribute("hedged", hedged)
+                        set_attribute("fallbacks", len(errors))
+                        return i, task.result()
+                    limited = is_rate_limit(error)
+                    stats[i].record("rate_limited" if limited else "error",
+                                    cooldown=self.rate_limit_cooldown if limited else self.cooldown)
+                    errors.append(f"{self.names[i]}: {type(error).__name__}: {error}")
+                    print(f"LLM backend {self.names[i]} failed, falling back: {error}")
+                    if remaining and not running:
+                        launch(remaining.pop(0), False)
+                if done:
+                    continue
+                if now >= deadline:
+                    for task, (i, started, _) in running.items():
+                        stats[i].record("timeout", now - started)
+                    errors.append(f"deadline of {self.deadline:g}s exceeded")
+                    break
+                if hedge_at is not None and now >= hedge_at:
+                    hedged = True
+                    target = remaining.pop(0) if remaining else next(iter(running.values()))[0]
+                    stats[target].hedges += 1
+                    launch(target, True)
+        finally:
+            now = loop.time()
+            for task, (i, started, _) in running.items():
+                if not task.done():
+                    task.cancel()
+                    if now < deadline:
+                        stats[i].record("cancelled", now - started)
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        raise LLMUnavailable("No LLM backend answered: " + "; ".join(errors))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        async def attempt(i: int):
+            with span(f"llm:{self.names[i]}"):
+                return await self.backends[i].ainvoke(messages, config=NO_CALLBACKS, stop=stop, **kwargs)
+
+        _, message = await self._route(attempt)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        async def attempt(i: int):
+            with span(f"llm:{self.names[i]}"):
+                stream = self.backends[i].astream(messages, config=NO_CALLBACKS, stop=stop, **kwargs).__aiter__()
+                try:
+                    return stream, await stream.__anext__()
+                except StopAsyncIteration:
+                    return stream, AIMessageChunk(content="")
+                except BaseException:
+                    await stream.aclose()
+                    raise
+
+        loop = asyncio.get_running_loop()
+        end = loop.time() + self.deadline
+        _, (stream, first) = await self._route(attempt)
+        try:
+            chunk = first
+            while True:
+                generation = ChatGenerationChunk(message=chunk)
+                if run_manager:
+                    await run_manager.on_llm_new_token(generation.text, chunk=generation)
+                yield generation
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), max(end - loop.time(), 0.0))
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise LLMUnavailable(f"deadline of {self.deadline:g}s exceeded while streaming") from None
+        finally:
+            await stream.aclose()
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        """Synchronous path: plain fallback in order, no hedging or deadline."""
+        errors = []
+        for i in self.order():
+            start = time.perf_counter()
+            try:
+                message = self.backends[i].invoke(messages, config=NO_CALLBACKS, stop=stop, **kwargs)
+            except Exception as e:
+                limited = is_rate_limit(e)
+                self.stats[i].record("rate_limited" if limited else "error",
+                                     cooldown=self.rate_limit_cooldown if limited else self.cooldown)
+                errors.append(f"{self.names[i]}: {type(e).__name__}: {e}")
+                continue
+            self.stats[i].record("ok", time.perf_counter() - start)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        raise LLMUnavailable("No LLM backend answered: " + "; ".join(errors))
+
+
+def router_from_env(backends: Optional[Sequence[Any]] = None, names: Optional[Sequence[str]] = None) -> RoutedChatModel:
+    """
+    Builds the router from LLM_* variables. Without `backends`, one Gemini client is created per
+    model in LLM_MODELS (comma-separated, in priority order), recorded or replayed with CASSETTE_MODE
+    (see cassettes.py; replay needs no client at all). Hedging is off while a cassette is in use:
+    a hedge would record or replay a second response under the same request key and shift the rest.
+    """
+    if backends is None:
+        names = [m.strip() for m in os.getenv("LLM_MODELS", "gemini-flash-latest").split(",") if m.strip()]
+        if cassette is not None and cassette.replaying:
+            backends = [CassetteChatModel(cassette=cassette, name=name) for name in names]
+        else:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            # Retries inside the client would hide a slow or failing backend from the router
+            retries = int(os.getenv("LLM_MAX_RETRIES", "1"))
+            backends = [ChatGoogleGenerativeAI(model=name, temperature=0, max_retries=retries) for name in names]
+            if cassette is not None:
+                backends = [CassetteChatModel(cassette=cassette, name=name, model=b) for name, b in zip(names, backends)]
+    return RoutedChatModel(
+        backends=list(backends),
+        names=list(names or [f"backend{i}" for i in range(len(backends))]),
+        deadline=float(os.getenv("LLM_DEADLINE", "60")),
+        hedge=os.getenv("LLM_HEDGE", "1") == "1" and cassette is None,
+        hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+        hedge_delay=float(os.getenv("LLM_HEDGE_DELAY", "10")),
+        hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+        cooldown=float(os.getenv("LLM_COOLDOWN", "30")),
+        rate_limit_cooldown=float(os.getenv("LLM_RATE_LIMIT_COOLDOWN", "60")),
+        routing=os.getenv("LLM_ROUTING", "priority").lower(),
+    )
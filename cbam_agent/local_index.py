@@ -0,0 +1,177 @@
+"""
+Local CBAM knowledge index: BM25 inverted index + NumPy vector search, memory-mapped from disk.
+Drop-in offline backend for `retrieve_cbam_info` (RETRIEVAL_BACKEND=local); build it with ingest.py.
+
+On-disk layout (one directory):
+    meta.json          format version, BM25 parameters, vocabulary (term -> id, document frequency)
+    texts.bin          UTF-8 chunk texts, concatenated
+    text_offsets.npy   int64 [n_chunks + 1] byte offsets into texts.bin
+    sources.json       per-chunk source name and document date
+    doc_len.npy        int32 [n_chunks] token counts
+    postings_doc.npy   int32 chunk ids, grouped by term (CSR)
+    postings_tf.npy    float32 term frequencies, aligned with postings_doc
+    term_offsets.npy   int64 [n_terms + 1] CSR row offsets
+    vectors.npy        float32 [n_chunks, dim] L2-normalised embeddings
+"""
+import json
+import mmap
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from retrieval_cache import STOPWORDS, HashingEmbedder
+
+FORMAT_VERSION = 1
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+@dataclass
+class Chunk:
+    text: str
+    source: str
+    date: Optional[str] = None  # ISO date of the source document, if known
+
+
+@dataclass
+class Passage:
+    text: str
+    source: str
+    date: Optional[str]
+    score: float
+
+
+def build_index(chunks: List[Chunk], path: str, dim: int = 256, k1: float = 1.5, b: float = 0.75):
+    """Writes the index for `chunks` into directory `path`."""
+    os.makedirs(path, exist_ok=True)
+    embedder = HashingEmbedder(dim=dim)
+
+    vocabulary: Dict[str, int] = {}
+    postings: List[List[tuple]] = []
+    doc_len = np.zeros(len(chunks), dtype=np.int32)
+    vectors = np.zeros((len(chunks), dim), dtype=np.float32)
+    for doc_id, chunk in enumerate(chunks):
+        tokens = tokenize(chunk.text)
+        doc_len[doc_id] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_id = vocabulary.setdefault(term, len(vocabulary))
+            if term_id == len(postings):
+                postings.append([])
+            postings[term_id].append((doc_id, tf))
+        vectors[doc_id] = embedder(" ".join(tokens))
+
+    term_offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    term_offsets[1:] = np.cumsum([len(p) for p in postings])
+    postings_doc = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32, count=int(term_offsets[-1]))
+    postings_tf = np.fromiter((tf for p in postings for _, tf in p), dtype=np.float32, count=int(term_offsets[-1]))
+
+    encoded = [c.text.encode("utf-8") for c in chunks]
+    text_offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    text_offsets[1:] = np.cumsum([len(e) for e in encoded])
+    with open(os.path.join(path, "texts.bin"), "wb") as f:
+        for e in encoded:
+            f.write(e)
+
+    np.save(os.path.join(path, "text_offsets.npy"), text_offsets)
+    np.save(os.path.join(path, "doc_len.npy"), doc_len)
+    np.save(os.path.join(path, "postings_doc.npy"), postings_doc)
+    np.save(os.path.join(path, "postings_tf.npy"), postings_tf)
+    np.save(os.path.join(path, "term_offsets.npy"), term_offsets)
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    with open(os.path.join(path, "sources.json"), "w", encoding="utf-8") as f:
+        json.dump([[c.source, c.date] for c in chunks], f)
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "chunks": len(chunks),
+            "dim": dim,
+            "k1": k1,
+            "b": b,
+            "avgdl": float(doc_len.mean()) if len(chunks) else 0.0,
+            "vocabulary": {term: [term_id, len(postings[term_id])] for term, term_id in vocabulary.items()},
+        }, f)
+
+
+class LocalIndex:
+    """Read-only, memory-mapped view of an index directory. Safe to share across requests."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index version {meta['version']} in {path}; rebuild with ingest.py")
+        self.n = meta["chunks"]
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.avgdl = meta["avgdl"] or 1.0
+        self.vocabulary = meta["vocabulary"]
+        self.embedder = HashingEmbedder(dim=meta["dim"])
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.text_offsets = load("text_offsets.npy")
+        self.doc_len = load("doc_len.npy")
+        self.postings_doc = load("postings_doc.npy")
+        self.postings_tf = load("postings_tf.npy")
+        self.term_offsets = load("term_offsets.npy")
+        self.vectors = load("vectors.npy")
+        with open(os.path.join(path, "sources.json"), encoding="utf-8") as f:
+            self.sources = json.load(f)
+        self._texts_file = open(os.path.join(path, "texts.bin"), "rb")
+        self._texts = mmap.mmap(self._texts_file.fileno(), 0, access=mmap.ACCESS_READ) if self.text_offsets[-1] else b""
+
+    def text(self, doc_id: int) -> str:
+        return self._texts[self.text_offsets[doc_id]:self.text_offsets[doc_id + 1]].decode("utf-8")
+
+    def bm25(self, tokens: List[str]) -> np.ndarray:
+        scores = np.zeros(self.n, dtype=np.float32)
+        for term in set(tokens):
+            entry = self.vocabulary.get(term)
+            if entry is None:
+                continue
+            term_id, df = entry
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.postings_doc[start:end]
+            tf = self.postings_tf[start:end]
+            idf = np.log(1 + (self.n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / self.avgdl)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int = 5, candidates: int = 50, rrf_k: int = 60) -> List[Passage]:
+        """Hybrid search: BM25 and vector rankings fused with reciprocal rank fusion."""
+        if self.n == 0:
+            return []
+        tokens = tokenize(query)
+        lexical = self.bm25(tokens)
+        semantic = self.vectors @ self.embedder(" ".join(tokens))
+
+        fused: Dict[int, float] = {}
+        for scores in (lexical, semantic):
+            top = np.argpartition(-scores, min(candidates, self.n) - 1)[:candidates]
+            top = top[np.argsort(-scores[top])]
+            for rank, doc_id in enumerate(top):
+                if scores[doc_id] > 0:
+                    fused[int(doc_id)] = fused.get(int(doc_id), 0.0) + 1.0 / (rrf_k + rank + 1)
+
+        best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+        return [Passage(self.text(d), self.sources[d][0], self.sources[d][1], round(s, 5)) for d, s in best]
+
+
+def format_passages(passages: List[Passage]) -> str:
+    """Tool output: numbered passages with source and date so the Date Hierarchy rule can be applied."""
+    if not passages:
+        return "No matching passages found in the local CBAM knowledge base."
+    blocks = [
+        f"[{i}] Source: {p.source} | Date: {p.date or 'unknown'}\n{p.text}"
+        for i, p in enumerate(passages, 1)
+    ]
+    return "\n\n".join(blocks) + "\n\n(Local CBAM knowledge base; newer documents prevail on conflict.)"
@@ -0,0 +1,153 @@
+"""
+Multi-query retrieval for `retrieve_cbam_multi`: one tool call for comparisons and multi-part questions.
+
+    plan_queries    the sub-queries to run: the model's own (preferred) or a local split of the
+                    question ("X for A vs B" -> "X for A", "X for B"; several questions; "between
+                    A and B"), plus the question itself; at most MULTI_QUERY_MAX sub-queries
+    split_result    one retrieval result (local index blocks or Pinecone prose) -> passages, plus
+                    the citation lines and payload refs that tool_output.render appended
+    fuse            deduplicates passages across sub-queries and ranks them with reciprocal rank
+                    fusion, so passages found by several sub-queries come first; the output is
+                    capped at MULTI_QUERY_MAX_CHARS. The citations and refs of all sub-queries
+                    follow once, deduplicated, so GET /retrievals/{ref} still works for each
+
+The sub-queries themselves are fetched concurrently by the tool (agent.py), each through the
+normal retrieval path (caches included).
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+MULTI_QUERY_MAX = int(os.getenv("MULTI_QUERY_MAX", "4"))
+MULTI_QUERY_MAX_CHARS = int(os.getenv("MULTI_QUERY_MAX_CHARS", "6000"))
+RRF_K = 60
+
+VERSUS = re.compile(r"\s+(?:vs\.?|versus|compared (?:to|with)|as opposed to)\s+", re.I)
+BETWEEN = re.compile(r"^(.*?)\bbetween\s+(.+?)\s+and\s+(.+?)$", re.I)
+LEADING_VERB = re.compile(r"^(?:please\s+)?(?:compare|contrast|explain|describe|what (?:is|are) the differences? (?:in|of))\s+", re.I)
+# Where the shared head of "X for A vs B" ends
+HEAD_END = re.compile(r"^(.*\b(?:for|of|in|under|during|about)\s+)", re.I)
+SOURCE_LINE = re.compile(r"^\(Local CBAM knowledge base.*\)$|^\*\*Source:.*\*\*$")
+# What tool_output.render appends after the answer
+CITATIONS = re.compile(r"^Citations:\n")
+REF_FOOTER = re.compile(r"^\(full response: ref (\w+)\)$")
+
+
+def _clean(text: str) -> str:
+    return " ".join(text.split()).strip(" .?;,")
+
+
+def split_question(question: str) -> List[str]:
+    """Local split of a comparison or multi-part question; [] if it does not look like one."""
+    parts = [_clean(p) for p in re.split(r"\?\s+|;\s*", question) if _clean(p)]
+    if len(parts) > 1:
+        return parts
+
+    text = LEADING_VERB.sub("", _clean(question))
+    between = BETWEEN.match(text)
+    if between:
+        head, left, right = between.groups()
+        head = re.sub(r"^(?:what (?:is|are) )?(?:the )?(?:main |key )?differences?\s*$", "", head.strip(), flags=re.I).strip()
+        if len(left.split()) == 1 and len(right.split()) > 1:
+            # "between direct and indirect emissions": the noun is shared
+            left = f"{left} {' '.join(right.split()[1:])}"
+        return [_clean(f"{head} {side}") for side in (left, right)]
+
+    sides = VERSUS.split(text)
+    if len(sides) < 2:
+        return []
+    head = HEAD_END.match(sides[0])
+    queries = [_clean(sides[0])]
+    for side in sides[1:]:
+        # "the definitive phase" inherits "reporting requirements for " from the first side
+        queries.append(_clean(head.group(1) + side if head and not HEAD_END.match(side) else side))
+    return queries
+
+
+def plan_queries(question: str, sub_queries: Optional[Sequence[str]] = None, limit: Optional[int] = None) -> List[str]:
+    limit = limit or MULTI_QUERY_MAX
+    planned = [_clean(q) for q in (sub_queries or []) if _clean(q)] or split_question(question)
+    queries: List[str] = []
+    for q in [_clean(question)] + planned:
+        if q and q.lower() not in (x.lower() for x in queries):
+            queries.append(q)
+    return queries[:limit]
+
+
+def split_result(result: str) -> Tuple[List[str], List[str], List[str]]:
+    """
+    One retrieval result -> (passages, citation lines without their numbers, payload refs). Passages are
+    the blank-line separated blocks (local index passages or Pinecone paragraphs), minus source footers.
+    """
+    passages: List[str] = []
+    citations: List[str] = []
+    refs: List[str] = []
+    for block in (b.strip() for b in re.split(r"\n\s*\n", result)):
+        if not block or SOURCE_LINE.match(block):
+            continue
+        ref = REF_FOOTER.match(block)
+        if ref:
+            refs.append(ref.group(1))
+        elif CITATIONS.match(block):
+            citations.extend(re.sub(r"^\[\d+\]\s*", "", line) for line in block.splitlines()[1:] if line.strip())
+        else:
+            passages.append(re.sub(r"^\[\d+\]\s*", "", block))
+    return passages, citations, refs
+
+
+def _key(passage: str) -> str:
+    """Dedup key: the passage body (without a "Source: ..." line), lower-cased alphanumerics."""
+    body = re.sub(r"^Source:[^\n]*\n", "", passage)
+    return " ".join(re.findall(r"[a-z0-9]+", body.lower()))[:300]
+
+
+def fuse(queries: Sequence[str], results: Sequence[str], max_chars: Optional[int] = None) -> str:
+    """Deduplicated, RRF-ranked passages from every sub-query, as one compact tool result."""
+    max_chars = max_chars or MULTI_QUERY_MAX_CHARS
+    scores: Dict[str, float] = {}
+    found_by: Dict[str, List[int]] = {}
+    texts: Dict[str, str] = {}
+    errors: List[str] = []
+    citations: List[str] = []
+    refs: List[str] = []
+    for i, result in enumerate(results, 1):
+        if result.startswith(("ERROR", "Error")):
+            errors.append(result)
+            continue
+        passages, result_citations, result_refs = split_result(result)
+        citations += [c for c in result_citations if c not in citations]
+        refs += [r for r in result_refs if r not in refs]
+        for rank, passage in enumerate(passages):
+            key = _key(passage)
+            if not key:
+                continue
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            found_by.setdefault(key, []).append(i)
+            # Keep the longest variant of a duplicated passage
+            if len(passage) > len(texts.get(key, "")):
+                texts[key] = passage
+    if not scores:
+        return errors[0] if errors else "No matching passages found for any sub-query."
+
+    ranked: List[Tuple[str, float]] = sorted(scores.items(), key=lambda item: -item[1])
+    header = "Sub-queries: " + " | ".join(f"({i}) {q}" for i, q in enumerate(queries, 1))
+    tail: List[str] = []
+    if citations:
+        tail.append("Citations:\n" + "\n".join(f"[{n}] {c}" for n, c in enumerate(citations, 1)))
+    if refs:
+        tail.append(f"(full response: ref {', ref '.join(refs)})")
+    # The citations and refs are kept whole; the passages get what is left
+    max_chars = max(max_chars - sum(len(t) + 2 for t in tail), len(header) + 200)
+    blocks, used = [header], len(header)
+    for n, (key, _) in enumerate(ranked, 1):
+        block = f"[{n}] (sub-queries {','.join(map(str, sorted(set(found_by[key]))))}) {texts[key]}"
+        if used + len(block) > max_chars:
+            if n == 1:
+                blocks.append(block[:max_chars - used])
+            break
+        blocks.append(block)
+        used += len(block) + 2
+    omitted = len(ranked) - (len(blocks) - 1)
+    if omitted > 0:
+        blocks.append(f"({omitted} lower-ranked passages omitted)")
+    return "\n\n".join(blocks + tail)
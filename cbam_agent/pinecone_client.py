@@ -0,0 +1,155 @@
+"""
+Shared HTTP client for the Pinecone Assistant.
+One pooled keep-alive connection set per process, bounded timeouts,
+retries with exponential backoff + jitter on 429/5xx, and a circuit breaker
+that fails fast while Pinecone is down.
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Pinecone while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures.
+    open -> half_open once `reset_timeout` seconds have passed; one probe call is let through.
+    half_open -> closed on success, back to open on failure.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self.probe_in_flight):
+            raise CircuitOpenError("Pinecone circuit breaker is open; failing fast")
+        if state == "half_open":
+            self.probe_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class PineconeClient:
+    """
+    Wraps a single `httpx.AsyncClient` for the Assistant chat endpoint.
+    `start()`/`close()` are called from the server lifespan; `chat()` starts it lazily if needed.
+    Defaults come from PINECONE_* environment variables.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        api_key: Optional[str],
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        max_connections: Optional[int] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.url = url
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout if connect_timeout is not None else float(os.getenv("PINECONE_CONNECT_TIMEOUT", "5"))
+        self.read_timeout = read_timeout if read_timeout is not None else float(os.getenv("PINECONE_READ_TIMEOUT", "60"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("PINECONE_MAX_RETRIES", "2"))
+        self.backoff_base = backoff_base if backoff_base is not None else float(os.getenv("PINECONE_BACKOFF_BASE", "0.5"))
+        self.backoff_max = backoff_max if backoff_max is not None else float(os.getenv("PINECONE_BACKOFF_MAX", "8"))
+        self.max_connections = max_connections if max_connections is not None else int(os.getenv("PINECONE_MAX_CONNECTIONS", "20"))
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=int(os.getenv("PINECONE_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("PINECONE_BREAKER_RESET", "30")),
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60,
+                ),
+                headers={
+                    "Api-Key": self.api_key or "",
+                    "X-Pinecone-API-Version": "2025-01",
+                    "Content-Type": "application/json",
+                },
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        # Honour Retry-After on 429/503, otherwise "full jitter" exponential backoff
+        if response is not None and "retry-after" in response.headers:
+            try:
+                return min(float(response.headers["retry-after"]), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POSTs `payload` to the Assistant and returns the decoded JSON body."""
+        self.breaker.before_call()
+        await self.start()
+
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = await self._client.post(self.url, json=payload)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    self.breaker.record_success()
+                    return response.json()
+                error = httpx.HTTPStatusError(f"Pinecone returned {response.status_code}", request=response.request, response=response)
+            except httpx.HTTPStatusError:
+                # Non-retryable 4xx: the request is wrong, Pinecone itself is fine
+                self.breaker.record_success()
+                raise
+            except httpx.TransportError as e:
+                error = e
+            except asyncio.CancelledError:
+                self.breaker.probe_in_flight = False
+                raise
+
+            if attempt >= self.max_retries:
+                self.breaker.record_failure()
+                raise error
+            await asyncio.sleep(self._backoff(attempt, response))
+            attempt += 1
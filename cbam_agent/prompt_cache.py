@@ -0,0 +1,158 @@
+"""
+Versioned prompt prefix: the static SYSTEM_PROMPT and the tool schema, sent first and byte-identical
+on every chatbot call so the provider can reuse its processing of them.
+
+Call layout: [prefix SystemMessage, date SystemMessage, summary, history]. The per-day date comes
+after the prefix, and threads no longer store their own copy of the prompt (older threads still
+have one; `strip_stored_prompt` drops it), so a prompt change applies to every thread at once.
+
+PROMPT_CACHE selects how the prefix is cached:
+    implicit  (default) rely on the provider's automatic prefix caching (Gemini 2.5+ reuses
+              identical leading tokens); needs nothing but the stable layout
+    explicit  create a Gemini context cache holding the prompt and tool schema
+              (PROMPT_CACHE_TTL seconds, renewed before it expires) and send only the
+              rest of each call; backends where that fails keep the implicit path
+    off       no provider-side caching, same layout
+Locally the prefix's token count is computed once per version (`PromptPrefix.tokens`) and
+registered with the context budget, so it is not recounted on every turn.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+from context_budget import CHARS_PER_TOKEN, register_static_message
+
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "implicit").lower()
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", "3600"))
+
+# First line of every SYSTEM_PROMPT version; identifies copies stored in older threads
+PROMPT_HEADER = "# CBAM Compliance Engine"
+
+NO_CALLBACKS = {"callbacks": []}
+
+
+class PromptPrefix:
+    """The static part of every chatbot call. One instance per graph; `version` changes with prompt or tools."""
+
+    def __init__(self, system_prompt: str, tools: Sequence[Any] = ()):
+        self.message = SystemMessage(content=system_prompt)
+        self.tool_schemas = [convert_to_openai_tool(t) for t in tools]
+        blob = json.dumps({"system": system_prompt, "tools": self.tool_schemas}, sort_keys=True)
+        self.version = hashlib.sha256(blob.encode()).hexdigest()[:12]
+        self.tokens = len(blob) // CHARS_PER_TOKEN
+        register_static_message(self.message)
+
+    def build(self, date_context: SystemMessage, history: List[BaseMessage]) -> List[BaseMessage]:
+        return [self.message, date_context] + history
+
+
+def strip_stored_prompt(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Drops the SYSTEM_PROMPT copy that threads created before the prefix layout start with."""
+    if messages and isinstance(messages[0], SystemMessage) and str(messages[0].content).startswith(PROMPT_HEADER):
+        return messages[1:]
+    return messages
+
+
+class ContextCachedChat(BaseChatModel):
+    """
+    Gemini client whose prefix lives in a provider-side context cache (PROMPT_CACHE=explicit).
+    Gemini refuses a system instruction or tools next to cached content, so the prefix message is
+    dropped from each call and the remaining system messages (date, summary) are sent as user text.
+    Until a cache exists, or when creating one fails, calls go to `fallback` (the tool-bound client).
+    """
+    model: Any
+    fallback: Any
+    prefix: Any
+    tools: List[Any]
+    ttl: int = 3600
+    retry_after: float = 300.0
+    _cache_name: Optional[str] = PrivateAttr(default=None)
+    _renew_at: float = PrivateAttr(default=0.0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "context-cached"
+
+    def _create_cache(self) -> Optional[str]:
+        from langchain_google_genai import create_context_cache
+
+        with self._lock:
+            if time.monotonic() < self._renew_at:
+                return self._cache_name
+            try:
+                self._cache_name = create_context_cache(self.model, [self.prefix.message], tools=self.tools, ttl=f"{self.ttl}s")
+                # Renew a minute early so no call lands on an expired cache
+                self._renew_at = time.monotonic() + max(self.ttl - 60, self.ttl / 2)
+                print(f"Prompt cache {self._cache_name} created for {self.model.model} (prefix {self.prefix.version})")
+            except Exception as e:
+                # e.g. prefix below the model's minimum cacheable size; retry later
+                self._cache_name = None
+                self._renew_at = time.monotonic() + self.retry_after
+                print(f"Prompt cache unavailable for {self.model.model}, sending the full prefix: {e}")
+            return self._cache_name
+
+    def _target(self, name: Optional[str], messages: List[BaseMessage], kwargs: dict):
+        """(client, messages, kwargs) for one call: the cached path, or the fallback without a cache."""
+        if name is None:
+            return self.fallback, messages, kwargs
+        rest = [HumanMessage(content=m.content) if isinstance(m, SystemMessage) else m
+                for m in messages if not (isinstance(m, SystemMessage) and m.content == self.prefix.message.content)]
+        return self.model, rest, {**kwargs, "cached_content": name}
+
+    async def _cache(self) -> Optional[str]:
+        if time.monotonic() < self._renew_at:
+            return self._cache_name
+        return await asyncio.to_thread(self._create_cache)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        client, messages, kwargs = self._target(await self._cache(), messages, kwargs)
+        message = await client.ainvoke(messages, config=NO_CALLBACKS, stop=stop, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        client, messages, kwargs = self._target(await self._cache(), messages, kwargs)
+        async for chunk in client.astream(messages, config=NO_CALLBACKS, stop=stop, **kwargs):
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(generation.text, chunk=generation)
+            yield generation
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        name = self._cache_name if time.monotonic() < self._renew_at else self._create_cache()
+        client, messages, kwargs = self._target(name, messages, kwargs)
+        message = client.invoke(messages, config=NO_CALLBACKS, stop=stop, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def bind_with_prefix(llm, tools: Sequence[Any], prefix: PromptPrefix, mode: Optional[str] = None):
+    """
+    `llm.bind_tools(tools)`, except that with PROMPT_CACHE=explicit every Gemini client (directly,
+    behind the LLM router or recorded by a cassette) is wrapped in a ContextCachedChat.
+    """
+    mode = (mode or PROMPT_CACHE).lower()
+    if mode != "explicit":
+        return llm.bind_tools(tools)
+
+    def wrap(model):
+        if type(model).__name__ == "CassetteChatModel" and model.model is not None:
+            # Recording: the cassette stays outermost and keys on the full request; the client underneath caches
+            return model.bind_tools(tools).model_copy(update={"model": wrap(model.model)})
+        if type(model).__name__ != "ChatGoogleGenerativeAI":
+            return model.bind_tools(tools)
+        return ContextCachedChat(model=model, fallback=model.bind_tools(tools), prefix=prefix, tools=list(tools),
+                                 ttl=PROMPT_CACHE_TTL)
+
+    if hasattr(llm, "backends"):
+        return llm.model_copy(update={"backends": [wrap(b) for b in llm.backends]})
+    return wrap(llm)
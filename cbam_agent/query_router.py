@@ -0,0 +1,121 @@
+"""
+Query-complexity router: the `route` node that runs before `chatbot` on every turn.
+
+A few local patterns (no model call) pick one of three paths for the latest user message:
+    canned        greetings, "are you online?" probes, thanks: fixed reply, no LLM call
+    definitional  "What is a CBAM declarant?"-style questions about a term in GLOSSARY: one tool-less
+                  call with the short DEFINITION_PROMPT and only the question, instead of the full
+                  prompt + tool schema
+    full          everything else (regulation, CN/HS codes, calculations, deadlines, default values,
+                  thresholds, status and news, follow-ups that depend on earlier turns): the usual
+                  chatbot/tool loop
+When unsure it picks `full`. The definitional path answers from the model alone, so only terms the
+regulation defines qualify. A definitional call that fails is escalated to `full`.
+
+`route_metrics` counts turns and their latency per path (GET /stats/routes), including the
+latency saved against the average full turn. QUERY_ROUTING=0 turns the stage off.
+"""
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict
+
+from tracing import query_routes
+
+QUERY_ROUTING = os.getenv("QUERY_ROUTING", "1") == "1"
+
+CANNED, DEFINITIONAL, FULL = "canned", "definitional", "full"
+
+GREETING = re.compile(
+    r"^(((hi|hello|hey|hallo|good (morning|afternoon|evening)|greetings)( there)?|ping|test(ing)?)\b[\s,!.]*)?"
+    r"((are|r) (you|u) (online|there|up|alive|available|working)|is (this|anyone) (online|there|working))?$"
+)
+THANKS = re.compile(r"^(ok(ay)?,? )?(thanks|thank you|thx|ty|cheers|great|perfect|got it|bye|goodbye)( (so much|a lot|again))?$")
+DEFINITION = re.compile(
+    r"^(what is meant by (an? |the )?(?P<c>.+)|what('s| is| are) (an? |the )?(?P<a>.+)|what does (an? |the )?(?P<b>.+) (mean|stand for)"
+    r"|(define|definition of|meaning of) (an? |the )?(?P<d>.+))$"
+)
+# Terms the regulation (Art. 3 and the CBAM basics) defines; anything else needs the knowledge base
+GLOSSARY = {
+    "cbam", "carbon border adjustment mechanism", "cbam regulation",
+    "declarant", "cbam declarant", "authorised declarant", "authorised cbam declarant", "reporting declarant",
+    "importer", "operator", "installation", "indirect customs representative", "person", "third country",
+    "embedded emissions", "direct emissions", "indirect emissions", "specific embedded emissions",
+    "cbam certificate", "carbon price", "carbon leakage", "eu ets", "emissions trading system", "eu emissions trading system",
+    "transitional period", "transitional phase", "definitive period", "definitive phase",
+    "simple goods", "complex goods", "precursor", "production process", "production route",
+    "cbam report", "cbam registry", "competent authority", "accredited verifier", "verifier", "verification",
+    "greenhouse gases", "tonne of co2e", "co2e", "co2 equivalent",
+}
+# Anything that needs retrieval, a calculation, the deadline table or the earlier conversation
+NEEDS_TOOLS = re.compile(
+    r"\d|\b(hs|cn|codes?|tariff|calculat\w*|comput\w*|how (much|many)|costs?|prices?|tonnes?|tons?|"
+    r"articles?|annex\w*|implementing|deadlines?|due|when|timeline|penalt\w*|fines?|"
+    r"must|should|need|required?|obligat\w*|can (i|we)|do (i|we)|how (do|to|should)|covered|scope|goods|list|examples?|"
+    r"my|our|we|i|me|us|it|its|that|this|these|those|they|them|compare|differen\w*|versus|vs|"
+    r"values?|thresholds?|de minimis|status|news|latest|current|updates?|changes?|new)\b"
+)
+
+CANNED_REPLIES = {
+    "greeting": "Hello! The CBAM compliance assistant is online. Ask about CBAM scope, CN codes, "
+                "reporting deadlines or embedded-emission and certificate calculations.",
+    "thanks": "You're welcome. Ask any time you have another CBAM question.",
+}
+
+DEFINITION_PROMPT = """You are an expert on the EU Carbon Border Adjustment Mechanism (CBAM), Regulation (EU) 2023/956.
+Define the term the user asks about in at most 120 words, using the regulation's own definitions where they exist.
+No deadlines, figures or procedures beyond the definition. End with: "**Source: Regulation (EU) 2023/956**"."""
+
+
+@dataclass(frozen=True)
+class QueryRoute:
+    path: str
+    intent: str
+
+
+def classify_query(text: str) -> QueryRoute:
+    q = " ".join(text.lower().split()).strip(" ?!.")
+    if GREETING.match(q) and q:
+        return QueryRoute(CANNED, "greeting")
+    if THANKS.match(q):
+        return QueryRoute(CANNED, "thanks")
+    match = DEFINITION.match(q)
+    if match and len(q.split()) <= 12 and not NEEDS_TOOLS.search(q) and glossary_term(next(t for t in match.groupdict().values() if t)):
+        return QueryRoute(DEFINITIONAL, "definition")
+    return QueryRoute(FULL, "tools")
+
+
+def glossary_term(text: str) -> bool:
+    term = re.sub(r"\b(the term|in|under) (the )?(cbam|eu|regulation)( regulation)?$|^the term ", "", text).strip(" '\"")
+    term = " ".join(term.replace("authorized", "authorised").split())
+    return term in GLOSSARY or (term.endswith("s") and term[:-1] in GLOSSARY)
+
+
+@dataclass
+class RouteMetrics:
+    """Turns and total seconds per router path (the deadline-table fast path in server.py included)."""
+    turns: Dict[str, int] = field(default_factory=dict)
+    seconds: Dict[str, float] = field(default_factory=dict)
+
+    def record(self, path: str, seconds: float):
+        self.turns[path] = self.turns.get(path, 0) + 1
+        self.seconds[path] = self.seconds.get(path, 0.0) + seconds
+        query_routes.inc(path=path)
+
+    def snapshot(self) -> Dict:
+        total = sum(self.turns.values())
+        avg = {path: self.seconds[path] / n for path, n in self.turns.items()}
+        full = avg.get(FULL)
+        return {
+            "turns": total,
+            "paths": {
+                path: {"turns": n, "share": round(n / total, 3), "avg_ms": round(avg[path] * 1000, 1)}
+                for path, n in sorted(self.turns.items())
+            },
+            # Against the average full turn; unknown until a full turn has been seen
+            "latency_saved_ms": round(sum(n * (full - avg[path]) for path, n in self.turns.items()
+                                          if path != FULL) * 1000, 1) if full is not None else None,
+        }
+
+
+route_metrics = RouteMetrics()
@@ -0,0 +1,284 @@
+"""
+Cache in front of the Pinecone Assistant call made by `retrieve_cbam_info`.
+
+- Exact match on a normalised query key
+- Optional near-duplicate match using local (hashed n-gram) embeddings
+- TTL expiry and LRU eviction bounded by entry count
+- In-process or SQLite-on-disk backend
+
+Configured with RETRIEVAL_CACHE_* environment variables (see `cache_from_env`).
+"""
+import asyncio
+import hashlib
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tracing import record_cache
+
+
+def normalise_query(query: str) -> str:
+    """Lowercases, drops punctuation (keeping dots inside codes like 7208.10) and collapses whitespace."""
+    text = re.sub(r"[^\w\s.]", " ", query.lower())
+    text = re.sub(r"\.(?!\w)", " ", text)
+    return " ".join(text.split())
+
+
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "to", "in", "on", "and", "or", "is", "are", "do", "does", "i", "we",
+    "my", "our", "how", "what", "which", "can", "me", "please", "about", "with", "be",
+}
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=4).digest(), "little")
+
+
+class HashingEmbedder:
+    """
+    Dependency-free local embedding: content words (weighted) and their character trigrams
+    hashed into a fixed-size vector. Catches rephrasings like "HS codes for steel?" vs "steel hs codes"
+    while a different product word ("steel" vs "aluminium") still pulls the similarity down.
+    """
+
+    def __init__(self, dim: int = 1024, word_weight: float = 3.0):
+        self.dim = dim
+        self.word_weight = word_weight
+
+    def _add(self, vector: np.ndarray, feature: str, weight: float):
+        vector[_feature_hash(feature) % self.dim] += weight
+
+    def __call__(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.split():
+            if word in STOPWORDS:
+                continue
+            self._add(vector, word, self.word_weight)
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                self._add(vector, padded[i:i + 3], 1.0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+# --- Backends ---
+class MemoryBackend:
+    """In-process LRU store: key -> (query, value, embedding, created_at)."""
+
+    blocking = False
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, Tuple[str, str, Optional[np.ndarray], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[3]
+
+    def set(self, key: str, query: str, value: str, embedding: Optional[np.ndarray]):
+        with self._lock:
+            self._entries[key] = (query, value, embedding, time.time())
+            self._entries.move_to_end(key)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def embeddings(self) -> List[Tuple[str, np.ndarray]]:
+        with self._lock:
+            return [(key, entry[2]) for key, entry in self._entries.items() if entry[2] is not None]
+
+    def evict(self, max_entries: int) -> int:
+        with self._lock:
+            evicted = 0
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """On-disk store, shared by every worker process that points at the same file (one table per store)."""
+
+    blocking = True  # file I/O and other workers' locks: async callers use a thread
+
+    def __init__(self, path: str, table: str = "retrieval_cache"):
+        self._table = table
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, query TEXT, value TEXT, embedding BLOB, created_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, created_at FROM {self._table} WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute(f"UPDATE {self._table} SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return row
+
+    def set(self, key: str, query: str, value: str, embedding: Optional[np.ndarray]):
+        blob = embedding.astype(np.float32).tobytes() if embedding is not None else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} VALUES (?, ?, ?, ?, ?, ?)",
+                (key, query, value, blob, now, now),
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+
+    def embeddings(self) -> List[Tuple[str, np.ndarray]]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT key, embedding FROM {self._table} WHERE embedding IS NOT NULL").fetchall()
+        return [(key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows]
+
+    def evict(self, max_entries: int) -> int:
+        with self._lock:
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+            excess = count - max_entries
+            if excess <= 0:
+                return 0
+            self._conn.execute(
+                f"DELETE FROM {self._table} WHERE key IN "
+                f"(SELECT key FROM {self._table} ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            return excess
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+
+# --- Cache ---
+class RetrievalCache:
+    """
+    `lookup()` returns a cached Pinecone answer or None; `store()` records one.
+    `semantic_threshold` (cosine similarity, e.g. 0.9) enables near-duplicate matching; None disables it.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        ttl: float = 86400,
+        max_entries: int = 2000,
+        semantic_threshold: Optional[float] = None,
+        embedder: Optional[Callable[[str], np.ndarray]] = None,
+        name: str = "retrieval",
+    ):
+        self.name = name
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic_threshold = semantic_threshold
+        self.embedder = embedder or (HashingEmbedder() if semantic_threshold is not None else None)
+        self.counters = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def _fresh(self, key: str) -> Optional[str]:
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, created_at = entry
+        if time.time() - created_at > self.ttl:
+            self.backend.delete(key)
+            self.counters["expirations"] += 1
+            return None
+        return value
+
+    def lookup(self, query: str) -> Optional[str]:
+        key = normalise_query(query)
+        value = self._fresh(key)
+        if value is not None:
+            self.counters["hits"] += 1
+            record_cache(self.name, "hit")
+            return value
+
+        if self.semantic_threshold is not None:
+            candidates = self.backend.embeddings()
+            if candidates:
+                keys, vectors = zip(*candidates)
+                scores = np.stack(vectors) @ self.embedder(key)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.semantic_threshold:
+                    value = self._fresh(keys[best])
+                    if value is not None:
+                        self.counters["semantic_hits"] += 1
+                        record_cache(self.name, "semantic_hit")
+                        return value
+
+        self.counters["misses"] += 1
+        record_cache(self.name, "miss")
+        return None
+
+    def store(self, query: str, value: str):
+        key = normalise_query(query)
+        embedding = self.embedder(key) if self.semantic_threshold is not None else None
+        self.backend.set(key, query, value, embedding)
+        self.counters["evictions"] += self.backend.evict(self.max_entries)
+
+    async def alookup(self, query: str) -> Optional[str]:
+        """`lookup()` for async callers: a blocking (SQLite) backend is read off the event loop."""
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.lookup, query)
+        return self.lookup(query)
+
+    async def astore(self, query: str, value: str):
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.store, query, value)
+        return self.store(query, value)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.counters["hits"] + self.counters["semantic_hits"] + self.counters["misses"]
+        hits = self.counters["hits"] + self.counters["semantic_hits"]
+        return {
+            **self.counters,
+            "entries": len(self.backend),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def cache_from_env(prefix: str = "RETRIEVAL_CACHE", semantic: bool = True) -> Optional[RetrievalCache]:
+    """
+    <prefix>_BACKEND: memory (default) | sqlite | off
+    <prefix>_PATH: SQLite file (default <prefix lowercased>.db, e.g. retrieval_cache.db)
+    <prefix>_TTL: seconds (default 86400)
+    <prefix>_MAX_ENTRIES: default 2000
+    <prefix>_SEMANTIC_THRESHOLD: cosine similarity for near-duplicates, unset to disable
+                                 (ignored with `semantic=False`: exact keys only)
+    """
+    kind = os.getenv(f"{prefix}_BACKEND", "memory").lower()
+    if kind == "off":
+        return None
+    backend = SQLiteBackend(os.getenv(f"{prefix}_PATH", f"{prefix.lower()}.db")) if kind == "sqlite" else MemoryBackend()
+    threshold = os.getenv(f"{prefix}_SEMANTIC_THRESHOLD")
+    if threshold and not semantic:
+        print(f"{prefix}_SEMANTIC_THRESHOLD ignored: this cache matches exact keys only")
+        threshold = None
+    return RetrievalCache(
+        backend=backend,
+        ttl=float(os.getenv(f"{prefix}_TTL", "86400")),
+        max_entries=int(os.getenv(f"{prefix}_MAX_ENTRIES", "2000")),
+        semantic_threshold=float(threshold) if threshold else None,
+        name=prefix.lower().replace("_cache", ""),
+    )
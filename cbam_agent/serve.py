@@ -0,0 +1,93 @@
+"""
+Production serving mode: several uvicorn worker processes behind one port.
+
+Workers share the listening socket and the kernel hands each connection to whichever worker
+accepts it, so there is no sticky routing. Anything a later request may need lives in SQLite
+files under --state-dir, shared by all workers:
+    checkpoints.db      conversation threads (CHECKPOINT_BACKEND=sqlite)
+    retrieval_cache.db  Pinecone answers
+    answer_cache.db     first-turn answers
+    tool_payloads.db    full Pinecone responses behind compact tool messages
+    jobs.db             the /jobs queue
+    admission.db        per-session and per-IP rate-limit buckets (written behind, see admission.py)
+Variables already set in the environment win; with more than one worker a per-process
+checkpointer is refused, since threads would then depend on which worker a request hits.
+The admission limits (ADMISSION_MAX_CONCURRENT etc.) apply per worker.
+
+Client IPs for the per-IP rate limit are taken from X-Forwarded-For when the connection comes from
+--forwarded-allow-ips (default FORWARDED_ALLOW_IPS, else 127.0.0.1); behind a hosting proxy set it
+to the proxy's addresses or CIDR (the Procfile trusts the platform router's private 10.0.0.0/8), or
+every caller shares the proxy's IP. "*" is refused: uvicorn would then take the left-most entry,
+which the client writes itself.
+
+On SIGTERM/SIGINT each worker stops accepting, lets in-flight requests finish for up to
+--drain-timeout seconds, then drains its job workers (see jobs.py) and closes its clients.
+
+Usage: python serve.py [--workers 4] [--host 0.0.0.0] [--port 8080] [--state-dir .] [--drain-timeout 30]
+(`python server.py` is still the single-process development server with auto-reload.)
+"""
+import argparse
+import os
+
+import uvicorn
+
+SHARED_STATE = {
+    "CHECKPOINT_PATH": "checkpoints.db",
+    "RETRIEVAL_CACHE_PATH": "retrieval_cache.db",
+    "ANSWER_CACHE_PATH": "answer_cache.db",
+    "TOOL_PAYLOAD_PATH": "tool_payloads.db",
+    "JOBS_PATH": "jobs.db",
+    "ADMISSION_STATE_PATH": "admission.db",
+}
+
+
+def configure_shared_state(workers: int, state_dir: str):
+    """Points every worker at the same SQLite files (environment is inherited by the worker processes)."""
+    os.makedirs(state_dir, exist_ok=True)
+    for name, filename in SHARED_STATE.items():
+        os.environ.setdefault(name, os.path.join(os.path.abspath(state_dir), filename))
+    if workers > 1:
+        os.environ.setdefault("CHECKPOINT_BACKEND", "sqlite")
+        for cache in ("RETRIEVAL_CACHE", "ANSWER_CACHE", "TOOL_PAYLOAD"):
+            os.environ.setdefault(f"{cache}_BACKEND", "sqlite")
+        if os.environ["CHECKPOINT_BACKEND"].lower() != "sqlite":
+            raise SystemExit(f"CHECKPOINT_BACKEND={os.environ['CHECKPOINT_BACKEND']} keeps threads per process; "
+                             "use sqlite with --workers > 1")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")))
+    parser.add_argument("--state-dir", default=os.getenv("STATE_DIR", "."))
+    parser.add_argument("--drain-timeout", type=float, default=float(os.getenv("DRAIN_TIMEOUT", "30")))
+    parser.add_argument("--app", default="server:app", help="ASGI app import string (benchmarks swap in a stubbed app)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS"))
+    args = parser.parse_args()
+
+    if args.forwarded_allow_ips:
+        if "*" in args.forwarded_allow_ips.split(","):
+            raise SystemExit("--forwarded-allow-ips '*' lets any client pick its IP with X-Forwarded-For; "
+                             "list the proxy's addresses or CIDR instead")
+        # Workers inherit it: admission.py stops exempting loopback behind a proxy
+        os.environ["FORWARDED_ALLOW_IPS"] = args.forwarded_allow_ips
+
+    configure_shared_state(args.workers, args.state_dir)
+    os.environ.setdefault("JOBS_DRAIN_TIMEOUT", str(args.drain_timeout))
+    print(f"Serving {args.app} on {args.host}:{args.port} with {args.workers} worker(s); "
+          f"checkpoints: {os.getenv('CHECKPOINT_BACKEND', 'bounded')} {os.environ['CHECKPOINT_PATH']}")
+    uvicorn.run(
+        args.app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.drain_timeout,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,75 @@
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Any, Awaitable, Callable, Dict, Optional
 import uvicorn
 import os
-from langchain_core.messages import HumanMessage, SystemMessage
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 
-from agent import agent_app, SYSTEM_PROMPT
+import agent
+from admission import AdmissionRejected, admission_from_env
+from agent import pinecone_client, retrieval_cache
+from answer_cache import answer_cache, answer_cache_key, single_flight
+from batch import BatchError, parse_batch, run_batch
+from context_budget import context_metrics
+from deadlines import route_timeline_question
+from jobs import JobWorkerPool, job_store_from_env
+from query_router import route_metrics
+from thread_runs import RunSuperseded, thread_runs
+from tool_output import payload_store
+from tracing import get_trace, render_metrics, set_attribute, trace_request
 
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="CBAM Agent Webhook")
+# The compiled graph. None until first use; tests and benchmarks assign their own.
+agent_app = None
+
+# STARTUP_WARMUP=1 (default) builds the graph in the background right after startup,
+# so the port opens at once and /health/ready flips once the first request would be fast
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+shutting_down = False
+
+async def get_graph():
+    """The agent graph, built on first use in a worker thread so the event loop keeps serving."""
+    global agent_app
+    if agent_app is None:
+        agent_app = await asyncio.to_thread(agent.get_agent_app)
+    return agent_app
+
+async def warm_up():
+    start = time.perf_counter()
+    try:
+        await get_graph()
+        print(f"Warm-up: agent graph ready in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"Warm-up failed (will retry on first request): {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global job_workers, shutting_down
+    # One pooled Pinecone connection set for the life of the process
+    await pinecone_client.start()
+    warm_task = asyncio.create_task(warm_up()) if STARTUP_WARMUP else None
+    if JOBS_WORKERS > 0:
+        job_workers = JobWorkerPool(get_job_store(), answer_job, concurrency=JOBS_WORKERS,
+                                    job_timeout=float(os.getenv("JOBS_TIMEOUT", "600")))
+        job_workers.start()
+    yield
+    # Shutdown (uvicorn has already stopped accepting and drained in-flight HTTP requests)
+    shutting_down = True
+    if job_workers is not None:
+        await job_workers.drain(float(os.getenv("JOBS_DRAIN_TIMEOUT", "30")))
+    if warm_task is not None:
+        warm_task.cancel()
+    admission.close()
+    await pinecone_client.close()
+
+app = FastAPI(title="CBAM Agent Webhook", lifespan=lifespan)
 
 # Add CORS Middleware to allow requests from any origin (including local files)
 app.add_middleware(
@@ -20,74 +80,410 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Concurrency cap, wait queue and per-session/IP rate limits for graph runs (see admission.py)
+admission = admission_from_env()
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, e: AdmissionRejected):
+    """429 (rate limited) or 503 (overloaded), answered at once with Retry-After."""
+    return JSONResponse({"detail": str(e), "reason": e.reason, "retry_after": e.retry_after},
+                        status_code=e.status, headers=e.headers)
+
+def client_ip(request: Optional[Request]) -> Optional[str]:
+    """The caller's address (uvicorn resolves X-Forwarded-For from trusted proxies, see FORWARDED_ALLOW_IPS)."""
+    return request.client.host if request is not None and request.client else None
+
+async def admit(request: Optional[Request], session_id: Optional[str]):
+    """Rate limits, then a graph-run slot; raises AdmissionRejected (429/503) instead of queueing past the limits."""
+    admission.check_rate(session_id, client_ip(request))
+    return await admission.acquire()
+
+# Job queue (see jobs.py); JOBS_WORKERS=0 makes this process enqueue only, for separate `jobs.py worker` processes
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+job_store = None
+job_workers = None
+
+def get_job_store():
+    """The job store, opened on first use: importing the server (tests, tools) creates no jobs.db."""
+    global job_store
+    if job_store is None:
+        job_store = job_store_from_env()
+    return job_store
+
 class WebhookInput(BaseModel):
     input: str
     sessionId: Optional[str] = "default"
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss/eviction counters for the server-side caches."""
+    return {
+        "retrieval": retrieval_cache.stats() if retrieval_cache is not None else None,
+        "answer": answer_cache.stats() if answer_cache is not None else None,
+        "coalesced_requests": single_flight.coalesced,
+    }
+
+@app.get("/stats/context")
+async def context_stats():
+    """Tokens sent per LLM call before and after the context-budget stage."""
+    return context_metrics.snapshot()
+
+@app.get("/stats/llm")
+async def llm_stats():
+    """Per-backend calls, errors, hedges and latency percentiles of the LLM router."""
+    # Imported here: the router module (and its LangChain model classes) load with the graph, not at startup
+    from llm_router import stats_snapshot
+    return stats_snapshot()
+
+@app.get("/stats/admission")
+async def admission_stats():
+    """Running and queued graph runs, average run and queue wait, and admission outcomes (admitted, 429s, 503s)."""
+    return admission.snapshot()
+
+@app.get("/stats/threads")
+async def thread_stats():
+    """Threads and runs in flight, and how requests were coordinated per thread (started, waited, coalesced, superseded)."""
+    return thread_runs.snapshot()
+
+@app.get("/stats/routes")
+async def route_stats():
+    """Share of turns and average latency per query-router path, and the latency saved against full turns."""
+    return route_metrics.snapshot()
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness: the process is up and serving HTTP."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: the agent graph is built, so requests will not pay the startup cost."""
+    if shutting_down:
+        return JSONResponse({"status": "draining"}, status_code=503)
+    if agent_app is None and not agent.agent_app_ready():
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text format: per-stage latency histograms, token and cache counters."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces/{request_id}")
+async def trace_detail(request_id: str):
+    """Span tree and per-stage breakdown of a recent request (request_id from the webhook response)."""
+    trace = get_trace(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired request id")
+    return trace
+
+@app.get("/retrievals/{ref}")
+async def retrieval_payload(ref: str):
+    """Full Pinecone response behind a retrieval tool message (its "ref"); the thread only keeps the compact form."""
+    payload = await asyncio.to_thread(payload_store.get, ref) if payload_store is not None else None
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired ref")
+    return payload
+
 @app.options("/webhook")
 async def options_webhook():
     return {}
 
+@app.options("/webhook/stream")
+async def options_webhook_stream():
+    return {}
+
+@app.options("/webhook/batch")
+async def options_webhook_batch():
+    return {}
+
+@app.options("/jobs")
+async def options_jobs():
+    return {}
+
+async def prepare_messages(user_input: str, config: Dict[str, Any]):
+    """
+    Builds the input messages for a turn and tells whether the thread is fresh (no history in the checkpointer).
+    The System Prompt is not stored in the thread; the chatbot sends it as the cached prefix of every call.
+    A tool call left without a result by a superseded run is closed first, so the model never sees it dangling.
+    """
+    graph = await get_graph()
+    snapshot = await graph.aget_state(config)
+    messages = snapshot.values.get("messages") if snapshot.values else None
+    if messages and getattr(messages[-1], "tool_calls", None):
+        await graph.aupdate_state(config, {"messages": [
+            ToolMessage(content="Cancelled: superseded by a newer message.", tool_call_id=call["id"], name=call["name"])
+            for call in messages[-1].tool_calls]}, as_node="tools")
+    return [HumanMessage(content=user_input)], not snapshot.values
+
+async def run_graph(messages, config):
+    """Runs the agent and returns the content of the last AI message."""
+    final_state = await (await get_graph()).ainvoke(
+        {"messages": messages},
+        config=config
+    )
+    return final_state["messages"][-1].content
+
+async def run_first_turn_cached(user_input: str, messages, config):
+    """
+    First-turn questions are context free, so the answer can be shared across sessions.
+    Served from the answer cache, or computed once for all concurrent identical questions.
+    The Q&A is still written to this thread so a follow-up on the same sessionId has its history.
+    """
+    key = answer_cache_key(user_input)
+    cached = await answer_cache.alookup(key)
+    if cached is not None:
+        response_text = json.loads(cached)
+    else:
+        leader = False
+
+        async def compute():
+            nonlocal leader
+            leader = True
+            answer = await run_graph(messages, config)
+            await answer_cache.astore(key, json.dumps(answer))
+            return answer
+
+        response_text = await single_flight.do(key, compute)
+        if leader:
+            return response_text
+        set_attribute("coalesced", True)
+
+    await record_answer(messages, response_text, config)
+    return response_text
+
+async def record_answer(messages, response_text, config):
+    """Writes a turn answered outside the graph into the thread, as if `chatbot` had produced it."""
+    await (await get_graph()).aupdate_state(config, {"messages": messages + [AIMessage(content=response_text)]}, as_node="chatbot")
+
+def content_text(content) -> str:
+    """Flattens message content, which Gemini may return as a list of parts."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_agent_events(user_input: str, thread_id: str):
+    """
+    Runs the graph and yields server-sent events as it progresses:
+    `token` for each LLM text chunk, `tool_start`/`tool_end` around tool calls,
+    then a final `done` carrying the same `output`/`thread_id` as /webhook (or `error`).
+    The stream holds its thread's slot (see thread_runs.py); a newer message on the thread ends it
+    with an `error` event whose reason is "superseded".
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    with trace_request("webhook_stream", thread_id=thread_id) as trace:
+        try:
+            async with thread_runs.slot(thread_id):
+                async for event in _stream_agent_events(user_input, thread_id, config, trace.request_id):
+                    yield event
+        except RunSuperseded as e:
+            set_attribute("superseded", True)
+            yield sse_event("error", {"detail": str(e), "reason": "superseded", "request_id": trace.request_id})
+
+async def _stream_agent_events(user_input: str, thread_id: str, config: Dict[str, Any], request_id: str):
+    try:
+        messages, _ = await prepare_messages(user_input, config)
+        start = time.perf_counter()
+        routed = route_timeline_question(user_input)
+        if routed is not None:
+            set_attribute("route", "deadline_table")
+            await record_answer(messages, routed.answer, config)
+            route_metrics.record("deadline_table", time.perf_counter() - start)
+            yield sse_event("token", {"text": routed.answer})
+            yield sse_event("done", {"output": routed.answer, "thread_id": thread_id, "request_id": request_id})
+            return
+
+        graph = await get_graph()
+        streamed = False
+        async for event in graph.astream_events({"messages": messages}, config=config, version="v2"):
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                if event.get("metadata", {}).get("langgraph_node") not in ("chatbot", "define"):
+                    continue
+                text = content_text(event["data"]["chunk"].content)
+                if text:
+                    streamed = True
+                    yield sse_event("token", {"text": text})
+            elif kind == "on_tool_start":
+                yield sse_event("tool_start", {"name": event["name"], "input": event["data"].get("input")})
+            elif kind == "on_tool_end":
+                output = event["data"].get("output")
+                yield sse_event("tool_end", {"name": event["name"], "output": content_text(getattr(output, "content", output))})
+
+        final_state = await graph.aget_state(config)
+        last_message = final_state.values["messages"][-1]
+        if not streamed:
+            # Canned replies come from the router, not a model
+            yield sse_event("token", {"text": content_text(last_message.content)})
+        yield sse_event("done", {"output": last_message.content, "thread_id": thread_id, "request_id": request_id})
+
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e), "request_id": request_id})
+
+async def answer_question(user_input: str, thread_id: str, supersede: bool = False,
+                          acquire: Optional[Callable[[], Awaitable[Any]]] = None) -> str:
+    """
+    One /webhook turn: fast-path router, shared answer cache for first turns, else the full graph.
+    Runs one at a time per thread, and an identical turn already in flight there is shared (see thread_runs.py);
+    `supersede` cancels the turns ahead of it instead of waiting (RunSuperseded in those).
+    `acquire` returns an admission ticket, taken once the thread is free: a turn waiting for its
+    thread or sharing another's answer holds no graph-run slot.
+    """
+    async def run():
+        ticket = await acquire() if acquire is not None else None
+        try:
+            return await _answer_question(user_input, thread_id)
+        finally:
+            if ticket is not None:
+                ticket.release()
+
+    return await thread_runs.run(thread_id, user_input, run, supersede)
+
+async def _answer_question(user_input: str, thread_id: str) -> str:
+    config = {"configurable": {"thread_id": thread_id}}
+
+    # Prepare initial state (System Prompt is prepended for a fresh thread)
+    messages, first_turn = await prepare_messages(user_input, config)
+
+    # Deadline/timeline questions are answered from the deadline table, no LLM call
+    start = time.perf_counter()
+    routed = route_timeline_question(user_input)
+    if routed is not None:
+        set_attribute("route", "deadline_table")
+        await record_answer(messages, routed.answer, config)
+        route_metrics.record("deadline_table", time.perf_counter() - start)
+        return routed.answer
+
+    # Run the agent (context-free first turns go through the shared answer cache)
+    if answer_cache is not None and first_turn:
+        return await run_first_turn_cached(user_input, messages, config)
+    return await run_graph(messages, config)
+
+async def answer_job(user_input: str, thread_id: str) -> str:
+    # Queued work shares the graph-run slots but is never shed
+    with trace_request("job", thread_id=thread_id):
+        return await answer_question(user_input, thread_id, acquire=lambda: admission.acquire(shed=False))
+
 @app.post("/webhook")
-async def webhook(payload: WebhookInput):
+async def webhook(payload: WebhookInput, request: Request = None):
     """
     Webhook endpoint compatible with n8n structure.
     Expects JSON: {"input": "User query", "sessionId": "optional-id"}
+    Over the admission limits it answers 429/503 with Retry-After (see admission.py).
+    A newer message on the same sessionId cancels this one, which answers 409 (see thread_runs.py);
+    requests without a sessionId share the "default" thread and are never cancelled.
     """
+    request_id = None
+    admission.check_rate(payload.sessionId, client_ip(request))
     try:
-        user_input = payload.input
-        thread_id = payload.sessionId
-        
-        config = {"configurable": {"thread_id": thread_id}}
-        
-        # Prepare initial state
-        # We check if this is a new conversation (no history in memory) to add system prompt
-        # For simplicity in this stateless-like webhook, we can just prepend system prompt if it's the first message
-        # Or we can rely on the agent to always have it. 
-        # LangGraph memory persists state.
-        
-        # We'll just pass the user message. If the graph has history, it appends.
-        # To ensure System Prompt is always respected, we can check history or just rely on the model instructions if we were using a system-message-enabled model class directly.
-        # Here we construct the input messages.
-        
-        # Check if history exists for this thread (mock check, or just send System+User for safety if we want to enforce it every time, 
-        # but LangGraph memory handles history. Let's just send User message, 
-        # BUT we need to ensure the System Prompt is part of the context. 
-        # A common pattern is to initialize the state with SystemMessage if it's empty.
-        
-        # We can't easily peek into checkpointer here without internal access, 
-        # so we'll define a specialized input handling.
-        
-        # Actually, let's just send the user message. 
-        # If we want to force the system prompt, we can modify the agent.py to always prepend it if missing, 
-        # or just send it as the first message of the conversation.
-        
-        messages = [HumanMessage(content=user_input)]
-        
-        # If it's a fresh thread, we might want to prepend SystemMessage.
-        # For now, let's assume the agent needs the system prompt.
-        # We'll fetch the state first to see if it's empty.
-        snapshot = agent_app.get_state(config)
-        if not snapshot.values:
-             messages.insert(0, SystemMessage(content=SYSTEM_PROMPT))
-
-        # Run the agent
-        final_state = agent_app.invoke(
-            {"messages": messages},
-            config=config
-        )
-        
-        # Extract the last AI message
-        last_message = final_state["messages"][-1]
-        response_text = last_message.content
-        
+        with trace_request("webhook", thread_id=payload.sessionId) as trace:
+            request_id = trace.request_id
+            response_text = await answer_question(payload.input, payload.sessionId, supersede=thread_runs.supersede,
+                                                  acquire=admission.acquire)
         return {
             "output": response_text,
-            "thread_id": thread_id
+            "thread_id": payload.sessionId,
+            "request_id": request_id
         }
 
+    except (AdmissionRejected, HTTPException):
+        raise
+    except RunSuperseded as e:
+        raise HTTPException(status_code=409, detail=f"{e} (request_id: {request_id})")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"{e} (request_id: {request_id})")
+
+@app.post("/webhook/stream")
+async def webhook_stream(payload: WebhookInput, request: Request):
+    """
+    Streaming variant of /webhook using Server-Sent Events.
+    Same JSON input; the final `done` event carries the /webhook response body.
+    Admission is decided before the stream starts, so a rejection is a plain 429/503.
+    """
+    ticket = await admit(request, payload.sessionId)
+
+    async def events():
+        try:
+            async for event in stream_agent_events(payload.input, payload.sessionId):
+                yield event
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also frees the slot if the client disconnects before the stream starts
+        background=BackgroundTask(ticket.release),
+    )
+
+@app.post("/webhook/batch")
+async def webhook_batch(request: Request):
+    """
+    Bulk variant of /webhook. Body is a JSON list of {"input", "sessionId"?, "id"?} objects
+    (or {"items": [...]}), a CSV upload (Content-Type: text/csv, `input` column) or JSONL
+    (Content-Type: application/x-ndjson). Streams one NDJSON result line per item as it finishes,
+    then a summary line with "done": true. See batch.py for deduplication and limits.
+    """
+    try:
+        items = parse_batch(await request.body(), request.headers.get("content-type", ""))
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # One token for the request; then each graph run (duplicates share one) waits for its own token
+    # and for a background slot, without being shed
+    ip = client_ip(request)
+    admission.check_rate(None, ip)
+
+    async def answer_item(user_input: str, thread_id: str) -> str:
+        await admission.pace(ip)
+        return await answer_question(user_input, thread_id, acquire=lambda: admission.acquire(shed=False))
+
+    async def lines():
+        with trace_request("webhook_batch", items=len(items)):
+            async for result in run_batch(items, answer_item):
+                yield json.dumps(result, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+@app.post("/jobs", status_code=202)
+async def submit_job(payload: WebhookInput, request: Request):
+    """
+    Queues a /webhook turn and returns at once with a job id.
+    Poll GET /jobs/{job_id} until status is done (output set), failed (error set) or cancelled.
+    Submissions count against the session and IP rate limits (429); the job itself is never shed.
+    """
+    admission.check_rate(payload.sessionId, client_ip(request))
+    job_id = await asyncio.to_thread(get_job_store().submit, payload.input, payload.sessionId)
+    return {"job_id": job_id, "status": "queued", "thread_id": payload.sessionId}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "output": job["output"],
+        "error": job["error"],
+        "thread_id": job["session_id"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancels a queued job, or asks the worker running it to stop."""
+    status = await asyncio.to_thread(get_job_store().cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return {"job_id": job_id, "status": status}
 
 if __name__ == "__main__":
     uvicorn.run("server:app", host="0.0.0.0", port=8080, reload=True)
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+import server
+from admission import AdmissionController, AdmissionRejected, BucketStore, TokenBuckets, admission_from_env
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel
+
+
+def rejection(call):
+    try:
+        call()
+    except AdmissionRejected as e:
+        return e
+    raise AssertionError("admitted")
+
+
+def test_token_buckets_and_persistence():
+    store = BucketStore(os.path.join(tempfile.mkdtemp(), "admission.db"))
+    controller = AdmissionController(session_buckets=TokenBuckets("session", rate=0.1, burst=2, store=store),
+                                     ip_buckets=TokenBuckets("ip", rate=0.1, burst=3, store=store),
+                                     exempt_ips=["127.0.0.1"], store=store)
+    controller.check_rate("s1", "10.0.0.1")
+    controller.check_rate("s1", "10.0.0.1")
+    limited = rejection(lambda: controller.check_rate("s1", "10.0.0.1"))
+    assert (limited.status, limited.reason) == (429, "session_rate_limited") and 9 <= limited.retry_after <= 10
+    # The IP has one token left; a session limited by the IP bucket gets its own token back
+    controller.check_rate("s2", "10.0.0.1")
+    assert rejection(lambda: controller.check_rate("s3", "10.0.0.1")).reason == "ip_rate_limited"
+    assert controller.session_buckets.take("s3") == 0 and controller.session_buckets.take("s3") == 0
+    # The shared "default" session and exempt addresses are not limited
+    for _ in range(5):
+        controller.check_rate("default", "127.0.0.1")
+
+    controller.close()
+    restarted = TokenBuckets("session", rate=0.1, burst=2, store=store)
+    assert restarted.take("s1") > 0 and restarted.take("fresh") == 0
+
+
+def test_concurrency_cap_queue_and_shedding():
+    async def run():
+        controller = AdmissionController(max_concurrent=2, max_queue=1, max_wait=0.3)
+        first, second = await controller.acquire(), await controller.acquire()
+        queued = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0.01)
+        try:
+            await controller.acquire()
+            raise AssertionError("admitted past a full queue")
+        except AdmissionRejected as e:
+            assert (e.status, e.reason) == (503, "queue_full")
+        first.release()
+        third = await queued
+        assert controller.running == 2 and third.waited > 0
+
+        # Nobody releases: the waiter gives up after max_wait
+        try:
+            await controller.acquire()
+            raise AssertionError("admitted without a slot")
+        except AdmissionRejected as e:
+            assert e.reason == "queue_timeout"
+
+        # Runs take ~1s on average, so a 0.3s budget cannot be met: shed without waiting
+        controller._avg_run = 1.0
+        try:
+            await controller.acquire()
+            raise AssertionError("queued a request that cannot start in time")
+        except AdmissionRejected as e:
+            assert e.reason == "overloaded" and e.headers == {"Retry-After": "1"}
+        # Background work waits instead
+        background = asyncio.create_task(controller.acquire(shed=False))
+        await asyncio.sleep(0.01)
+        second.release()
+        third.release()
+        (await background).release()
+        assert controller.running == 0 and not controller._waiters
+
+    asyncio.run(run())
+
+
+def test_webhook_answers_429_and_503_with_retry_after():
+    # No answer cache: a cached answer would skip the graph here and in later tests asking the same question
+    saved = (server.admission, server.agent_app, server.answer_cache)
+    server.agent_app = create_agent_graph(llm=FakeChatModel(latency=0.3), tools=[], checkpointer=BoundedMemorySaver(), routing=False)
+    server.answer_cache = None
+    server.admission = AdmissionController(max_concurrent=1, max_queue=0, max_wait=5,
+                                           session_buckets=TokenBuckets("session", rate=0.01, burst=1))
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            post = lambda session: client.post("/webhook", json={"input": "Which goods are covered?", "sessionId": session})
+            burst = await asyncio.gather(post("a"), post("b"), post("c"))
+            limited = await post("a")
+            return burst, limited, (await client.get("/stats/admission")).json()
+
+    try:
+        burst, limited, stats = asyncio.run(run())
+    finally:
+        server.admission, server.agent_app, server.answer_cache = saved
+    assert sorted(r.status_code for r in burst) == [200, 503, 503]
+    shed = next(r for r in burst if r.status_code == 503)
+    assert shed.json()["reason"] == "queue_full" and int(shed.headers["Retry-After"]) >= 1
+    assert limited.status_code == 429 and int(limited.headers["Retry-After"]) > 1
+    assert stats["outcomes"] == {"admitted": 1, "queue_full": 2, "session_rate_limited": 1} and stats["running"] == 0
+
+
+
+def test_batch_in_flight_leaves_room_for_interactive_requests():
+    saved = (server.admission, server.agent_app, server.answer_cache)
+    server.agent_app = create_agent_graph(llm=FakeChatModel(latency=0.1), tools=[], checkpointer=BoundedMemorySaver(), routing=False)
+    server.answer_cache = None
+    server.admission = AdmissionController(max_concurrent=2, max_queue=0, max_wait=5)
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            body = json.dumps([f"Question {i} about CBAM?" for i in range(12)])
+            batch = asyncio.create_task(client.post("/webhook/batch", content=body, headers={"Content-Type": "application/json"}))
+            await asyncio.sleep(0.15)
+            during = server.admission.snapshot()
+            interactive = await client.post("/webhook", json={"input": "Which goods are covered?", "sessionId": "live"})
+            return during, interactive, await batch
+
+    try:
+        during, interactive, batch = asyncio.run(run())
+        stats = server.admission.snapshot()
+    finally:
+        server.admission, server.agent_app, server.answer_cache = saved
+    # The batch holds its share (one of two slots) and queues the rest outside max_queue
+    assert during["background_running"] == 1 and during["background_queued"] > 0 and during["queued"] == 0
+    assert interactive.status_code == 200
+    assert all(json.loads(line)["status"] == "ok" for line in batch.text.splitlines()[:-1])
+    assert "queue_full" not in stats["outcomes"] and stats["running"] == 0
+
+
+def test_background_runs_are_paced_by_the_ip_bucket():
+    controller = AdmissionController(ip_buckets=TokenBuckets("ip", rate=20, burst=1))
+
+    async def run():
+        start = time.perf_counter()
+        for _ in range(3):
+            await controller.pace("203.0.113.7")
+        return time.perf_counter() - start
+
+    # One token per run: the second and third waited for theirs instead of failing with a 429
+    assert asyncio.run(run()) >= 0.09
+    assert "ip_rate_limited" not in controller.counts
+
+
+def test_spoofed_forwarded_for_does_not_change_the_ip_key():
+    saved_env = dict(os.environ)
+    os.environ.update({"FORWARDED_ALLOW_IPS": "10.0.0.0/8", "ADMISSION_IP_RATE": "0.01", "ADMISSION_IP_BURST": "2",
+                       "ADMISSION_SESSION_RATE": "0"})
+    os.environ.pop("ADMISSION_EXEMPT_IPS", None)
+    os.environ.pop("ADMISSION_STATE_PATH", None)
+    saved = (server.admission, server.agent_app, server.answer_cache)
+    server.agent_app = create_agent_graph(llm=FakeChatModel(latency=0), tools=[], checkpointer=BoundedMemorySaver(), routing=False)
+    server.answer_cache = None
+    server.admission = admission_from_env()
+
+    async def run():
+        # What uvicorn runs with --forwarded-allow-ips 10.0.0.0/8; the platform router connects from 10.1.2.3
+        # and appends the address the client really connected from
+        app = ProxyHeadersMiddleware(server.app, trusted_hosts=os.environ["FORWARDED_ALLOW_IPS"])
+        transport = httpx.ASGITransport(app=app, client=("10.1.2.3", 40000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = []
+            for i, forged in enumerate(["198.51.100.1", "127.0.0.1", "10.9.9.9", "198.51.100.2"]):
+                responses.append(await client.post("/webhook", json={"input": "Which goods are covered?", "sessionId": f"s{i}"},
+                                                   headers={"X-Forwarded-For": f"{forged}, 203.0.113.7"}))
+            return responses
+
+    try:
+        exempt = server.admission.exempt_ips
+        responses = asyncio.run(run())
+    finally:
+        server.admission, server.agent_app, server.answer_cache = saved
+        os.environ.clear()
+        os.environ.update(saved_env)
+    # Loopback is not exempt behind a proxy, and every request is charged to 203.0.113.7
+    assert not exempt
+    assert [r.status_code for r in responses] == [200, 200, 429, 429]
+    assert responses[-1].json()["reason"] == "ip_rate_limited"
+
+
+if __name__ == "__main__":
+    test_token_buckets_and_persistence()
+    test_concurrency_cap_queue_and_shedding()
+    test_webhook_answers_429_and_503_with_retry_after()
+    test_batch_in_flight_leaves_room_for_interactive_requests()
+    test_background_runs_are_paced_by_the_ip_bucket()
+    test_spoofed_forwarded_for_does_not_change_the_ip_key()
+    print("OK")
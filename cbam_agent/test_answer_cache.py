@@ -0,0 +1,97 @@
+import asyncio
+import os
+import uuid
+
+from langchain_core.tools import tool
+
+import answer_cache
+import server
+from agent import create_agent_graph
+from fakes import FakeChatModel
+from retrieval_cache import cache_from_env, normalise_query
+
+calls = []
+
+
+@tool
+async def counting_retriever(query: str) -> str:
+    """Fake retrieve_cbam_info that records each call."""
+    calls.append(query)
+    await asyncio.sleep(0.1)
+    return f"Stub passage for: {query}"
+
+
+counting_retriever.name = "retrieve_cbam_info"
+
+
+def post(question, session):
+    return server.webhook(server.WebhookInput(input=question, sessionId=session))
+
+
+def setup_module():
+    server.agent_app = create_agent_graph(llm=FakeChatModel(latency=0.01), tools=[counting_retriever])
+
+
+def test_concurrent_identical_questions_share_one_run():
+    calls.clear()
+    question = "What goods does CBAM cover?"
+
+    async def burst():
+        return await asyncio.gather(*(post(question, f"guest-{uuid.uuid4()}") for _ in range(10)))
+
+    results = asyncio.run(burst())
+    assert len(calls) == 1
+    assert len({r["output"] for r in results}) == 1
+    assert server.single_flight.coalesced >= 9
+
+
+def test_repeat_question_is_served_from_cache_and_keeps_history():
+    calls.clear()
+    question = "Who must register as a CBAM declarant?"
+    first = asyncio.run(post(question, f"prospect-{uuid.uuid4()}"))
+    session = f"prospect-{uuid.uuid4()}"
+    second = asyncio.run(post(question.upper(), session))
+    assert len(calls) == 1
+    assert second["output"] == first["output"]
+
+    snapshot = asyncio.run(server.agent_app.aget_state({"configurable": {"thread_id": session}}))
+    assert [m.type for m in snapshot.values["messages"]] == ["human", "ai"]
+
+    # A follow-up on the same session is not a first turn and runs the graph
+    asyncio.run(post("And for aluminium?", session))
+    assert len(calls) == 2
+
+
+def test_date_bucket_expires_answers():
+    calls.clear()
+    question = "Which records must an importer keep?"
+    asyncio.run(post(question, f"guest-{uuid.uuid4()}"))
+    original = answer_cache.current_date_label
+    answer_cache.current_date_label = lambda: "January 01, 2099"
+    try:
+        asyncio.run(post(question, f"guest-{uuid.uuid4()}"))
+    finally:
+        answer_cache.current_date_label = original
+    assert len(calls) == 2
+
+
+
+def test_semantic_threshold_does_not_apply_to_answers():
+    os.environ["ANSWER_CACHE_SEMANTIC_THRESHOLD"] = "0.9"
+    try:
+        cache = cache_from_env("ANSWER_CACHE", semantic=False)
+    finally:
+        del os.environ["ANSWER_CACHE_SEMANTIC_THRESHOLD"]
+    assert cache.semantic_threshold is None
+    question = normalise_query("When is the next reporting deadline?")
+    cache.store(f"v1|June 15, 2025|{question}", "yesterday's answer")
+    assert cache.lookup(f"v1|June 16, 2025|{question}") is None
+
+
+if __name__ == "__main__":
+    setup_module()
+    test_concurrent_identical_questions_share_one_run()
+    test_repeat_question_is_served_from_cache_and_keeps_history()
+    test_date_bucket_expires_answers()
+    test_semantic_threshold_does_not_apply_to_answers()
+    print("OK")
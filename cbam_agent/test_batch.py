@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+
+import httpx
+
+import server
+from agent import create_agent_graph
+from batch import BatchError, parse_batch, run_batch
+from fakes import FakeChatModel, make_fake_retriever
+
+
+def setup_module():
+    server.agent_app = create_agent_graph(llm=FakeChatModel(latency=0.01), tools=[make_fake_retriever(0.05)])
+
+
+def post_batch(body, content_type):
+    async def go():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/webhook/batch", content=body, headers={"Content-Type": content_type})
+
+    response = asyncio.run(go())
+    return response, [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_parse_formats():
+    as_json = parse_batch(b'[{"input": "Is 7208 covered?", "id": "a"}, "What is CBAM?"]')
+    assert [(i.index, i.input, i.id) for i in as_json] == [(0, "Is 7208 covered?", "a"), (1, "What is CBAM?", None)]
+    assert parse_batch(b'{"items": [{"input": "x"}]}')[0].input == "x"
+    as_csv = parse_batch(b"id,input,sessionId\nr1,Is 7208 covered?,\nr2,And 7209?,s1\n", "text/csv")
+    assert [(i.id, i.sessionId) for i in as_csv] == [("r1", None), ("r2", "s1")]
+    as_jsonl = parse_batch(b'{"input": "a"}\n\n{"input": "b", "sessionId": "s"}\n', "application/x-ndjson")
+    assert [i.input for i in as_jsonl] == ["a", "b"]
+    for bad, content_type in ((b"[]", "application/json"), (b"[{}]", "application/json"), (b"q\nx\n", "text/csv"), (b"{", "application/json")):
+        try:
+            parse_batch(bad, content_type)
+            raise AssertionError(f"accepted {bad!r}")
+        except BatchError:
+            pass
+
+
+def test_endpoint_streams_dedups_and_keeps_sessions():
+    items = [
+        {"input": "Is CN code 7208 covered by CBAM?", "id": "l1"},
+        {"input": "is cn code 7208 covered by cbam", "id": "l2"},
+        {"input": "Is CN code 7601 covered by CBAM?", "id": "l3"},
+        {"input": "What is CBAM?", "sessionId": "batch-session"},
+        {"input": "And who must report?", "sessionId": "batch-session"},
+    ]
+    response, lines = post_batch(json.dumps(items), "application/json")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results, summary = lines[:-1], lines[-1]
+    assert summary["done"] and summary["items"] == 5 and summary["unique_runs"] == 4 and summary["ok"] == 5
+    by_id = {r["id"]: r for r in results if r["id"]}
+    assert by_id["l2"]["duplicate_of"] == 0 and by_id["l2"]["output"] == by_id["l1"]["output"]
+    assert sorted(r["index"] for r in results) == [0, 1, 2, 3, 4]
+
+    snapshot = asyncio.run(server.agent_app.aget_state({"configurable": {"thread_id": "batch-session"}}))
+    assert [m.content for m in snapshot.values["messages"] if m.type == "human"] == ["What is CBAM?", "And who must report?"]
+
+
+def test_bad_body_is_rejected():
+    response, _ = post_batch(b"no input column\n", "text/csv")
+    assert response.status_code == 400
+    response, _ = post_batch(b"input\nWas kostet eine Tonne Stahl \xe4?\n", "text/csv")  # Latin-1
+    assert response.status_code == 400 and "UTF-8" in response.json()["detail"]
+
+
+def test_concurrency_and_timeouts():
+    running, peak = 0, 0
+
+    async def answer(question, thread_id):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(1 if "slow" in question else 0.05)
+            return question.upper()
+        finally:
+            running -= 1
+
+    items = parse_batch(json.dumps([f"question {i}" for i in range(20)] + ["slow one"]).encode())
+
+    async def collect():
+        return [line async for line in run_batch(items, answer, concurrency=4, item_timeout=0.2)]
+
+    start = time.perf_counter()
+    lines = asyncio.run(collect())
+    assert time.perf_counter() - start < 1
+    assert peak == 4
+    assert lines[-1]["ok"] == 20 and lines[-1]["timeout"] == 1
+    assert next(l for l in lines if l.get("input") == "slow one")["status"] == "timeout"
+
+
+if __name__ == "__main__":
+    setup_module()
+    test_parse_formats()
+    test_endpoint_streams_dedups_and_keeps_sessions()
+    test_bad_body_is_rejected()
+    test_concurrency_and_timeouts()
+    print("OK")
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import agent
+import llm_router
+from agent import create_agent_graph
+from cassettes import RECORD, REPLAY, Cassette, CassetteChatModel, CassetteMiss, CassettePineconeClient
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel, FakePineconeClient
+from prompt_cache import ContextCachedChat, PromptPrefix, bind_with_prefix
+
+QUESTIONS = ["Which records must an importer keep?", "Are 7208 51 20 and 7601 10 00 covered?"]
+
+
+def run_questions(llm, pinecone, stream=False):
+    """Answers and tool results of QUESTIONS through the real tools, with `pinecone` as agent.pinecone_client."""
+    saved = (agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache)
+    agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache = pinecone, "fake", "pinecone", None
+    graph = create_agent_graph(llm=llm, tools=[agent.retrieve_cbam_info, agent.lookup_cn_codes],
+                               checkpointer=BoundedMemorySaver(), routing=False)
+
+    async def run():
+        out = []
+        for i, question in enumerate(QUESTIONS):
+            config = {"configurable": {"thread_id": f"t{i}"}}
+            if stream:
+                tokens = [chunk.content async for chunk, _ in graph.astream({"messages": [HumanMessage(content=question)]},
+                                                                            config, stream_mode="messages") if chunk.type == "AIMessageChunk"]
+                out.append("".join(tokens))
+            messages = (await graph.aget_state(config)).values["messages"] if stream else \
+                (await graph.ainvoke({"messages": [HumanMessage(content=question)]}, config))["messages"]
+            out.append([(m.type, m.content) for m in messages])
+        return out
+
+    try:
+        return asyncio.run(run())
+    finally:
+        agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache = saved
+
+
+def test_record_then_replay_offline():
+    path = os.path.join(tempfile.mkdtemp(), "cassette.jsonl")
+    recorder = Cassette(path, RECORD)
+    live = FakeChatModel(latency=0.2)
+    recorded = run_questions(CassetteChatModel(cassette=recorder, name="fake", model=live),
+                             CassettePineconeClient(recorder, FakePineconeClient(latency=0.2, citations=2)))
+    with open(path) as f:
+        kinds = [json.loads(line)["kind"] for line in f]
+    assert kinds.count("llm") == 4 and kinds.count("pinecone") == 2
+
+    # No model and no Pinecone client behind the replay: everything comes from the file
+    for timing, bounds in (("recorded", (1.2, 3.0)), ("zero", (0, 0.6))):
+        player = Cassette(path, REPLAY, timing)
+        start = time.perf_counter()
+        replayed = run_questions(CassetteChatModel(cassette=player, name="fake"), CassettePineconeClient(player))
+        elapsed = time.perf_counter() - start
+        assert replayed == recorded and bounds[0] <= elapsed < bounds[1], (timing, elapsed)
+        assert player.snapshot()["hits"] == 6 and player.misses == 0
+
+
+def test_streaming_replay_and_misses():
+    path = os.path.join(tempfile.mkdtemp(), "cassette.jsonl")
+    recorder = Cassette(path, RECORD)
+    recorded = run_questions(CassetteChatModel(cassette=recorder, name="fake", model=FakeChatModel(latency=0, token_latency=0.01)),
+                             CassettePineconeClient(recorder, FakePineconeClient(latency=0)), stream=True)
+    player = Cassette(path, REPLAY, "zero")
+    assert run_questions(CassetteChatModel(cassette=player, name="fake"), CassettePineconeClient(player), stream=True) == recorded
+    assert recorded[0] == FakeChatModel().answer
+
+    # The date line does not matter; anything else that was not recorded does
+    model = CassetteChatModel(cassette=player, name="fake")
+    message = [SystemMessage(content="CURRENT DATE: March 3, 2031"), HumanMessage(content="hi")]
+    try:
+        asyncio.run(model.ainvoke(message))
+        raise AssertionError("replayed an unrecorded request")
+    except CassetteMiss:
+        pass
+    assert model._key(message) == model._key([SystemMessage(content="CURRENT DATE: October 16, 2026"), HumanMessage(content="hi")])
+
+
+
+def test_no_hedging_and_explicit_prompt_cache_under_a_cassette():
+    class ChatGoogleGenerativeAI(FakeChatModel):
+        """Stands in for the Gemini client: bind_with_prefix checks the class name."""
+
+    path = os.path.join(tempfile.mkdtemp(), "cassette.jsonl")
+    recorder = Cassette(path, RECORD)
+    saved = llm_router.cassette
+    llm_router.cassette = recorder
+    try:
+        router = llm_router.router_from_env(backends=[CassetteChatModel(cassette=recorder, name="gemini", model=ChatGoogleGenerativeAI())],
+                                            names=["gemini"])
+    finally:
+        llm_router.cassette = saved
+    # A hedge would record (or replay) a second response under the same key
+    assert router.hedge is False
+
+    bound = bind_with_prefix(router, [agent.retrieve_cbam_info], PromptPrefix(agent.SYSTEM_PROMPT), mode="explicit")
+    recording = bound.backends[0]
+    assert isinstance(recording, CassetteChatModel) and isinstance(recording.model, ContextCachedChat)
+    assert recording.tool_schema and recording.model.fallback.tools_bound
+
+
+if __name__ == "__main__":
+    test_record_then_replay_offline()
+    test_streaming_replay_and_misses()
+    test_no_hedging_and_explicit_prompt_cache_under_a_cassette()
+    print("OK")
@@ -0,0 +1,83 @@
+import os
+import tempfile
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from agent import SYSTEM_PROMPT
+from checkpoint_serde import DELTA_TYPE, MAX_DEPTH, DeltaSerializer, MemoryContentStore, SQLiteContentStore
+from checkpointer import BoundedMemorySaver, SQLiteSaver
+from test_checkpointer import run_turns
+
+
+def conversation(thread, turns):
+    messages = [SystemMessage(content=SYSTEM_PROMPT, id=f"{thread}-system")]
+    for i in range(turns):
+        messages += [
+            HumanMessage(content=f"Question {i} of {thread}", id=f"{thread}-h{i}"),
+            AIMessage(content="", tool_calls=[{"name": "retrieve_cbam_info", "args": {"query": f"q{i}"}, "id": f"call{i}"}],
+                      id=f"{thread}-a{i}", usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12}),
+            ToolMessage(content=f"Passage {i}. " * 80, tool_call_id=f"call{i}", id=f"{thread}-t{i}"),
+            AIMessage(content=f"Answer {i}", id=f"{thread}-b{i}"),
+        ]
+    return messages
+
+
+def test_roundtrip_and_plain_blobs_still_load():
+    serde = DeltaSerializer(MemoryContentStore())
+    messages = conversation("a", 3)
+    type_, blob = serde.dumps_typed(messages)
+    assert type_ == DELTA_TYPE and len(blob) == 16
+    loaded = serde.loads_typed((type_, blob))
+    assert loaded == messages and loaded[2].tool_calls == messages[2].tool_calls
+    # A fresh serializer on the same store reads it too (nothing comes from the in-process caches)
+    assert DeltaSerializer(serde.store).loads_typed((type_, blob)) == messages
+
+    value = {"summary": "x" * 2000, "route": "full"}
+    packed = serde.dumps_typed(value)
+    assert packed[0].endswith("+msgpack") and len(packed[1]) < 500 and serde.loads_typed(packed) == value
+    assert serde.loads_typed(JsonPlusSerializer().dumps_typed(messages)) == messages
+
+
+def test_lists_are_stored_as_deltas_with_interned_content():
+    store = MemoryContentStore()
+    serde = DeltaSerializer(store)
+    messages = conversation("a", 40)
+    serde.dumps_typed(messages[:1])
+    sizes = []
+    for end in range(2, len(messages) + 1):
+        before = store.size_bytes()
+        serde.dumps_typed(messages[:end])
+        sizes.append(store.size_bytes() - before)
+    # Each step stores its new message and a small node, however long the history is
+    assert max(sizes[-20:]) < 1.5 * max(sizes[4:24])
+    # Keyframes bound the chain a read walks
+    assert DeltaSerializer(store).loads_typed((DELTA_TYPE, serde.dumps_typed(messages)[1])) == messages
+    assert max(node[0] for node in serde._nodes.values()) <= MAX_DEPTH
+
+    # The system prompt of a second thread is stored once
+    before = store.size_bytes()
+    serde.dumps_typed(conversation("b", 1)[:1])
+    assert store.size_bytes() - before < 400
+
+
+def test_savers_with_delta_serde_and_content_sweep():
+    path = os.path.join(tempfile.mkdtemp(), "checkpoints.db")
+    for saver in (BoundedMemorySaver(serde=DeltaSerializer(MemoryContentStore(), grace=0)),
+                  SQLiteSaver(path, serde=DeltaSerializer(SQLiteContentStore(path), grace=0))):
+        plain = run_turns(BoundedMemorySaver(), "plain", turns=3)
+        delta = run_turns(saver, "delta", turns=3)
+        assert [(m.type, m.content) for m in delta] == [(m.type, m.content) for m in plain]
+        run_turns(saver, "other", turns=1)
+
+        assert saver.sweep_content() == 0
+        saver.delete_thread("delta")
+        assert saver.sweep_content() > 0
+        assert len(run_turns(saver, "other", turns=1)) == 8
+
+
+if __name__ == "__main__":
+    test_roundtrip_and_plain_blobs_still_load()
+    test_lists_are_stored_as_deltas_with_interned_content()
+    test_savers_with_delta_serde_and_content_sweep()
+    print("OK")
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from cn_codes import COVERED, EXCLUDED, INVALID, NOT_COVERED, PARTLY, CNIndex, cn_index, lookup_cn_codes
+from fakes import FakeChatModel
+
+
+def test_codes_prefixes_and_ranges():
+    match = cn_index.lookup("7208 51 20")
+    assert (match.status, match.entry.label, match.entry.category) == (COVERED, "7208", "Iron and steel")
+    assert cn_index.lookup("7202.41.10").entry.description == "Ferro-chromium"
+    # Only some subheadings of 7202 are in Annex I
+    partly = cn_index.lookup("7202")
+    assert partly.status == PARTLY and [e.label for e in partly.entries] == ["7202 1", "7202 4", "7202 6"]
+    # Carve-outs and headings printed with trailing zeros
+    assert cn_index.lookup("3105 60 00").status == EXCLUDED
+    heading = cn_index.lookup("3105")
+    assert heading.status == COVERED and [e.label for e in heading.entries] == ["3105 60 00"]
+    assert cn_index.lookup("3105 10 00").status == COVERED and not cn_index.lookup("3105 10 00").entries
+    assert cn_index.lookup("2716").status == COVERED and cn_index.lookup("2716 00 00").entry.category == "Electricity"
+    assert cn_index.lookup("0101 21 00").status == NOT_COVERED
+    assert cn_index.lookup("7205 10 00").entry.category == "Iron and steel"
+    assert cn_index.lookup("721").status == COVERED
+
+    # Ranges are covered when their entries leave no gap and no carve-out inside
+    span = cn_index.resolve("7208-7212")
+    assert span.status == COVERED and [e.label for e in span.entries] == ["7208", "7209", "7210", "7211", "7212"]
+    assert cn_index.resolve("7205-7212").status == COVERED
+    assert cn_index.resolve("7203-7208").status == PARTLY  # 7204 (scrap) is not in Annex I
+    assert cn_index.resolve("3102-3105").status == PARTLY and cn_index.resolve("3104-3105").status == PARTLY
+    assert cn_index.resolve("7208 10 to 7208 90").status == COVERED
+    assert cn_index.resolve("0101-0106").status == NOT_COVERED
+    assert cn_index.resolve("steel").status == INVALID and cn_index.resolve("7212-7208").status == INVALID
+
+
+def test_batch_table_and_speed():
+    table = lookup_cn_codes.invoke({"codes": ["7601 10 00", "7202", "3105 60 00", "abc"]})
+    assert "| 7601 10 00 | yes | 7601 Unwrought aluminium | Aluminium (CO2, PFCs) |" in table
+    assert "Default SEE" not in table
+    assert "| 7202 | partly |" in table and "| 3105 60 00 | no (excluded) |" in table and "| abc | invalid:" in table
+    assert f"CN index v{cn_index.version}" in table
+
+    codes = [f"{heading}{sub:02d}{i % 100:02d}" for heading in ("7208", "2523", "0101", "7202", "3105") for sub in range(10)
+             for i in range(20)]
+    start = time.perf_counter()
+    matches = cn_index.resolve_many(codes)
+    elapsed = time.perf_counter() - start
+    print(f"{len(codes)} lookups in {elapsed * 1000:.1f}ms")
+    assert len(matches) == 1000 and elapsed < 0.1
+
+
+def test_versioned_data_file():
+    path = os.path.join(tempfile.mkdtemp(), "annex.json")
+    with open(path, "w") as f:
+        json.dump({"format": 1, "version": "test-2", "goods": [
+            {"cn": "2804 10 00", "description": "Hydrogen", "category": "Hydrogen", "gases": ["CO2"]}]}, f)
+    index = CNIndex.load(path)
+    assert index.version == "test-2" and index.lookup("2804 10 00").status == COVERED
+    assert index.lookup("7208").status == NOT_COVERED
+
+    with open(path, "w") as f:
+        json.dump({"format": 99, "version": "x", "goods": []}, f)
+    try:
+        CNIndex.load(path)
+        raise AssertionError("loaded an unknown format")
+    except ValueError:
+        pass
+
+
+def test_tool_is_called_through_the_graph():
+    app = create_agent_graph(llm=FakeChatModel(latency=0, tool_mode="codes"), checkpointer=BoundedMemorySaver(), routing=False)
+    result = asyncio.run(app.ainvoke({"messages": [("user", "Are 7208 51 20 and 0101 21 00 covered by CBAM?")]},
+                                     {"configurable": {"thread_id": "codes"}}))
+    tool_result = next(m for m in result["messages"] if m.type == "tool")
+    assert tool_result.name == "lookup_cn_codes"
+    assert "| 7208 51 20 | yes |" in tool_result.content and "| 0101 21 00 | no |" in tool_result.content
+
+
+if __name__ == "__main__":
+    test_codes_prefixes_and_ranges()
+    test_batch_table_and_speed()
+    test_versioned_data_file()
+    test_tool_is_called_through_the_graph()
+    print("OK")
@@ -0,0 +1,74 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from agent import SYSTEM_PROMPT, create_agent_graph
+from checkpointer import BoundedMemorySaver
+from context_budget import ContextBudget, estimate_tokens
+from fakes import FakeChatModel, make_fake_retriever
+
+
+def long_thread(turns):
+    messages = [SystemMessage(content=SYSTEM_PROMPT)]
+    for i in range(turns):
+        messages += [
+            HumanMessage(content=f"Question {i} about CN code 72{i:02d}"),
+            AIMessage(content="", tool_calls=[{"name": "retrieve_cbam_info", "args": {"query": f"q{i}"}, "id": f"call_{i}"}]),
+            ToolMessage(content="Pinecone passage " * 500, tool_call_id=f"call_{i}"),
+            AIMessage(content=f"Answer {i}. **Source: Pinecone Knowledge Base**"),
+        ]
+    return messages
+
+
+def test_window_compaction_and_summary():
+    messages = long_thread(20)
+    budget = ContextBudget(max_tokens=6000, window_turns=4, tool_result_chars=300)
+    trimmed, update = asyncio.run(budget.apply(messages))
+
+    assert trimmed[0].content == SYSTEM_PROMPT
+    assert trimmed[1].content.startswith("SUMMARY OF EARLIER CONVERSATION")
+    assert "Question 0 about CN code 7200" in trimmed[1].content
+    humans = [m.content for m in trimmed if isinstance(m, HumanMessage)]
+    assert humans == [f"Question {i} about CN code 72{i:02d}" for i in range(16, 20)]
+    tools = [m for m in trimmed if isinstance(m, ToolMessage)]
+    assert all("compacted" in m.content for m in tools[:-1])
+    assert "compacted" not in tools[-1].content  # the current turn keeps its full tool result
+    assert update == {"summary": update["summary"], "summary_upto": 16 * 4}
+    assert estimate_tokens(trimmed) < estimate_tokens(messages) / 5
+
+
+def test_summary_is_incremental():
+    budget = ContextBudget(window_turns=2)
+    messages = long_thread(5)
+    _, update = asyncio.run(budget.apply(messages))
+    assert update["summary_upto"] == 12
+    # Same history again: nothing new left the window, so no new summary
+    _, again = asyncio.run(budget.apply(messages, update["summary"], update["summary_upto"]))
+    assert again is None
+
+
+def test_graph_stores_rolling_summary():
+    graph = create_agent_graph(
+        llm=FakeChatModel(latency=0),
+        tools=[make_fake_retriever(0)],
+        checkpointer=BoundedMemorySaver(),
+        budget=ContextBudget(window_turns=2),
+    )
+    config = {"configurable": {"thread_id": "client-user@example.com"}}
+
+    async def go():
+        await graph.ainvoke({"messages": [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content="turn 0")]}, config)
+        for i in range(1, 5):
+            await graph.ainvoke({"messages": [HumanMessage(content=f"turn {i}")]}, config)
+        return (await graph.aget_state(config)).values
+
+    state = asyncio.run(go())
+    assert "turn 0" in state["summary"] and "turn 2" in state["summary"]
+    assert state["summary_upto"] == 12
+
+
+if __name__ == "__main__":
+    test_window_compaction_and_summary()
+    test_summary_is_incremental()
+    test_graph_stores_rolling_summary()
+    print("OK")
@@ -0,0 +1,117 @@
+import asyncio
+import datetime
+import time
+
+import server
+from agent import create_agent_graph
+from deadlines import route_timeline_question
+from fakes import FakeChatModel, make_fake_retriever
+
+TODAY = datetime.date(2025, 6, 15)
+
+# (question, expected intent or None for "send to the full graph")
+LABELLED = [
+    ("When is the next reporting deadline?", "next_deadline"),
+    ("When is the next reporting deadline for 2025?", "next_deadline"),
+    ("what's the upcoming CBAM report deadline", "next_deadline"),
+    ("When is my next CBAM report due?", "next_deadline"),
+    ("Next deadline?", "next_deadline"),
+    ("When do I have to submit the next quarterly report?", "next_deadline"),
+    ("When is the Q2 2025 report due?", "quarter_deadline"),
+    ("Q1 2025 reporting deadline", "quarter_deadline"),
+    ("deadline for the third quarter of 2025 report", "quarter_deadline"),
+    ("When is the Q4 2024 report deadline?", "quarter_deadline"),
+    ("When is the fourth quarter 2025 report due?", "quarter_deadline"),
+    ("When does the definitive phase start?", "definitive_phase_start"),
+    ("When do importers have to start buying CBAM certificates?", "definitive_phase_start"),
+    ("What is the start date of the definitive period?", "definitive_phase_start"),
+    ("When does the transitional phase end?", "transitional_phase_end"),
+    ("How long does the transitional period last?", "transitional_phase_end"),
+    # Not confident / needs the graph
+    ("Calculate the specific embedded emissions for 500 tons of steel with 1200 tons of CO2e total emissions.", None),
+    ("Compare the reporting requirements for the transitional phase vs the definitive phase.", None),
+    ("What happens if I miss the Q2 2025 reporting deadline?", None),
+    ("Is there a penalty for late reporting?", None),
+    ("What is the purpose of CBAM?", None),
+    ("Hello, are you online?", None),
+    ("Is CN code 7208 covered by CBAM?", None),
+    ("When is the Q3 report due?", None),  # no year given
+    ("Can I get an extension on the next deadline?", None),
+    ("What are the default values for cement?", None),
+    ("How do I register as an authorised CBAM declarant?", None),
+    ("When is the next deadline for steel importers?", None),
+    ("When will the Commission report on extending CBAM scope?", None),
+    ("When is the CBAM declarant application due?", None),
+    ("What is the next step after I submit my report?", None),
+    ("When do I need to file for authorised declarant status?", None),
+    ("What changes are coming in the next reporting period?", None),
+    ("When is the next report due and what must it include?", None),
+    ("When is the deadline to surrender CBAM certificates?", None),
+    ("And when is it due?", None),  # a follow-up: what "it" is lives in the thread
+]
+
+
+def test_routing_accuracy():
+    correct = 0
+    for question, expected in LABELLED:
+        routed = route_timeline_question(question, TODAY)
+        intent = routed.intent if routed else None
+        correct += intent == expected
+        if intent != expected:
+            print(f"MISROUTED: {question!r} -> {intent} (expected {expected})")
+    accuracy = correct / len(LABELLED)
+    print(f"Routing accuracy: {accuracy:.1%} over {len(LABELLED)} questions")
+    assert accuracy >= 0.95
+
+
+def test_answers_follow_the_current_date():
+    answer = route_timeline_question("When is the next reporting deadline?", TODAY).answer
+    assert "Q2 2025 Report Deadline — July 31, 2025" in answer
+    assert "Q1 2025 (April 30, 2025)" in answer
+    assert "Source: Critical Facts" in answer
+
+    assert "Q4 2025 Report Deadline — January 31, 2026" in route_timeline_question("next deadline?", datetime.date(2025, 11, 1)).answer
+    assert "UPCOMING" in route_timeline_question("Q3 2025 report deadline", TODAY).answer
+    assert "PASSED" in route_timeline_question("Q3 2025 report deadline", datetime.date(2025, 11, 1)).answer
+    assert "began" in route_timeline_question("When does the definitive phase start?", datetime.date(2026, 2, 1)).answer
+    # Beyond the known schedule the router is not confident and defers to the graph
+    assert route_timeline_question("When is the next reporting deadline?", datetime.date(2026, 3, 1)) is None
+
+
+def test_latency_sub_millisecond():
+    questions = [q for q, _ in LABELLED]
+    timings = []
+    for _ in range(200):
+        for question in questions:
+            start = time.perf_counter()
+            route_timeline_question(question, TODAY)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1e6
+    p99 = timings[int(len(timings) * 0.99)] * 1e6
+    print(f"Router latency: p50={p50:.1f}us p99={p99:.1f}us")
+    assert p99 < 1000
+
+
+def test_webhook_answers_without_llm():
+    # An LLM that would take 10s: the fast path must not touch it
+    server.agent_app = create_agent_graph(llm=FakeChatModel(latency=10), tools=[make_fake_retriever(0)])
+    today = datetime.date.today()
+    expected = route_timeline_question("When does the definitive phase start?", today).answer
+
+    start = time.perf_counter()
+    result = asyncio.run(server.webhook(server.WebhookInput(input="When does the definitive phase start?", sessionId="fast-path")))
+    assert time.perf_counter() - start < 1
+    assert result["output"] == expected and result["thread_id"] == "fast-path"
+    assert result["request_id"]
+
+    snapshot = asyncio.run(server.agent_app.aget_state({"configurable": {"thread_id": "fast-path"}}))
+    assert [m.type for m in snapshot.values["messages"]] == ["human", "ai"]
+
+
+if __name__ == "__main__":
+    test_routing_accuracy()
+    test_answers_follow_the_current_date()
+    test_latency_sub_millisecond()
+    test_webhook_answers_without_llm()
+    print("OK")
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import numpy as np
+
+from agent import create_agent_graph
+from emissions import ProductLine, calculate, calculate_cbam_emissions
+from fakes import FakeChatModel
+
+
+def test_steel_example():
+    # The "500 tons of steel with 1200 tons of CO2e" question
+    table = calculate_cbam_emissions.invoke({
+        "lines": [{"product": "steel", "quantity_tonnes": 500, "total_emissions_tco2e": 1200}],
+        "certificate_price_eur": 80,
+    })
+    assert "| steel | 500.00 | 2.4000 | 1,200.00 | 1,200.00 | 96,000.00 |" in table
+    assert "Certificates to surrender (rounded up): 1,200" in table
+    assert "Source: CBAM calculator" in table
+
+
+def test_deductions_and_mixed_inputs():
+    result = calculate([
+        ProductLine(product="cement", quantity_tonnes=1000, specific_emissions=0.8, free_allocation_per_tonne=0.7),
+        ProductLine(product="aluminium", quantity_tonnes=10, total_emissions_tco2e=85.5, carbon_price_paid_eur=20),
+        ProductLine(product="hydrogen", quantity_tonnes=2, specific_emissions=1, free_allocation_per_tonne=5),
+    ], certificate_price_eur=80)
+    assert np.allclose(result["embedded"], [800, 85.5, 2])
+    assert np.allclose(result["see"], [0.8, 8.55, 1])
+    assert np.allclose(result["certificates"], [100, 85.5 * 0.75, 0])
+    assert np.allclose(result["cost"], [8000, 85.5 * 60, 0])
+
+
+def test_invalid_input_is_reported_to_the_model():
+    assert calculate_cbam_emissions.invoke({"lines": [{"product": "steel", "quantity_tonnes": 5}]}).startswith("Error:")
+    assert calculate_cbam_emissions.invoke({"lines": [
+        {"product": "steel", "quantity_tonnes": 5, "specific_emissions": 2, "carbon_price_paid_eur": 10}]}).startswith("Error:")
+    table = calculate_cbam_emissions.invoke({"lines": [{"product": "steel", "quantity_tonnes": 3, "specific_emissions": 0.5}]})
+    assert "cost not computed" in table and "rounded up): 2" in table
+
+
+def test_negative_deductions_are_rejected():
+    # A negative free allocation or carbon price would inflate the certificates instead of deducting
+    for field in ("free_allocation_per_tonne", "carbon_price_paid_eur"):
+        try:
+            calculate_cbam_emissions.invoke({"lines": [
+                {"product": "steel", "quantity_tonnes": 5, "specific_emissions": 2, field: -1}], "certificate_price_eur": 80})
+            raise AssertionError(f"accepted negative {field}")
+        except ValueError:
+            pass
+
+
+def test_many_lines_are_fast():
+    lines = [ProductLine(product=f"line-{i}", quantity_tonnes=i + 1, specific_emissions=1.5) for i in range(5000)]
+    start = time.perf_counter()
+    result = calculate(lines, certificate_price_eur=75)
+    elapsed = time.perf_counter() - start
+    print(f"5000 lines in {elapsed * 1000:.1f}ms")
+    assert result["embedded"].sum() == 1.5 * 5000 * 5001 / 2
+    assert elapsed < 0.5
+
+
+def test_tool_is_bound_in_the_graph():
+    app = create_agent_graph(llm=FakeChatModel(latency=0, use_tools=False))
+    assert "calculate_cbam_emissions" in app.get_graph().nodes["tools"].data.tools_by_name
+    result = asyncio.run(app.ainvoke({"messages": [("user", "hi")]}, {"configurable": {"thread_id": "calc"}}))
+    assert result["messages"][-1].type == "ai"
+
+
+if __name__ == "__main__":
+    test_steel_example()
+    test_deductions_and_mixed_inputs()
+    test_invalid_input_is_reported_to_the_model()
+    test_negative_deductions_are_rejected()
+    test_many_lines_are_fast()
+    test_tool_is_bound_in_the_graph()
+    print("OK")
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+import httpx
+
+import server
+from agent import create_agent_graph
+from fakes import FakeChatModel, make_fake_retriever
+from jobs import JobStore, JobWorkerPool
+
+
+def setup_module():
+    server.agent_app = create_agent_graph(llm=FakeChatModel(latency=0.01), tools=[make_fake_retriever(0.02)])
+    server.job_store = JobStore(os.path.join(tempfile.mkdtemp(), "jobs.db"))
+
+
+async def poll(client, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("done", "failed", "cancelled"):
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_submit_poll_and_cancel():
+    async def scenario():
+        pool = JobWorkerPool(server.job_store, server.answer_question, concurrency=2, poll_interval=0.05)
+        pool.start()
+        transport = httpx.ASGITransport(app=server.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                submitted = await client.post("/jobs", json={"input": "What is CBAM?", "sessionId": "job-thread"})
+                assert submitted.status_code == 202 and submitted.json()["status"] == "queued"
+                job = await poll(client, submitted.json()["job_id"])
+                assert job["status"] == "done" and "Carbon Border" in job["output"]
+                assert job["thread_id"] == "job-thread"
+
+                assert (await client.get("/jobs/nope")).status_code == 404
+                assert (await client.delete("/jobs/nope")).status_code == 404
+        finally:
+            await pool.stop()
+
+    asyncio.run(scenario())
+
+
+def test_running_job_is_cancelled_and_queued_job_never_runs():
+    store = JobStore(os.path.join(tempfile.mkdtemp(), "jobs.db"))
+    started = []
+
+    async def slow_answer(text, thread_id):
+        started.append(text)
+        await asyncio.sleep(10)
+        return "late"
+
+    async def scenario():
+        pool = JobWorkerPool(store, slow_answer, concurrency=1, poll_interval=0.05)
+        running = store.submit("first", "s1")
+        queued = store.submit("second", "s2")
+        pool.start()
+        try:
+            while store.get(running)["status"] != "running":
+                await asyncio.sleep(0.01)
+            assert store.cancel(queued) == "cancelled"
+            assert store.cancel(running) == "running"
+            start = time.monotonic()
+            while store.get(running)["status"] == "running":
+                await asyncio.sleep(0.01)
+            assert time.monotonic() - start < 1
+            await asyncio.sleep(0.2)
+        finally:
+            await pool.stop()
+        return running
+
+    running = asyncio.run(scenario())
+    assert store.get(running)["status"] == "cancelled"
+    assert started == ["first"]
+
+
+def test_expired_lease_is_picked_up_by_another_worker():
+    store = JobStore(os.path.join(tempfile.mkdtemp(), "jobs.db"), lease=0.1)
+    job_id = store.submit("What is CBAM?", "s")
+    assert store.claim("worker-a")["id"] == job_id
+    assert store.claim("worker-b") is None
+    time.sleep(0.15)
+    job = store.claim("worker-b")
+    assert job["id"] == job_id and job["attempts"] == 2
+    # The old worker can no longer write a result
+    store.finish(job_id, "worker-a", "done", output="stale")
+    store.finish(job_id, "worker-b", "done", output="fresh")
+    assert store.get(job_id)["output"] == "fresh"
+    assert store.counts() == {"done": 1}
+
+
+def test_content_parts_are_stored_as_text_and_store_errors_spare_the_worker():
+    class FlakyStore(JobStore):
+        failures = 1
+
+        def claim(self, worker):
+            if self.failures:
+                self.failures -= 1
+                raise sqlite3.OperationalError("database is locked")
+            return super().claim(worker)
+
+    store = FlakyStore(os.path.join(tempfile.mkdtemp(), "jobs.db"))
+
+    async def answer(text, thread_id):
+        # Gemini content parts
+        return [{"type": "text", "text": "CBAM is "}, {"type": "text", "text": "a levy."}]
+
+    async def scenario():
+        pool = JobWorkerPool(store, answer, concurrency=1, poll_interval=0.05)
+        job_id = store.submit("What is CBAM?", "parts")
+        pool.start()
+        try:
+            for _ in range(100):
+                if store.get(job_id)["status"] not in ("queued", "running"):
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await pool.stop()
+        return store.get(job_id)
+
+    job = asyncio.run(scenario())
+    assert (job["status"], job["output"]) == ("done", "CBAM is a levy.")
+
+
+def test_drain_finishes_short_jobs_and_requeues_long_ones():
+    store = JobStore(os.path.join(tempfile.mkdtemp(), "jobs.db"))
+
+    async def answer(text, thread_id):
+        await asyncio.sleep(0.1 if text == "short" else 10)
+        return text
+
+    async def scenario():
+        pool = JobWorkerPool(store, answer, concurrency=2, poll_interval=0.05)
+        short, long = store.submit("short", "a"), store.submit("long", "b")
+        pool.start()
+        while store.counts().get("running", 0) < 2:
+            await asyncio.sleep(0.01)
+        waiting = store.submit("waiting", "c")
+        start = time.monotonic()
+        await pool.drain(timeout=0.5)
+        assert time.monotonic() - start < 1
+        return short, long, waiting
+
+    short, long, waiting = asyncio.run(scenario())
+    assert store.get(short)["status"] == "done"
+    # Handed back at once rather than after the lease, and nothing new was claimed while draining
+    assert store.get(long)["status"] == "queued" and store.get(long)["worker"] is None
+    assert store.get(waiting)["status"] == "queued"
+
+
+if __name__ == "__main__":
+    setup_module()
+    test_submit_poll_and_cancel()
+    test_running_job_is_cancelled_and_queued_job_never_runs()
+    test_expired_lease_is_picked_up_by_another_worker()
+    test_content_parts_are_stored_as_text_and_store_errors_spare_the_worker()
+    test_drain_finishes_short_jobs_and_requeues_long_ones()
+    print("OK")
@@ -0,0 +1,104 @@
+import asyncio
+import time
+import uuid
+
+import httpx
+from langchain_core.messages import HumanMessage
+
+import server
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel, make_fake_retriever
+from llm_router import LLMUnavailable, RoutedChatModel
+
+
+def router(*backends, **kwargs):
+    # Unique names: stats are shared per backend name across the process
+    names = [f"{b.answer}-{uuid.uuid4().hex[:6]}" for b in backends]
+    return RoutedChatModel(backends=list(backends), names=names, **kwargs)
+
+
+def fake(answer, latency=0.01, error=None):
+    return FakeChatModel(answer=answer, latency=latency, error=error, use_tools=False)
+
+
+def ask(llm, text="What is CBAM?"):
+    return asyncio.run(llm.ainvoke([HumanMessage(content=text)]))
+
+
+def test_primary_answers_without_hedging():
+    llm = router(fake("primary"), fake("secondary"), hedge_delay=1)
+    assert ask(llm).content == "primary"
+    primary, secondary = llm.stats
+    assert (primary.calls, secondary.calls, primary.hedges) == (1, 0, 0)
+
+
+def test_falls_back_on_error_and_rate_limit_with_cooldown():
+    llm = router(fake("down", error="503 backend unavailable"), fake("limited", error="429 RESOURCE_EXHAUSTED"),
+                 fake("spare"), hedge=False)
+    assert ask(llm).content == "spare"
+    down, limited, spare = llm.stats
+    assert (down.errors, limited.rate_limited, spare.calls) == (1, 1, 1)
+    assert down.cooling_down() and limited.cooling_down()
+    # Failed backends go last until their cooldown ends
+    assert llm.order() == [2, 0, 1]
+
+
+def test_slow_primary_is_hedged_after_its_p95():
+    llm = router(fake("slow", latency=1.0), fake("fast", latency=0.02), hedge_min_samples=3)
+    for _ in range(3):
+        llm.stats[0].record("ok", 0.05)
+    start = time.perf_counter()
+    assert ask(llm).content == "fast"
+    assert time.perf_counter() - start < 0.5
+    slow, fast = llm.stats
+    assert (slow.hedges, fast.hedges, fast.hedge_wins) == (0, 1, 1)
+
+
+def test_single_backend_hedges_to_itself_and_deadline_raises():
+    llm = router(fake("only", latency=0.3), hedge_delay=0.05, deadline=0.15)
+    try:
+        ask(llm)
+        raise AssertionError("expected LLMUnavailable")
+    except LLMUnavailable as e:
+        assert "deadline" in str(e)
+    only = llm.stats[0]
+    assert (only.hedges, only.timeouts) == (1, 2)
+
+
+def test_latency_routing_prefers_the_faster_backend():
+    llm = router(fake("a"), fake("b"), routing="latency", hedge_min_samples=2)
+    for _ in range(2):
+        llm.stats[0].record("ok", 2.0)
+        llm.stats[1].record("ok", 0.2)
+    assert llm.order() == [1, 0]
+    assert ask(llm).content == "b"
+
+
+def test_graph_streams_through_router_without_duplicate_tokens():
+    slow = FakeChatModel(latency=1.0, answer="slow answer")
+    fast = FakeChatModel(latency=0.01, answer="fast answer")
+    llm = router(slow, fast, hedge_delay=0.05)
+    server.agent_app = create_agent_graph(llm=llm, tools=[make_fake_retriever(0.01)], checkpointer=BoundedMemorySaver())
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = (await client.post("/webhook/stream", json={"input": "Which goods are covered?", "sessionId": "routed"})).text
+            stats = (await client.get("/stats/llm")).json()
+        return body, stats
+
+    body, stats = asyncio.run(run())
+    tokens = "".join(line.split('"text": "')[1].split('"')[0] for line in body.splitlines() if '"text": ' in line)
+    assert tokens == "fast answer"
+    assert stats[llm.names[1]]["hedge_wins"] == 2  # the tool-call round and the answer
+
+
+if __name__ == "__main__":
+    test_primary_answers_without_hedging()
+    test_falls_back_on_error_and_rate_limit_with_cooldown()
+    test_slow_primary_is_hedged_after_its_p95()
+    test_single_backend_hedges_to_itself_and_deadline_raises()
+    test_latency_routing_prefers_the_faster_backend()
+    test_graph_streams_through_router_without_duplicate_tokens()
+    print("OK")
@@ -0,0 +1,48 @@
+import tempfile
+
+from ingest import chunk_text, detect_date
+from local_index import Chunk, LocalIndex, build_index, format_passages
+
+CHUNKS = [
+    Chunk("Embedded emissions of steel are calculated from direct and indirect emissions of the installation.", "reg_2023_956.pdf", "2023-05-17"),
+    Chunk("Default values for cement clinker may be used where actual data is not available.", "ir_2023_1773.pdf", "2023-08-17"),
+    Chunk("CN code 7208 flat-rolled products of iron or non-alloy steel are listed in Annex I.", "annex_i.txt", "2023-05-17"),
+    Chunk("Authorised CBAM declarants must surrender certificates by 31 May each year.", "omnibus_2025-02-26.txt", "2025-02-26"),
+]
+
+
+def test_search_returns_sources_and_dates():
+    path = tempfile.mkdtemp()
+    build_index(CHUNKS, path)
+    index = LocalIndex(path)
+
+    top = index.search("What are the default values for cement clinker?", k=2)
+    assert top[0].source == "ir_2023_1773.pdf"
+    assert top[0].date == "2023-08-17"
+    assert index.search("Is CN code 7208 covered?", k=1)[0].source == "annex_i.txt"
+    assert index.search("steel embedded emissions", k=1)[0].source == "reg_2023_956.pdf"
+
+    formatted = format_passages(top)
+    assert formatted.startswith("[1] Source: ir_2023_1773.pdf | Date: 2023-08-17")
+
+
+def test_ingest_helpers():
+    assert detect_date("omnibus_2025-02-26.txt", "") == "2025-02-26"
+    assert detect_date("reg.pdf", "REGULATION (EU) 2023/956 of 10 May 2023") == "2023-05-10"
+    text = "\n\n".join(" ".join(f"w{p}_{i}" for i in range(150)) for p in range(3))
+    chunks = chunk_text(text, chunk_words=200, overlap_words=40)
+    assert all(len(c.split()) <= 200 for c in chunks)
+    assert chunks[1].split()[:40] == chunks[0].split()[-40:]
+    assert chunks[-1].split()[-1] == "w2_149"
+    for chunk_words, overlap_words in ((200, 200), (200, 300), (0, 0)):
+        try:
+            chunk_text(text, chunk_words, overlap_words)
+            raise AssertionError(f"accepted {chunk_words}/{overlap_words}")
+        except ValueError:
+            pass
+
+
+if __name__ == "__main__":
+    test_search_returns_sources_and_dates()
+    test_ingest_helpers()
+    print("OK")
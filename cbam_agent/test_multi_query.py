@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage
+
+import agent
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel, FakePineconeClient, make_fake_retriever
+from multi_query import fuse, plan_queries, split_question
+
+
+def test_question_splitting():
+    assert split_question("Compare the reporting requirements for the transitional phase vs the definitive phase") == [
+        "the reporting requirements for the transitional phase",
+        "the reporting requirements for the definitive phase",
+    ]
+    assert split_question("What are the differences between direct and indirect emissions?") == [
+        "direct emissions", "indirect emissions"]
+    assert split_question("Which goods are covered? Who is the declarant?") == ["Which goods are covered", "Who is the declarant"]
+    assert split_question("Which goods are covered by CBAM?") == []
+    # The model's own sub-queries win; the question is always searched too, duplicates dropped
+    assert plan_queries("Steel vs aluminium", ["steel", "Steel", "aluminium"]) == ["Steel vs aluminium", "steel", "aluminium"]
+    assert len(plan_queries("a? b? c? d? e? f?", limit=4)) == 4
+
+
+def test_fusion_dedupes_and_ranks_shared_passages_first():
+    results = [
+        "Source: Annex I\nSteel passage.\n\nShared passage about default values.",
+        "Shared passage about default values.\n\nAluminium passage.",
+        "ERROR: This tool cannot answer deadline/timeline questions.",
+    ]
+    fused = fuse(["steel", "aluminium", "deadline"], results)
+    blocks = fused.split("\n\n")
+    assert blocks[0].startswith("Sub-queries: (1) steel | (2) aluminium")
+    assert blocks[1] == "[1] (sub-queries 1,2) Shared passage about default values."
+    assert fused.count("Shared passage") == 1 and "ERROR" not in fused
+    assert "omitted" in fuse(["q"], ["\n\n".join(f"Passage {i} " * 20 for i in range(20))], max_chars=600)
+    assert fuse(["q"], ["Error querying Pinecone: timeout"]).startswith("Error")
+
+
+def test_fusion_keeps_citations_and_refs():
+    results = [
+        'Steel answer.\n\nCitations:\n[1] annex.pdf p. 3: "steel"\n[2] faq.pdf p. 1\n\n(full response: ref aaaa1111)',
+        'Aluminium answer.\n\nCitations:\n[1] faq.pdf p. 1\n\n(full response: ref bbbb2222)',
+    ]
+    fused = fuse(["steel", "aluminium"], results, max_chars=300)
+    blocks = fused.split("\n\n")
+    # Citations are not passages; they follow once, merged and renumbered, then both refs
+    assert [b for b in blocks if b.startswith("[")] == ["[1] (sub-queries 1) Steel answer.", "[2] (sub-queries 2) Aluminium answer."]
+    assert blocks[-2] == 'Citations:\n[1] annex.pdf p. 3: "steel"\n[2] faq.pdf p. 1'
+    assert blocks[-1] == "(full response: ref aaaa1111, ref bbbb2222)"
+
+
+def test_tool_calls_of_one_turn_run_concurrently():
+    graph = create_agent_graph(llm=FakeChatModel(latency=0.01, tool_rounds=3, tool_mode="parallel"),
+                               tools=[make_fake_retriever(0.3)], checkpointer=BoundedMemorySaver(), routing=False)
+    start = time.perf_counter()
+    state = asyncio.run(graph.ainvoke({"messages": [HumanMessage(content="Compare steel and aluminium")]},
+                                      {"configurable": {"thread_id": "parallel-tools"}}))
+    elapsed = time.perf_counter() - start
+    # One model turn asked for all three lookups; they took about one retriever latency, not three
+    assert len(state["messages"][1].tool_calls) == 3
+    assert sum(m.type == "tool" for m in state["messages"]) == 3
+    assert elapsed < 0.6
+
+
+def test_multi_query_tool_through_the_graph():
+    saved = (agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache)
+    pinecone = FakePineconeClient(latency=0.3, answer_chars=200)
+    agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache = pinecone, "fake", "pinecone", None
+    try:
+        llm = FakeChatModel(latency=0.01, tool_rounds=3, tool_mode="multi")
+        graph = create_agent_graph(llm=llm, tools=[agent.retrieve_cbam_info, agent.retrieve_cbam_multi],
+                                   checkpointer=BoundedMemorySaver(), routing=False)
+        question = "Compare the reporting requirements for the transitional phase vs the definitive phase"
+        start = time.perf_counter()
+        state = asyncio.run(graph.ainvoke({"messages": [HumanMessage(content=question)]},
+                                          {"configurable": {"thread_id": "multi-query"}}))
+        elapsed = time.perf_counter() - start
+    finally:
+        agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache = saved
+
+    tool_messages = [m for m in state["messages"] if m.type == "tool"]
+    assert [m.name for m in tool_messages] == ["retrieve_cbam_multi"]
+    assert tool_messages[0].content.startswith("Sub-queries: (1) " + question)
+    # Question + 3 sub-queries fetched concurrently: about one Pinecone latency, not four
+    assert pinecone.calls == 4 and elapsed < 0.9
+    assert state["messages"][-1].content == llm.answer
+
+
+if __name__ == "__main__":
+    test_question_splitting()
+    test_fusion_dedupes_and_ranks_shared_passages_first()
+    test_fusion_keeps_citations_and_refs()
+    test_tool_calls_of_one_turn_run_concurrently()
+    test_multi_query_tool_through_the_graph()
+    print("OK")
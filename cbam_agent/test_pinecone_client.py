@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from pinecone_client import CircuitBreaker, CircuitOpenError, PineconeClient
+
+
+class StubPinecone:
+    """
+    Local stand-in for the Assistant endpoint.
+    `script` is a list of (status, delay_seconds) consumed one per request; once empty every call returns 200.
+    """
+
+    def __init__(self):
+        self.script = []
+        self.calls = 0
+        self.peers = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.calls += 1
+                stub.peers.add(self.client_address)
+                status, delay = stub.script.pop(0) if stub.script else (200, 0)
+                time.sleep(delay)
+                body = json.dumps({"message": {"content": "stub answer"}}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/assistant/chat/cbam"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+def make_client(stub, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=2, reset_timeout=0.3))
+    return PineconeClient(stub.url, "test-key", **kwargs)
+
+
+async def call_many(client, n):
+    results = []
+    for _ in range(n):
+        results.append(await client.chat({"messages": []}))
+    return results
+
+
+def test_keep_alive_reuses_connection():
+    stub = StubPinecone()
+    client = make_client(stub)
+    try:
+        results = asyncio.run(call_many(client, 5))
+        assert results[-1] == {"message": {"content": "stub answer"}}
+        assert stub.calls == 5
+        assert len(stub.peers) == 1
+    finally:
+        stub.stop()
+
+
+def test_retries_on_5xx_and_429():
+    stub = StubPinecone()
+    stub.script = [(503, 0), (429, 0)]
+    client = make_client(stub, max_retries=2)
+    try:
+        asyncio.run(call_many(client, 1))
+        assert stub.calls == 3
+    finally:
+        stub.stop()
+
+
+def test_read_timeout_is_bounded():
+    stub = StubPinecone()
+    stub.script = [(200, 1.0)]
+    client = make_client(stub, read_timeout=0.2, max_retries=0)
+    try:
+        start = time.perf_counter()
+        try:
+            asyncio.run(call_many(client, 1))
+            assert False, "expected a timeout"
+        except httpx.ReadTimeout:
+            pass
+        assert time.perf_counter() - start < 0.8
+    finally:
+        stub.stop()
+
+
+def test_circuit_breaker_fails_fast_then_recovers():
+    stub = StubPinecone()
+    stub.script = [(500, 0)] * 4
+    client = make_client(stub, max_retries=1)
+
+    async def scenario():
+        for _ in range(2):
+            try:
+                await client.chat({"messages": []})
+            except httpx.HTTPStatusError:
+                pass
+        assert client.breaker.state == "open"
+
+        calls_before = stub.calls
+        start = time.perf_counter()
+        try:
+            await client.chat({"messages": []})
+            assert False, "expected the breaker to be open"
+        except CircuitOpenError:
+            pass
+        assert stub.calls == calls_before
+        assert time.perf_counter() - start < 0.01
+
+        await asyncio.sleep(0.35)
+        assert client.breaker.state == "half_open"
+        await client.chat({"messages": []})
+        assert client.breaker.state == "closed"
+        await client.close()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    test_keep_alive_reuses_connection()
+    test_retries_on_5xx_and_429()
+    test_read_timeout_is_bounded()
+    test_circuit_breaker_fails_fast_then_recovers()
+    print("OK")
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import agent
+from agent import SYSTEM_PROMPT, create_agent_graph
+from checkpointer import BoundedMemorySaver
+from context_budget import estimate_tokens
+from fakes import FakeChatModel, make_fake_retriever
+from prompt_cache import ContextCachedChat, PromptPrefix, strip_stored_prompt
+
+seen = []
+
+
+class RecordingChatModel(FakeChatModel):
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        seen.append((messages, kwargs))
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+def test_prefix_version_and_token_count():
+    retriever = make_fake_retriever(0)
+    plain, with_tools = PromptPrefix(SYSTEM_PROMPT), PromptPrefix(SYSTEM_PROMPT, [retriever])
+    assert plain.version != with_tools.version == PromptPrefix(SYSTEM_PROMPT, [retriever]).version
+    assert with_tools.tokens > plain.tokens > len(SYSTEM_PROMPT) // 5
+    assert estimate_tokens([plain.message]) == estimate_tokens([SystemMessage(content=SYSTEM_PROMPT)])
+    stored = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content="hi")]
+    assert strip_stored_prompt(stored) == stored[1:]
+
+
+def test_prefix_is_identical_across_days_and_not_stored():
+    seen.clear()
+    graph = create_agent_graph(llm=RecordingChatModel(latency=0), tools=[make_fake_retriever(0)],
+                               checkpointer=BoundedMemorySaver(), routing=False)
+    original = agent.current_date_label
+    try:
+        for day, thread in (("January 15, 2026", "new"), ("January 16, 2026", "old")):
+            agent.current_date_label = lambda: day
+            messages = [HumanMessage(content="Which goods are covered?")]
+            if thread == "old":
+                # A thread created before the prefix layout still carries its own prompt copy
+                messages.insert(0, SystemMessage(content=SYSTEM_PROMPT))
+            asyncio.run(graph.ainvoke({"messages": messages}, {"configurable": {"thread_id": thread}}))
+    finally:
+        agent.current_date_label = original
+
+    firsts = {m[0].content for m, _ in seen}
+    assert firsts == {SYSTEM_PROMPT}
+    assert all(m[1].content.startswith("CURRENT DATE") for m, _ in seen)
+    assert all(sum(x.content == SYSTEM_PROMPT for x in m) == 1 for m, _ in seen)
+    state = asyncio.run(graph.aget_state({"configurable": {"thread_id": "new"}}))
+    assert [m.type for m in state.values["messages"]] == ["human", "ai", "tool", "ai"]
+
+
+def test_explicit_cache_sends_only_the_rest():
+    seen.clear()
+    prefix = PromptPrefix(SYSTEM_PROMPT)
+    model = ContextCachedChat(model=RecordingChatModel(latency=0), fallback=RecordingChatModel(latency=0, answer="fallback"),
+                              prefix=prefix, tools=[])
+    date = SystemMessage(content="CURRENT DATE: January 15, 2026")
+    call = prefix.build(date, [HumanMessage(content="What is CBAM?")])
+
+    model._renew_at = time.monotonic() + 60  # no cache yet (creation failed): full prefix to the fallback
+    assert asyncio.run(model.ainvoke(call)).content == "fallback"
+    model._cache_name = "cachedContents/abc"
+    asyncio.run(model.ainvoke(call))
+    messages, kwargs = seen[-1]
+    assert kwargs["cached_content"] == "cachedContents/abc"
+    assert [(m.type, m.content) for m in messages] == [("human", date.content), ("human", "What is CBAM?")]
+
+
+if __name__ == "__main__":
+    test_prefix_version_and_token_count()
+    test_prefix_is_identical_across_days_and_not_stored()
+    test_explicit_cache_sends_only_the_rest()
+    print("OK")
@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+
+import server
+from agent import SYSTEM_PROMPT, create_agent_graph
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel, make_fake_retriever
+from query_router import DEFINITION_PROMPT, classify_query, route_metrics
+
+prompts = []
+
+
+class RecordingChatModel(FakeChatModel):
+    """FakeChatModel that remembers the system prompt and message count of every call."""
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompts.append((messages[0].content, len(messages), self.tools_bound))
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+def test_classifier_paths():
+    cases = {
+        "Hello, are you online?": "canned",
+        "thanks!": "canned",
+        "What is CBAM?": "definitional",
+        "What does 'authorised CBAM declarant' mean?": "definitional",
+        "Which goods are covered?": "full",
+        "What is the CN code for hot-rolled steel?": "full",
+        "Is CN code 7208 covered by CBAM?": "full",
+        "What is it?": "full",
+        "How do I calculate embedded emissions?": "full",
+        "hello, what is the price of a certificate?": "full",
+        "What is embedded emissions?": "definitional",
+        "What is an installation under CBAM?": "definitional",
+        # Facts, not definitions: the tool-less path would answer them from memory
+        "What is the default value for cement?": "full",
+        "What is the de minimis threshold?": "full",
+        "What is the latest news on CBAM?": "full",
+        "What is the current CBAM status?": "full",
+        "What is the CBAM levy on steel?": "full",
+    }
+    assert {q: classify_query(q).path for q in cases} == cases
+
+
+def test_paths_through_the_graph_and_stats():
+    prompts.clear()
+    server.agent_app = create_agent_graph(llm=RecordingChatModel(latency=0.05), tools=[make_fake_retriever(0.05)],
+                                          checkpointer=BoundedMemorySaver(), routing=True)
+    route_metrics.turns.clear()
+    route_metrics.seconds.clear()
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            answers = []
+            for text in ("Hello, are you online?", "What is CBAM?", "Which goods are covered by CBAM?"):
+                response = await client.post("/webhook", json={"input": text, "sessionId": "routes"})
+                answers.append(response.json()["output"])
+            return answers, (await client.get("/stats/routes")).json()
+
+    (greeting, definition, full), stats = asyncio.run(run())
+    assert "online" in greeting
+    assert definition == full == FakeChatModel().answer
+    # Greeting: no call. Definition: short prompt + question, no tools. Full: system prompts + history, tools, two rounds
+    assert prompts[0] == (DEFINITION_PROMPT, 2, False)
+    assert [p[2] for p in prompts[1:]] == [True, True]
+    assert prompts[1][1] > 3 and SYSTEM_PROMPT not in prompts[0][0]
+    assert {path: p["turns"] for path, p in stats["paths"].items()} == {"canned": 1, "definitional": 1, "full": 1}
+    assert stats["paths"]["canned"]["share"] == 0.333
+    assert stats["latency_saved_ms"] > 100
+
+
+def test_failed_definitional_call_is_escalated():
+    class FailsWithoutTools(FakeChatModel):
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            if not self.tools_bound:
+                raise RuntimeError("503 from the definitional backend")
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+    graph = create_agent_graph(llm=FailsWithoutTools(latency=0), tools=[make_fake_retriever(0)],
+                               checkpointer=BoundedMemorySaver(), routing=True)
+    state = asyncio.run(graph.ainvoke({"messages": [("user", "What is CBAM?")]}, {"configurable": {"thread_id": "esc"}}))
+    assert state["route"] == "full"
+    assert [m.type for m in state["messages"]] == ["human", "ai", "tool", "ai"]
+
+
+if __name__ == "__main__":
+    test_classifier_paths()
+    test_paths_through_the_graph_and_stats()
+    test_failed_definitional_call_is_escalated()
+    print("OK")
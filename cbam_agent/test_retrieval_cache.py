@@ -0,0 +1,87 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from retrieval_cache import RetrievalCache, SQLiteBackend, normalise_query
+
+
+def test_normalised_exact_match():
+    cache = RetrievalCache()
+    cache.store("What are the HS codes for steel?", "Chapter 72 and 73")
+    assert normalise_query("CN code 7208.10?") == "cn code 7208.10"
+    assert cache.lookup("  what are the hs codes for STEEL ") == "Chapter 72 and 73"
+    assert cache.lookup("What are the HS codes for aluminium?") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_near_duplicate_match():
+    cache = RetrievalCache(semantic_threshold=0.9)
+    cache.store("How do I calculate embedded emissions for steel?", "Use direct + indirect emissions")
+    assert cache.lookup("how to calculate the embedded emissions of steel") == "Use direct + indirect emissions"
+    assert cache.lookup("How do I calculate embedded emissions for aluminium?") is None
+    assert cache.lookup("Which countries have a carbon price?") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_ttl_and_lru_eviction():
+    cache = RetrievalCache(ttl=0.05, max_entries=2)
+    cache.store("a", "1")
+    cache.store("b", "2")
+    cache.lookup("a")
+    cache.store("c", "3")
+    assert cache.lookup("b") is None  # least recently used
+    assert cache.stats()["evictions"] == 1
+    time.sleep(0.06)
+    assert cache.lookup("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_sqlite_backend_persists():
+    path = os.path.join(tempfile.mkdtemp(), "cache.db")
+    RetrievalCache(backend=SQLiteBackend(path), semantic_threshold=0.9).store("default values for cement", "See Annex")
+    reopened = RetrievalCache(backend=SQLiteBackend(path), semantic_threshold=0.9)
+    assert reopened.lookup("Default values for cement?") == "See Annex"
+    assert reopened.lookup("the default values for cement") == "See Annex"
+
+
+
+def test_sqlite_backend_is_read_off_the_event_loop():
+    cache = RetrievalCache(backend=SQLiteBackend(os.path.join(tempfile.mkdtemp(), "cache.db")))
+
+    def hold_lock():
+        with cache.backend._lock:  # a slow disk or another writer
+            time.sleep(0.3)
+
+    async def go():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        await cache.astore("default values for cement", "See Annex")
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        await asyncio.sleep(0.01)
+        task = asyncio.create_task(ticker())
+        value = await cache.alookup("Default values for cement?")
+        task.cancel()
+        holder.join()
+        return value, ticks
+
+    value, ticks = asyncio.run(go())
+    assert value == "See Annex" and ticks >= 10
+
+
+if __name__ == "__main__":
+    test_normalised_exact_match()
+    test_near_duplicate_match()
+    test_ttl_and_lru_eviction()
+    test_sqlite_backend_persists()
+    test_sqlite_backend_is_read_off_the_event_loop()
+    print("OK")
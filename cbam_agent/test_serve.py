@@ -0,0 +1,72 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+import httpx
+
+from agent import create_agent_graph
+from bench_scaling import free_port, wait_live
+from checkpointer import SQLiteSaver
+from fakes import FakeChatModel
+from serve import configure_shared_state
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_sessions_survive_worker_hopping():
+    port, state_dir = free_port(), tempfile.mkdtemp()
+    env = dict(os.environ, BENCH_SCALING_APP="1", BENCH_CPU_MS="1", BENCH_LLM_LATENCY="0.01", TRACE_LOG="off",
+               JOBS_WORKERS="0", STARTUP_WARMUP="0", GOOGLE_API_KEY="test")
+    env.pop("CHECKPOINT_BACKEND", None)
+    proc = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", "2", "--port", str(port), "--state-dir", state_dir,
+         "--app", "bench_scaling:app", "--log-level", "warning"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_live(port)
+        sessions = [f"hop-{i}" for i in range(8)]
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            for text in ("Which records must an importer keep?", "And for how long?"):
+                for session in sessions:
+                    # A new connection per request, so the kernel may pick either worker
+                    response = httpx.post(f"http://127.0.0.1:{port}/webhook", json={"input": text, "sessionId": session}, timeout=30)
+                    assert response.status_code == 200
+            assert client.get("/health/live").status_code == 200
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=30) == 0
+
+    graph = create_agent_graph(llm=FakeChatModel(latency=0), tools=[], checkpointer=SQLiteSaver(os.path.join(state_dir, "checkpoints.db")))
+    for session in sessions:
+        state = asyncio.run(graph.aget_state({"configurable": {"thread_id": session}}))
+        humans = [m.content for m in state.values["messages"] if m.type == "human"]
+        assert humans == ["Which records must an importer keep?", "And for how long?"]
+
+
+def test_multiple_workers_refuse_per_process_checkpointer():
+    saved = {k: os.environ.get(k) for k in ("CHECKPOINT_BACKEND", "CHECKPOINT_PATH", "RETRIEVAL_CACHE_BACKEND",
+                                            "ANSWER_CACHE_BACKEND", "TOOL_PAYLOAD_BACKEND", "RETRIEVAL_CACHE_PATH", "ANSWER_CACHE_PATH",
+                                            "TOOL_PAYLOAD_PATH", "JOBS_PATH", "ADMISSION_STATE_PATH")}
+    try:
+        os.environ["CHECKPOINT_BACKEND"] = "bounded"
+        try:
+            configure_shared_state(2, tempfile.mkdtemp())
+            raise AssertionError("accepted a per-process checkpointer")
+        except SystemExit:
+            pass
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+if __name__ == "__main__":
+    test_sessions_survive_worker_hopping()
+    test_multiple_workers_refuse_per_process_checkpointer()
+    print("OK")
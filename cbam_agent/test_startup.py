@@ -0,0 +1,56 @@
+import asyncio
+import subprocess
+import sys
+
+import httpx
+
+import agent
+import server
+from agent import create_agent_graph
+from fakes import FakeChatModel, make_fake_retriever
+
+
+def test_server_import_defers_heavy_modules():
+    code = "import sys, server; print(any(m.startswith(('langgraph', 'langchain_google_genai')) for m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         env={"GOOGLE_API_KEY": "test", "TRACE_LOG": "off", "PATH": ""}).stdout
+    assert out.strip().splitlines()[-1] == "False"
+
+
+def test_liveness_and_readiness():
+    original = server.agent_app
+    server.agent_app = None
+    built = []
+
+    def fake_build():
+        built.append(True)
+        return create_agent_graph(llm=FakeChatModel(latency=0), tools=[make_fake_retriever(0)])
+
+    real_build, real_ready = agent.get_agent_app, agent.agent_app_ready
+    agent.get_agent_app, agent.agent_app_ready = fake_build, lambda: False
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            live = await client.get("/health/live")
+            before = await client.get("/health/ready")
+            await server.warm_up()
+            after = await client.get("/health/ready")
+            answer = await client.post("/webhook", json={"input": "What is CBAM?", "sessionId": "warm"})
+        return live, before, after, answer
+
+    try:
+        live, before, after, answer = asyncio.run(run())
+    finally:
+        agent.get_agent_app, agent.agent_app_ready = real_build, real_ready
+        server.agent_app = original
+    assert live.status_code == 200
+    assert before.status_code == 503 and before.json() == {"status": "starting"}
+    assert after.status_code == 200
+    assert answer.status_code == 200 and built == [True]
+
+
+if __name__ == "__main__":
+    test_server_import_defers_heavy_modules()
+    test_liveness_and_readiness()
+    print("OK")
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+import server
+from agent import create_agent_graph
+from fakes import FakeChatModel, make_fake_retriever
+
+# Fake timings: 0.2s to first token, 0.05s per further token, 0.3s Pinecone call
+LLM_LATENCY = 0.2
+TOKEN_LATENCY = 0.05
+TOOL_LATENCY = 0.3
+
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def measure_stream():
+    server.agent_app = create_agent_graph(
+        llm=FakeChatModel(latency=LLM_LATENCY, token_latency=TOKEN_LATENCY),
+        tools=[make_fake_retriever(TOOL_LATENCY)],
+    )
+    start = time.perf_counter()
+    first_token = None
+    kinds = []
+    tokens = []
+    async for chunk in server.stream_agent_events("Which goods are covered by CBAM?", f"ttft-{uuid.uuid4()}"):
+        kind, data = parse_sse(chunk)[0]
+        kinds.append(kind)
+        if kind == "token":
+            tokens.append(data["text"])
+            if first_token is None:
+                first_token = time.perf_counter() - start
+        if kind == "done":
+            output = data["output"]
+    total = time.perf_counter() - start
+    return first_token, total, kinds, "".join(tokens), output
+
+
+def test_time_to_first_token():
+    ttft, total, kinds, streamed, output = asyncio.run(measure_stream())
+    print(f"Time to first token: {ttft:.3f}s, full answer: {total:.3f}s")
+
+    assert kinds.index("tool_start") < kinds.index("tool_end") < kinds.index("token")
+    assert kinds[-1] == "done"
+    assert streamed == output
+    # First token arrives after LLM -> tool -> LLM first token, well before the answer is finished
+    assert ttft < 2 * LLM_LATENCY + TOOL_LATENCY + 0.2
+    assert total - ttft > 0.5 * TOKEN_LATENCY * (len(output.split()) - 1)
+
+
+def test_webhook_output_unchanged():
+    async def run():
+        server.agent_app = create_agent_graph(llm=FakeChatModel(latency=0), tools=[make_fake_retriever(0)])
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            plain = await client.post("/webhook", json={"input": "What is CBAM?", "sessionId": "plain"})
+            stream = await client.post("/webhook/stream", json={"input": "What is CBAM?", "sessionId": "stream"})
+        return plain, stream
+
+    plain, stream = asyncio.run(run())
+    body = plain.json()
+    assert {k: body[k] for k in ("output", "thread_id")} == {"output": FakeChatModel().answer, "thread_id": "plain"}
+    assert stream.headers["content-type"].startswith("text/event-stream")
+    event, done = parse_sse(stream.text)[-1]
+    assert event == "done" and done.pop("request_id") != body["request_id"]
+    assert done == {"output": FakeChatModel().answer, "thread_id": "stream"}
+
+
+if __name__ == "__main__":
+    test_time_to_first_token()
+    test_webhook_output_unchanged()
+    print("OK")
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+
+import httpx
+
+import agent
+import server
+from agent import create_agent_graph
+from answer_cache import SingleFlight
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel, FakePineconeClient
+from thread_runs import ThreadRuns
+
+
+def run_app(runs: ThreadRuns, scenario, pinecone_latency=0.3):
+    """Runs `scenario(client)` against the app with `runs` as server.thread_runs, a retrieval tool and no answer cache."""
+    saved = (agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache,
+             server.thread_runs, server.answer_cache)
+    pinecone = FakePineconeClient(latency=pinecone_latency, citations=2)
+    agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache = pinecone, "fake", "pinecone", None
+    server.thread_runs, server.answer_cache = runs, None
+    server.agent_app = create_agent_graph(llm=FakeChatModel(latency=0.02), tools=[agent.retrieve_cbam_info],
+                                          checkpointer=BoundedMemorySaver(), routing=False)
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            return await scenario(client)
+
+    try:
+        return asyncio.run(run()), pinecone
+    finally:
+        (agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache,
+         server.thread_runs, server.answer_cache) = saved
+
+
+def thread_messages(thread_id):
+    state = asyncio.run(server.agent_app.aget_state({"configurable": {"thread_id": thread_id}}))
+    return [(m.type, m.content) for m in state.values["messages"]]
+
+
+def test_identical_messages_coalesce_and_others_wait():
+    runs = ThreadRuns(supersede=False)
+
+    async def scenario(client):
+        post = lambda text: client.post("/webhook", json={"input": text, "sessionId": "t1"})
+        start = time.perf_counter()
+        first = asyncio.create_task(post("Which records must an importer keep?"))
+        await asyncio.sleep(0.05)
+        double, follow_up = await asyncio.gather(post("which records must an importer keep"), post("And for how long?"))
+        return await first, double, follow_up, time.perf_counter() - start
+
+    (first, double, follow_up, elapsed), pinecone = run_app(runs, scenario)
+    assert [r.status_code for r in (first, double, follow_up)] == [200, 200, 200]
+    assert double.json()["output"] == first.json()["output"]
+    # Two graph runs, one after the other; the double-submit added nothing to the thread
+    assert pinecone.calls == 2 and elapsed >= 0.6
+    assert [m for m in thread_messages("t1") if m[0] == "human"] == [
+        ("human", "Which records must an importer keep?"), ("human", "And for how long?")]
+    assert runs.snapshot() == {"threads_active": 0, "runs_active": 0, "supersede": False,
+                               "outcomes": {"coalesced": 1, "started": 2, "waited": 1}}
+
+
+def test_newer_message_supersedes_run_and_stream():
+    runs = ThreadRuns(supersede=True)
+
+    async def scenario(client):
+        old = asyncio.create_task(client.post("/webhook", json={"input": "Which goods are covered?", "sessionId": "t2"}))
+        await asyncio.sleep(0.15)  # in the retrieval call
+        new = await client.post("/webhook", json={"input": "Only steel, please.", "sessionId": "t2"})
+        old = await old
+
+        async def stream():
+            async with client.stream("POST", "/webhook/stream", json={"input": "What about cement?", "sessionId": "t2"}) as response:
+                return [line async for line in response.aiter_lines() if line.startswith("event:") or line.startswith("data:")]
+
+        streaming = asyncio.create_task(stream())
+        await asyncio.sleep(0.15)
+        last = await client.post("/webhook", json={"input": "And aluminium?", "sessionId": "t2"})
+        stats = (await client.get("/stats/threads")).json()
+        return old, new, await streaming, last, stats, server.admission.running
+
+    (old, new, events, last, stats, running), pinecone = run_app(runs, scenario)
+    assert old.status_code == 409 and "superseded" in old.json()["detail"]
+    assert new.status_code == 200 and last.status_code == 200
+    assert events[-2] == "event: error" and json.loads(events[-1][len("data: "):])["reason"] == "superseded"
+    assert stats["outcomes"] == {"started": 4, "superseded": 2, "waited": 2} and running == 0
+
+    # Each cancelled tool call was closed before the next turn, so every call has its result
+    messages = thread_messages("t2")
+    assert [m for m in messages if m[0] == "tool" and m[1].startswith("Cancelled")] == \
+        [("tool", "Cancelled: superseded by a newer message.")] * 2
+    assert messages[-1][0] == "ai" and pinecone.calls == 4
+
+
+def test_default_thread_is_not_coordinated():
+    runs = ThreadRuns(supersede=True)
+
+    async def scenario(client):
+        first = asyncio.create_task(client.post("/webhook", json={"input": "Which goods are covered?"}))
+        await asyncio.sleep(0.15)
+        second = client.post("/webhook", json={"input": "Which goods are covered?", "sessionId": "default"})
+        third = client.post("/webhook", json={"input": "What must the report include?"})
+        return await asyncio.gather(first, second, third)
+
+    responses, pinecone = run_app(runs, scenario)
+    # Unrelated callers: nobody is cancelled, joined or queued behind another
+    assert [r.status_code for r in responses] == [200, 200, 200] and pinecone.calls == 3
+    assert runs.snapshot()["outcomes"] == {"shared": 3}
+
+
+def test_single_flight_survives_cancelled_leader():
+    async def run():
+        flight, calls = SingleFlight(), []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return len(calls)
+
+        leader = asyncio.create_task(flight.do("q", fn))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(flight.do("q", fn)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        return leader.cancelled(), results
+
+    cancelled, results = asyncio.run(run())
+    # One waiter took over; the others got its result
+    assert cancelled and results == [2, 2, 2]
+
+
+if __name__ == "__main__":
+    test_identical_messages_coalesce_and_others_wait()
+    test_newer_message_supersedes_run_and_stream()
+    test_default_thread_is_not_coordinated()
+    test_single_flight_survives_cancelled_leader()
+    print("OK")
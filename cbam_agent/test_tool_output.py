@@ -0,0 +1,98 @@
+import asyncio
+import json
+import os
+
+import httpx
+from langchain_core.messages import HumanMessage
+
+import agent
+import server
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from context_budget import CHARS_PER_TOKEN
+from fakes import FakeChatModel, FakePineconeClient
+from tool_output import normalise_response, payload_store_from_env, render
+
+
+def fake_payload(**kwargs):
+    client = FakePineconeClient(latency=0, **kwargs)
+    return asyncio.run(client.chat({"messages": [{"role": "user", "content": "steel default values"}]}))
+
+
+def test_normalise_response_shapes():
+    data = fake_payload(answer_chars=200, citations=4)
+    # The same file and pages cited twice is one citation
+    data["citations"].append(data["citations"][0])
+    result = normalise_response(data)
+    assert result.answer.startswith("Stub Pinecone passage for: steel default values")
+    assert [(c.file, c.pages) for c in result.citations] == [
+        ("cbam_source_0.pdf", (1, 2)), ("cbam_source_1.pdf", (2, 3)), ("cbam_source_2.pdf", (3, 4)), ("cbam_source_0.pdf", (4, 5))]
+    assert result.citations[0].snippet.startswith("Highlighted regulation text 0")
+
+    assert normalise_response({"choices": [{"message": {"content": "Choice answer"}}]}).answer == "Choice answer"
+    # Unknown shape: the nested answer text, not a JSON dump (and not a highlight)
+    unexpected = normalise_response(fake_payload(answer_chars=200, citations=2, shape="unexpected"))
+    assert unexpected.answer.startswith("Stub Pinecone passage") and len(unexpected.citations) == 2
+    assert normalise_response({"status": "ok"}).answer == "Pinecone returned no answer text."
+
+
+def test_render_stays_within_the_token_cap():
+    result = normalise_response(fake_payload(answer_chars=1200, citations=8, highlight_chars=2000))
+    full = render(result, max_tokens=5000)
+    assert full.count("\n[") == 8 and f"(full response: ref {result.ref})" in full
+    for max_tokens in (700, 400, 150):
+        text = render(result, max_tokens=max_tokens)
+        assert len(text) <= max_tokens * CHARS_PER_TOKEN
+        assert text.startswith("Stub Pinecone passage") and text.endswith(f"ref {result.ref})")
+    # Snippets shrink before citations go, citations before the answer is cut
+    assert "Citations:" in render(result, max_tokens=500) and "[…]" not in render(result, max_tokens=500)
+    assert "Citations:" not in render(result, max_tokens=150) and "[…]" in render(result, max_tokens=150)
+
+
+def test_thread_keeps_compact_output_and_ref_serves_the_payload():
+    saved = (agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache)
+    pinecone = FakePineconeClient(latency=0.01, citations=10, shape="unexpected")
+    agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache = pinecone, "fake", "pinecone", None
+    try:
+        graph = create_agent_graph(llm=FakeChatModel(latency=0.01), tools=[agent.retrieve_cbam_info],
+                                   checkpointer=BoundedMemorySaver(), routing=False)
+        state = asyncio.run(graph.ainvoke({"messages": [HumanMessage(content="Which steel goods are covered by CBAM?")]},
+                                          {"configurable": {"thread_id": "compact-output"}}))
+    finally:
+        agent.pinecone_client, agent.PINECONE_API_KEY, agent.RETRIEVAL_BACKEND, agent.retrieval_cache = saved
+
+    tool_message = next(m for m in state["messages"] if m.type == "tool")
+    assert "signed_url" not in tool_message.content and "Citations:" in tool_message.content
+    ref = tool_message.content.rsplit("ref ", 1)[1].rstrip(")")
+
+    async def fetch(path):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path)
+
+    payload = asyncio.run(fetch(f"/retrievals/{ref}"))
+    assert payload.status_code == 200 and len(payload.json()["citations"]) == 10
+    assert len(json.dumps(payload.json())) > 3 * len(tool_message.content)
+    assert asyncio.run(fetch("/retrievals/unknown")).status_code == 404
+
+
+
+def test_payloads_outlive_cached_tool_output():
+    saved = dict(os.environ)
+    try:
+        os.environ.update(TOOL_PAYLOAD_TTL="60", RETRIEVAL_CACHE_TTL="3600", RETRIEVAL_CACHE_MAX_ENTRIES="5000")
+        store = payload_store_from_env()
+        assert (store.ttl, store.max_entries) == (3600, 5000)
+        os.environ["RETRIEVAL_CACHE_BACKEND"] = "off"
+        assert payload_store_from_env().ttl == 60
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+if __name__ == "__main__":
+    test_normalise_response_shapes()
+    test_render_stays_within_the_token_cap()
+    test_thread_keeps_compact_output_and_ref_serves_the_payload()
+    test_payloads_outlive_cached_tool_output()
+    print("OK")
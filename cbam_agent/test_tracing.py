@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+from langchain_core.tools import tool
+
+import server
+from agent import create_agent_graph
+from checkpointer import BoundedMemorySaver
+from fakes import FakeChatModel
+from tracing import Histogram, span, trace_request
+
+
+@tool
+async def retrieve_cbam_info(query: str) -> str:
+    """Fake retriever with a traced Pinecone call, shaped like agent.retrieve_cbam_info."""
+    with span("retrieve_cbam_info"):
+        with span("pinecone"):
+            await asyncio.sleep(0.05)
+        return f"Stub passage for: {query}"
+
+
+def make_app():
+    return create_agent_graph(llm=FakeChatModel(latency=0.02), tools=[retrieve_cbam_info], checkpointer=BoundedMemorySaver())
+
+
+def test_webhook_trace_and_metrics():
+    server.agent_app = make_app()
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            answer = (await client.post("/webhook", json={"input": "Which goods are covered?", "sessionId": "traced"})).json()
+            trace = (await client.get(f"/traces/{answer['request_id']}")).json()
+            metrics = await client.get("/metrics")
+            missing = await client.get("/traces/unknown")
+        return answer, trace, metrics, missing
+
+    answer, trace, metrics, missing = asyncio.run(run())
+    assert missing.status_code == 404
+    assert trace["request_id"] == answer["request_id"]
+    spans = {s["span_id"]: s for s in trace["spans"]}
+    by_name = {}
+    for s in trace["spans"]:
+        by_name.setdefault(s["name"], []).append(s)
+
+    # request -> chatbot -> llm, request -> tool -> pinecone, plus checkpoint spans
+    assert trace["breakdown"]["chatbot"]["count"] == 2
+    assert trace["breakdown"]["llm"]["count"] == 2
+    assert by_name["checkpoint_read"] and by_name["checkpoint_write"]
+    root = by_name["request"][0]
+    assert root["parent_id"] is None and root["duration_ms"] >= 90
+    assert all(spans[s["parent_id"]]["name"] == "chatbot" for s in by_name["llm"])
+    assert spans[by_name["pinecone"][0]["parent_id"]]["name"] == "retrieve_cbam_info"
+    assert by_name["chatbot"][0]["attributes"]["context_tokens"] > 0
+    assert by_name["llm"][0]["attributes"]["tool_calls"] == 1
+
+    assert metrics.headers["content-type"].startswith("text/plain")
+    text = metrics.text
+    assert '# TYPE cbam_stage_duration_seconds histogram' in text
+    assert 'cbam_stage_duration_seconds_count{stage="pinecone"}' in text
+    assert 'cbam_requests_total{endpoint="webhook",status="ok"}' in text
+    assert 'cbam_cache_events_total{cache="answer",result="miss"}' in text
+
+
+def test_concurrent_requests_keep_separate_traces():
+    async def handler(i):
+        with trace_request("test") as trace:
+            with span("step", i=i):
+                await asyncio.sleep(0.01 * (5 - i))
+            return trace
+
+    async def run():
+        return await asyncio.gather(*(handler(i) for i in range(5)))
+
+    for i, trace in enumerate(asyncio.run(run())):
+        assert [s.name for s in trace.spans] == ["request", "step"]
+        assert trace.spans[1].attributes["i"] == i
+        assert trace.spans[1].parent_id == trace.spans[0].span_id
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("x_seconds", "test", ["stage"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        h.observe(value, stage="a")
+    lines = h.render()
+    assert 'x_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'x_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'x_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'x_seconds_count{stage="a"} 3' in lines
+
+
+if __name__ == "__main__":
+    test_webhook_trace_and_metrics()
+    test_concurrent_requests_keep_separate_traces()
+    test_histogram_buckets_are_cumulative()
+    print("OK")
@@ -0,0 +1,146 @@
+"""
+Per-thread run coordination for /webhook, /webhook/stream, batch items and jobs.
+
+Two requests on the same sessionId used to run the graph at the same time: both paid for the LLM
+and tool calls, and both appended to the same checkpoint thread. Now, per thread:
+    coalesce    a request with the same (normalised) input as a run in flight or queued on its thread
+                joins that run and returns its answer; no second graph run
+    serialise   any other request waits until the runs ahead of it on the thread have finished
+    supersede   with THREAD_SUPERSEDE=cancel (the default), a new /webhook or /webhook/stream message
+                cancels the runs ahead of it: they stop at their next await (LLM and tool calls
+                included), free their admission slot and answer 409 (an `error` event when streaming).
+                THREAD_SUPERSEDE=wait only serialises. Batch items and jobs never supersede.
+
+The shared "default" thread (requests without a sessionId) belongs to unrelated callers, so its
+runs are left alone: never coalesced, serialised or superseded (admission.py exempts it likewise).
+
+The superseded question stays in the thread; a tool call it left without a result is closed before
+the next run (see server.prepare_messages). Coordination is per process: serve.py workers each
+see the requests they receive.
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from retrieval_cache import normalise_query
+from tracing import thread_run_events
+
+THREAD_SUPERSEDE = os.getenv("THREAD_SUPERSEDE", "cancel").lower() == "cancel"
+SHARED_THREADS = ("default",)
+
+
+class RunSuperseded(Exception):
+    """The run was cancelled for a newer message on the same thread."""
+
+    def __init__(self, thread_id: str):
+        super().__init__(f"superseded by a newer message on thread {thread_id}")
+        self.thread_id = thread_id
+
+
+class Run:
+    """One graph run on a thread, possibly shared by several identical requests."""
+
+    def __init__(self, thread_id: str, key: Optional[str]):
+        self.thread_id = thread_id
+        self.key = key
+        self.task = asyncio.current_task()
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.finished = asyncio.Event()
+        self.superseded = False
+
+    def supersede(self):
+        if not self.superseded and not self.finished.is_set():
+            self.superseded = True
+            self.task.cancel()
+
+
+class ThreadRuns:
+    def __init__(self, supersede: bool = THREAD_SUPERSEDE):
+        self.supersede = supersede
+        self._threads: Dict[str, List[Run]] = {}
+        self.counts: Dict[str, int] = {}
+
+    @staticmethod
+    def coordinated(thread_id: Optional[str]) -> bool:
+        """False for a missing or shared thread id: those runs are not coordinated."""
+        return bool(thread_id) and thread_id not in SHARED_THREADS
+
+    def _count(self, outcome: str):
+        self.counts[outcome] = self.counts.get(outcome, 0) + 1
+        thread_run_events.inc(outcome=outcome)
+
+    @asynccontextmanager
+    async def slot(self, thread_id: str, key: Optional[str] = None, supersede: Optional[bool] = None) -> AsyncIterator[Run]:
+        """
+        The thread to oneself: supersedes (or waits for) the runs ahead, then yields the Run.
+        Raises RunSuperseded instead if a newer message cancels this run, queued or running.
+        On a shared thread the Run is yielded at once and nothing is tracked.
+        """
+        if not self.coordinated(thread_id):
+            self._count("shared")
+            yield Run(thread_id, key)
+            return
+        runs = self._threads.setdefault(thread_id, [])
+        ahead = list(runs)
+        if self.supersede if supersede is None else supersede:
+            for run in ahead:
+                if not run.superseded:
+                    run.supersede()
+                    self._count("superseded")
+        run = Run(thread_id, key)
+        runs.append(run)
+        try:
+            try:
+                if ahead:
+                    self._count("waited")
+                    await ahead[-1].finished.wait()
+                self._count("started")
+                yield run
+            except asyncio.CancelledError:
+                if not run.superseded:
+                    raise
+                # Our own cancellation, not the caller's: report it as a normal outcome
+                run.task.uncancel()
+                raise RunSuperseded(thread_id) from None
+        finally:
+            if not run.result.done():
+                # Requests that joined this run get the same outcome
+                run.result.set_exception(RunSuperseded(thread_id) if run.superseded else RuntimeError("run ended without a result"))
+                run.result.exception()  # retrieved, even when nobody joined
+            run.finished.set()
+            runs.remove(run)
+            if not runs:
+                del self._threads[thread_id]
+
+    async def run(self, thread_id: str, user_input: str, fn: Callable[[], Awaitable[Any]], supersede: Optional[bool] = None) -> Any:
+        """`fn()` in the thread's slot; a request identical to a run in flight or queued shares its result instead."""
+        if not self.coordinated(thread_id):
+            self._count("shared")
+            return await fn()
+        key = normalise_query(user_input)
+        for run in self._threads.get(thread_id, ()):
+            if run.key == key and not run.superseded:
+                self._count("coalesced")
+                return await asyncio.shield(run.result)
+
+        async with self.slot(thread_id, key, supersede) as run:
+            try:
+                result = await fn()
+            except Exception as e:
+                run.result.set_exception(e)
+                run.result.exception()
+                raise
+            run.result.set_result(result)
+            return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "threads_active": len(self._threads),
+            "runs_active": sum(len(runs) for runs in self._threads.values()),
+            "supersede": self.supersede,
+            "outcomes": dict(sorted(self.counts.items())),
+        }
+
+
+thread_runs = ThreadRuns()
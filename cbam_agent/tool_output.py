@@ -0,0 +1,186 @@
+"""
+Compact tool output for `retrieve_cbam_info`: Pinecone Assistant responses are normalised before they
+enter the conversation, instead of being passed on as returned (or as a raw JSON dump).
+
+    normalise_response  raw payload -> RetrievalResult: the answer text, plus one Citation
+                        (file, pages, first highlight snippet) per distinct reference. File
+                        metadata, signed URLs and repeated highlights are dropped. Unknown
+                        response shapes yield their first text field, never the whole JSON
+    render              the tool message: answer, numbered citations and the payload `ref`,
+                        capped at TOOL_OUTPUT_MAX_TOKENS (snippets are shortened first, then
+                        the last citations dropped, then the answer cut at a sentence)
+    PayloadStore        the full payload by `ref`, outside the thread state (GET /retrievals/{ref});
+                        TOOL_PAYLOAD_BACKEND memory (default) | sqlite | off, TOOL_PAYLOAD_TTL
+                        seconds, TOOL_PAYLOAD_MAX_ENTRIES. Both are raised to the retrieval cache's
+                        TTL and size: cached tool output keeps pointing at its payload
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from context_budget import CHARS_PER_TOKEN
+from retrieval_cache import MemoryBackend, SQLiteBackend
+
+TOOL_OUTPUT_MAX_TOKENS = int(os.getenv("TOOL_OUTPUT_MAX_TOKENS", "800"))
+SNIPPET_CHARS = 240
+SHORT_SNIPPET_CHARS = 100
+TEXT_KEYS = ("content", "answer", "text", "output")
+# Never searched for the answer text (highlights have a "content" field too)
+SKIP_KEYS = ("citations", "usage")
+
+
+@dataclass
+class Citation:
+    file: str
+    pages: Tuple[int, ...] = ()
+    snippet: str = ""
+
+    def line(self, n: int, snippet_chars: int) -> str:
+        pages = f" p. {', '.join(map(str, self.pages))}" if self.pages else ""
+        snippet = _shorten(self.snippet, snippet_chars)
+        return f"[{n}] {self.file}{pages}" + (f': "{snippet}"' if snippet else "")
+
+
+@dataclass
+class RetrievalResult:
+    answer: str
+    citations: List[Citation] = field(default_factory=list)
+    ref: str = ""
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def _first_text(data: Any) -> Optional[str]:
+    """First non-empty string under one of TEXT_KEYS, depth first."""
+    if isinstance(data, dict):
+        for key in TEXT_KEYS:
+            if isinstance(data.get(key), str) and data[key].strip():
+                return data[key]
+        values = [v for k, v in data.items() if k not in SKIP_KEYS]
+    elif isinstance(data, list):
+        values = data
+    else:
+        return None
+    for value in values:
+        text = _first_text(value)
+        if text:
+            return text
+    return None
+
+
+def payload_ref(data: Any) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def normalise_response(data: Dict[str, Any]) -> RetrievalResult:
+    if data.get("choices"):
+        answer = data["choices"][0]["message"]["content"]
+    elif isinstance(data.get("message"), dict) and "content" in data["message"]:
+        answer = data["message"]["content"]
+    else:
+        answer = _first_text(data) or "Pinecone returned no answer text."
+
+    citations: Dict[Tuple[str, Tuple[int, ...]], Citation] = {}
+    for citation in data.get("citations") or []:
+        for reference in citation.get("references") or []:
+            file = reference.get("file") or {}
+            name = file.get("name") if isinstance(file, dict) else str(file)
+            pages = tuple(reference.get("pages") or ())
+            highlight = reference.get("highlight") or {}
+            snippet = highlight.get("content", "") if isinstance(highlight, dict) else str(highlight)
+            key = (name or "unknown source", pages)
+            if key not in citations:
+                citations[key] = Citation(key[0], pages, snippet)
+            elif not citations[key].snippet:
+                citations[key].snippet = snippet
+    return RetrievalResult(answer=answer.strip(), citations=list(citations.values()), ref=payload_ref(data))
+
+
+def render(result: RetrievalResult, max_tokens: Optional[int] = None) -> str:
+    budget = (max_tokens or TOOL_OUTPUT_MAX_TOKENS) * CHARS_PER_TOKEN
+    footer = f"(full response: ref {result.ref})" if result.ref else ""
+    citations = result.citations
+
+    def build(answer: str, citations: List[Citation], snippet_chars: int) -> str:
+        parts = [answer]
+        if citations:
+            parts.append("Citations:\n" + "\n".join(c.line(n, snippet_chars) for n, c in enumerate(citations, 1)))
+        if footer:
+            parts.append(footer)
+        return "\n\n".join(parts)
+
+    for snippet_chars in (SNIPPET_CHARS, SHORT_SNIPPET_CHARS):
+        text = build(result.answer, citations, snippet_chars)
+        if len(text) <= budget:
+            return text
+    while citations:
+        citations = citations[:-1]
+        text = build(result.answer, citations, SHORT_SNIPPET_CHARS)
+        if len(text) <= budget:
+            return text
+
+    room = max(budget - len(footer) - 8, 0)
+    cut = result.answer[:room]
+    sentence_end = max(cut.rfind(". "), cut.rfind(".\n"))
+    answer = (cut[:sentence_end + 1] if sentence_end > room // 2 else cut.rsplit(" ", 1)[0]) + " […]"
+    return build(answer, [], SHORT_SNIPPET_CHARS)
+
+
+class PayloadStore:
+    """Full Pinecone payloads by ref, with TTL expiry and LRU eviction (a retrieval-cache backend underneath)."""
+
+    def __init__(self, backend, ttl: float = 86400, max_entries: int = 2000):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def put(self, ref: str, data: Dict[str, Any]):
+        self.backend.set(ref, "", json.dumps(data, default=str), None)
+        self.backend.evict(self.max_entries)
+
+    def get(self, ref: str) -> Optional[Dict[str, Any]]:
+        entry = self.backend.get(ref)
+        if entry is None:
+            return None
+        value, created_at = entry
+        if time.time() - created_at > self.ttl:
+            self.backend.delete(ref)
+            return None
+        return json.loads(value)
+
+
+def payload_store_from_env() -> Optional[PayloadStore]:
+    kind = os.getenv("TOOL_PAYLOAD_BACKEND", "memory").lower()
+    if kind == "off":
+        return None
+    backend = (SQLiteBackend(os.getenv("TOOL_PAYLOAD_PATH", "tool_payloads.db"), table="tool_payloads")
+               if kind == "sqlite" else MemoryBackend())
+    ttl = float(os.getenv("TOOL_PAYLOAD_TTL", "86400"))
+    max_entries = int(os.getenv("TOOL_PAYLOAD_MAX_ENTRIES", "2000"))
+    if os.getenv("RETRIEVAL_CACHE_BACKEND", "memory").lower() != "off":
+        # A cached answer's ref must not outlive its payload
+        ttl = max(ttl, float(os.getenv("RETRIEVAL_CACHE_TTL", "86400")))
+        max_entries = max(max_entries, int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "2000")))
+    return PayloadStore(backend, ttl=ttl, max_entries=max_entries)
+
+
+payload_store = payload_store_from_env()
+
+
+async def compact_response(data: Dict[str, Any], max_tokens: Optional[int] = None) -> str:
+    """The tool output for one Pinecone response; the full payload goes to `payload_store` (off the event loop)."""
+    result = normalise_response(data)
+    if payload_store is not None:
+        await asyncio.to_thread(payload_store.put, result.ref, data)
+    else:
+        result.ref = ""
+    return render(result, max_tokens)
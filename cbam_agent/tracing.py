@@ -0,0 +1,238 @@
+"""
+In-process request tracing and Prometheus metrics; no external collector needed.
+
+A trace is opened per request (`trace_request`) and spans nest under it through a context variable,
+so spans opened inside graph nodes, tools and the checkpointer attach to the right request even
+with many requests in flight:
+
+    request -> chatbot -> llm -> llm:<backend> (one per attempt, hedges and fallbacks included)
+            -> tool:retrieve_cbam_info -> pinecone
+            -> checkpoint_read / checkpoint_write
+
+Every finished span also feeds the `cbam_stage_duration_seconds{stage=...}` histogram served at
+/metrics. Recent traces are kept in memory (TRACE_KEEP) for GET /traces/{request_id}, and each one
+is logged on completion (TRACE_LOG: summary (default) | json | off).
+Standard library only, so importing it does not slow down server startup.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "200"))
+TRACE_LOG = os.getenv("TRACE_LOG", "summary").lower()
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+# --- Metrics ---
+def _labels(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_labels(self.labels, k)} {v:g}" for k, v in sorted(self.values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_text, tuple(labels), tuple(buckets)
+        self.values: Dict[Tuple, List[float]] = {}  # label values -> bucket counts + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            row = self.values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, row in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, row):
+                    lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (f'{bound:g}',))} {count:g}")
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {row[-1]:g}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {row[-2]:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {row[-1]:g}")
+        return lines
+
+
+stage_duration = Histogram("cbam_stage_duration_seconds", "Latency per stage (request, chatbot, llm, tool, pinecone, checkpoint).", ["stage"])
+requests_total = Counter("cbam_requests_total", "Requests by endpoint and outcome.", ["endpoint", "status"])
+llm_tokens = Counter("cbam_llm_tokens_total", "LLM tokens reported by the model.", ["direction"])
+context_tokens = Counter("cbam_context_tokens_total", "Estimated prompt tokens before/after the context budget.", ["phase"])
+cache_events = Counter("cbam_cache_events_total", "Cache lookups by cache and result.", ["cache", "result"])
+llm_attempts = Counter("cbam_llm_attempts_total", "LLM backend attempts by outcome (see llm_router.py).", ["backend", "outcome"])
+query_routes = Counter("cbam_query_routes_total", "Turns by query-router path (see query_router.py).", ["path"])
+admission_events = Counter("cbam_admission_total", "Admission decisions by outcome (see admission.py).", ["outcome"])
+thread_run_events = Counter("cbam_thread_runs_total", "Per-thread run coordination by outcome (see thread_runs.py).", ["outcome"])
+METRICS = [stage_duration, requests_total, llm_tokens, context_tokens, cache_events, llm_attempts, query_routes, admission_events,
+           thread_run_events]
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+# --- Spans ---
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+class Trace:
+    def __init__(self, request_id: str, kind: str):
+        self.request_id = request_id
+        self.kind = kind
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+
+    def breakdown(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage call count and total milliseconds."""
+        stages: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            entry = stages.setdefault(span.name, {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + span.duration * 1000, 2)
+        return stages
+
+    def to_dict(self) -> Dict[str, Any]:
+        origin = self.spans[0].start if self.spans else 0.0
+        return {
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "breakdown": self.breakdown(),
+            "spans": [
+                {
+                    "name": s.name, "span_id": s.span_id, "parent_id": s.parent_id,
+                    "offset_ms": round((s.start - origin) * 1000, 2), "duration_ms": round(s.duration * 1000, 2),
+                    "attributes": s.attributes,
+                }
+                for s in self.spans
+            ],
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("cbam_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("cbam_span", default=None)
+recent_traces: "OrderedDict[str, Trace]" = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Times a stage under the current span (works outside a request too; then only the histogram is fed)."""
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else None, attributes)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _reset(_current_span, token)
+        stage_duration.observe(current.duration, stage=name)
+
+
+def _reset(var: contextvars.ContextVar, token: contextvars.Token):
+    try:
+        var.reset(token)
+    except ValueError:
+        # Closed from another context (e.g. a streaming response finalised after a disconnect)
+        pass
+
+
+def set_attribute(key: str, value: Any):
+    """Annotates the innermost open span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+def record_cache(cache: str, result: str):
+    """Cache lookup outcome: counted in /metrics and noted on the current span."""
+    cache_events.inc(cache=cache, result=result)
+    set_attribute(f"{cache}_cache", result)
+
+
+@contextmanager
+def trace_request(kind: str, request_id: Optional[str] = None, **attributes) -> Iterator[Trace]:
+    """Opens the root `request` span for one API call; spans opened inside attach to it."""
+    trace = Trace(request_id or uuid.uuid4().hex[:16], kind)
+    trace_token = _current_trace.set(trace)
+    status = "ok"
+    try:
+        with span("request", kind=kind, request_id=trace.request_id, **attributes):
+            yield trace
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _reset(_current_trace, trace_token)
+        requests_total.inc(endpoint=kind, status=status)
+        with _recent_lock:
+            recent_traces[trace.request_id] = trace
+            while len(recent_traces) > TRACE_KEEP:
+                recent_traces.popitem(last=False)
+        _log(trace)
+
+
+def get_trace(request_id: str) -> Optional[Dict[str, Any]]:
+    with _recent_lock:
+        trace = recent_traces.get(request_id)
+    return trace.to_dict() if trace else None
+
+
+def _log(trace: Trace):
+    if TRACE_LOG == "off":
+        return
+    if TRACE_LOG == "json":
+        print(json.dumps(trace.to_dict(), default=str))
+        return
+    parts = [f"{name} {v['count']}x {v['total_ms']:.0f}ms" for name, v in trace.breakdown().items()]
+    print(f"Trace {trace.request_id} ({trace.kind}): " + " | ".join(parts))